@@ -0,0 +1,546 @@
+"""Micro-benchmarks for the checkpointers in checkpointer.py and the serializer in serializer.py.
+
+Run them from this directory, for example: `python benchmark.py delta --number 500`
+"""
+import argparse
+import asyncio
+import logging
+import math
+import os
+import random
+import tempfile
+import time
+import uuid
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from operator import add
+from typing import Annotated, Optional, TypedDict
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.runnables import RunnableLambda
+from pydantic import BaseModel, Field
+
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.constants import Send
+from langgraph.graph import END, MessagesState, StateGraph, START
+from langgraph.store.memory import InMemoryStore
+
+from checkpointer import BoundedMemorySaver, CoalescingSaver
+from fan_out import HedgePolicy, as_completed_until, hedged, tournament
+from search_cache import MemoryCache, SqliteCache, cached
+from serializer import CompactSerializer
+from sqlite_persistence import SqliteSaver, SqliteStore
+
+
+REPLY = "Sure! " + "Here is a reasonably long answer to your question. " * 6
+
+
+def chat_graph(checkpointer):
+    """One-node chatbot that answers every message with the same reply, so only the checkpointer is measured.
+    """
+    graph = StateGraph(MessagesState)
+    graph.add_node("assistant", lambda state: {"messages": [AIMessage(content=REPLY)]})
+    graph.add_edge(START, "assistant")
+    return graph.compile(checkpointer=checkpointer)
+
+
+def stored_bytes(saver: MemorySaver) -> int:
+    """Serialized size of every checkpoint, channel value and pending write held by a MemorySaver.
+    """
+    if isinstance(saver, BoundedMemorySaver):
+        return saver.resident_bytes
+    checkpoints = sum(
+        len(checkpoint[1]) + len(metadata[1])
+        for namespaces in saver.storage.values()
+        for checkpoints in namespaces.values()
+        for checkpoint, metadata, _ in checkpoints.values()
+    )
+    blobs = sum(len(blob[1]) for blob in saver.blobs.values())
+    writes = sum(len(write[2][1]) for writes in saver.writes.values() for write in writes.values())
+    return checkpoints + blobs + writes
+
+
+def bench_delta(number: int):
+    """Bytes and latency of a `number`-turn thread, with full snapshots versus delta-encoded messages.
+    """
+    savers = [
+        ("MemorySaver", MemorySaver()),
+        ("deltas, keyframe every 50", BoundedMemorySaver(keyframe_interval=50)),
+        ("deltas, keyframe every 10", BoundedMemorySaver(keyframe_interval=10)),
+    ]
+    config = {"configurable": {"thread_id": "1"}}
+    for name, saver in savers:
+        graph = chat_graph(saver)
+        start = time.perf_counter()
+        for i in range(number):
+            graph.invoke({"messages": [("user", f"Question number {i}?")]}, config)
+        turn = (time.perf_counter() - start) / number
+
+        start = time.perf_counter()
+        graph.get_state(config)
+        get_state = time.perf_counter() - start
+
+        start = time.perf_counter()
+        history = list(graph.get_state_history(config, limit=100))
+        get_state_history = time.perf_counter() - start
+
+        print(
+            f"{name:>26}: {stored_bytes(saver) / 1024 / 1024:8.2f} MB, {turn * 1000:6.2f} ms/turn, "
+            f"get_state {get_state * 1000:6.2f} ms, get_state_history({len(history)}) {get_state_history * 1000:8.2f} ms"
+        )
+
+
+def bench_forks(number: int, turns: int = 200):
+    """Bytes and write time of `number` what-if forks from the middle of a `turns`-turn thread.
+    """
+    savers = [
+        ("MemorySaver", MemorySaver()),
+        ("shared messages, keyframe every 50", BoundedMemorySaver(keyframe_interval=50)),
+    ]
+    config = {"configurable": {"thread_id": "1"}}
+    for name, saver in savers:
+        graph = chat_graph(saver)
+        for i in range(turns):
+            graph.invoke({"messages": [("user", f"Question number {i}?")]}, config)
+        thread_bytes = stored_bytes(saver)
+        to_fork = list(saver.list(config))[turns]
+        last = graph.get_state(to_fork.config).values["messages"][-1]
+
+        start = time.perf_counter()
+        for i in range(number):
+            graph.update_state(to_fork.config, {"messages": [HumanMessage(content=f"What if number {i}?", id=last.id)]})
+        seconds = time.perf_counter() - start
+        print(
+            f"{name:>34}: thread {thread_bytes / 1024 / 1024:7.2f} MB, {number} forks "
+            f"+{(stored_bytes(saver) - thread_bytes) / 1024 / 1024:8.2f} MB, {seconds / number * 1000:6.2f} ms/fork"
+        )
+
+
+def memory_chat_graph(checkpointer, store):
+    """The chatbot of chatbot-with-long-term-memory.ipynb, with the model replaced by a fixed reply.
+    """
+
+    def call_model(state, config, store):
+        store.get(("memory", config["configurable"]["user_id"]), "user_memory")
+        return {"messages": [AIMessage(content=REPLY)]}
+
+    def write_memory(state, config, store):
+        store.put(("memory", config["configurable"]["user_id"]), "user_memory", {"memory": state["messages"][-2].content})
+
+    graph = StateGraph(MessagesState)
+    graph.add_node("call_model", call_model)
+    graph.add_node("write_memory", write_memory)
+    graph.add_edge(START, "call_model")
+    graph.add_edge("call_model", "write_memory")
+    return graph.compile(checkpointer=checkpointer, store=store)
+
+
+def bench_persistence(number: int, turns: int = 10):
+    """Load test of `number` concurrent users chatting `turns` turns each, in memory versus in local SQLite files.
+    """
+    directory = tempfile.mkdtemp()
+    backends = [
+        ("MemorySaver + InMemoryStore", lambda: (MemorySaver(), InMemoryStore())),
+        ("SqliteSaver + SqliteStore", lambda: (
+            SqliteSaver(os.path.join(directory, "checkpoints.sqlite")),
+            SqliteStore(os.path.join(directory, "store.sqlite")),
+        )),
+    ]
+    for name, make in backends:
+        checkpointer, store = make()
+        graph = memory_chat_graph(checkpointer, store)
+
+        def chat(user: int):
+            config = {"configurable": {"thread_id": str(user), "user_id": str(user)}}
+            for i in range(turns):
+                graph.invoke({"messages": [("user", f"Fact number {i} about me.")]}, config)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            list(executor.map(chat, range(number)))
+        seconds = time.perf_counter() - start
+        commits = f", {checkpointer.commits} checkpoint commits" if isinstance(checkpointer, SqliteSaver) else ""
+        print(f"{name:>28}: {number * turns / seconds:8.1f} turns/s ({number} users x {turns} turns){commits}")
+
+
+class FanOutState(TypedDict):
+    state: Annotated[list, add]
+
+
+def fan_out_graph(checkpointer, branches: int):
+    """parallelization.py with `branches` nodes between "a" and "d" instead of "b" and "c".
+    """
+    graph = StateGraph(FanOutState)
+    graph.add_node("a", lambda state: {"state": ["I'm A"]})
+    graph.add_node("d", lambda state: {"state": ["I'm D"]})
+    for i in range(branches):
+        graph.add_node(f"b{i}", lambda state, i=i: {"state": [f"I'm B{i}"]})
+        graph.add_edge("a", f"b{i}")
+    graph.add_edge(START, "a")
+    graph.add_edge([f"b{i}" for i in range(branches)], "d")
+    graph.add_edge("d", END)
+    return graph.compile(checkpointer=checkpointer)
+
+
+def bench_coalesce(number: int, branches: int = 8):
+    """Checkpointer calls and time of `number` runs of a `branches`-wide fan-out, with and without coalesced writes.
+    """
+    directory = tempfile.mkdtemp()
+    for inner_name, make in [
+        ("MemorySaver", MemorySaver),
+        ("SqliteSaver", lambda: SqliteSaver(os.path.join(directory, f"checkpoints-{time.time_ns()}.sqlite"))),
+        # what the parallelization scripts use
+        ("SqliteSaver(:memory:)", lambda: SqliteSaver(":memory:")),
+    ]:
+        for coalesce in (False, True):
+            saver = CoalescingSaver(make(), coalesce=coalesce)
+            graph = fan_out_graph(saver, branches)
+            start = time.perf_counter()
+            for i in range(number):
+                graph.invoke({"state": []}, {"configurable": {"thread_id": str(i)}})
+            seconds = time.perf_counter() - start
+            name = f"{inner_name}, {'coalesced' if coalesce else 'per task'}"
+            print(
+                f"{name:>34}: {saver.writes_per_step:5.2f} writes/step, {saver.saver_calls / saver.steps:5.2f} calls/step, "
+                f"checkpointer {saver.checkpointer_seconds / saver.steps * 1000:6.3f} ms/step, {number / seconds:7.1f} runs/s"
+            )
+
+
+class ToDo(BaseModel):
+    """Shaped like the ToDo collection of deployment/task_maistro.py.
+    """
+    task: str
+    time_to_complete: Optional[int] = None
+    deadline: Optional[datetime] = None
+    solutions: list[str] = Field(default_factory=list)
+    status: str = "not started"
+
+
+def chat_thread(turns: int) -> list:
+    """A realistic tool-calling thread: per turn a question, a tool call, its result and an answer with provider metadata.
+    """
+    messages = []
+    for i in range(turns):
+        call_id = f"call_{uuid.uuid4().hex[:24]}"
+        usage = {"input_tokens": 120 + i, "output_tokens": 40, "total_tokens": 160 + i}
+        metadata = {"model_name": "gpt-4o-2024-08-06", "finish_reason": "tool_calls", "system_fingerprint": "fp_50cad350e4"}
+        messages += [
+            HumanMessage(content=f"Can you add {i} and {i + 1}, then tell me about it?", id=str(uuid.uuid4())),
+            AIMessage(
+                content="",
+                id=f"run-{uuid.uuid4()}-0",
+                tool_calls=[{"name": "add", "args": {"a": i, "b": i + 1}, "id": call_id, "type": "tool_call"}],
+                response_metadata=metadata,
+                usage_metadata=usage,
+            ),
+            ToolMessage(content=str(2 * i + 1), name="add", tool_call_id=call_id, id=str(uuid.uuid4())),
+            AIMessage(
+                content=REPLY,
+                id=f"run-{uuid.uuid4()}-0",
+                response_metadata={**metadata, "finish_reason": "stop"},
+                usage_metadata=usage,
+            ),
+        ]
+    return messages
+
+
+def bench_serde(number: int, turns: int = 50):
+    """Encode/decode throughput and payload size of JsonPlusSerializer versus CompactSerializer, `number` times each.
+    """
+    now = datetime.now(timezone.utc)
+    payloads = [
+        (f"{turns}-turn thread", chat_thread(turns)),
+        ("20 ToDos", [ToDo(task=f"Task {i}", time_to_complete=30, deadline=now + timedelta(days=i), solutions=["call", "email"]) for i in range(20)]),
+    ]
+    serializers = [("JsonPlusSerializer", JsonPlusSerializer()), ("CompactSerializer", CompactSerializer())]
+    for payload_name, payload in payloads:
+        for name, serde in serializers:
+            start = time.perf_counter()
+            for _ in range(number):
+                typed = serde.dumps_typed(payload)
+            encode = (time.perf_counter() - start) / number
+
+            start = time.perf_counter()
+            for _ in range(number):
+                decoded = serde.loads_typed(typed)
+            decode = (time.perf_counter() - start) / number
+            assert decoded == payload
+
+            print(
+                f"{payload_name:>16}, {name:>18}: {len(typed[1]):8} bytes, "
+                f"encode {len(payload) / encode:9.0f} objects/s, decode {len(payload) / decode:9.0f} objects/s"
+            )
+
+
+class FakeLLM:
+    """Stands in for `llm.with_structured_output(...)`: answers every prompt with `answer(prompt)` after `latency` seconds.
+
+    Every `straggler_every`-th call takes `straggler_latency` seconds instead, like the slow tail of
+    a real API. `calls` and `peak` count the calls made and the most that were in flight at once.
+    """
+
+    def __init__(self, answer, latency: float, straggler_every: int = 0, straggler_latency: float = 0.0):
+        self.answer = answer
+        self.latency = latency
+        self.straggler_every = straggler_every
+        self.straggler_latency = straggler_latency
+        self.calls = 0
+        self.in_flight = 0
+        self.peak = 0
+
+    def _enter(self) -> float:
+        self.calls += 1
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        if self.straggler_every and self.calls % self.straggler_every == 0:
+            return self.straggler_latency
+        return self.latency
+
+    def _call(self, prompt):
+        time.sleep(self._enter())
+        self.in_flight -= 1
+        return self.answer(prompt)
+
+    async def _acall(self, prompt):
+        try:
+            await asyncio.sleep(self._enter())
+        finally:
+            self.in_flight -= 1
+        return self.answer(prompt)
+
+    def runnable(self) -> RunnableLambda:
+        return RunnableLambda(self._call, afunc=self._acall)
+
+
+class JokesState(TypedDict):
+    topic: str
+    subjects: list
+    jokes: Annotated[list, add]
+    best_selected_joke: str
+
+
+def send_jokes_graph(joke_llm, best_joke_llm):
+    """The map-reduce of map-reduce.py, one generate_joke send per subject and a best_joke over all jokes.
+    """
+
+    def generate_joke(state):
+        return {"jokes": [joke_llm.invoke(f"Generate a joke about {state['subject']}")["joke"]]}
+
+    def best_joke(state):
+        response = best_joke_llm.invoke("\n\n".join(state["jokes"]))
+        return {"best_selected_joke": state["jokes"][response["id"]]}
+
+    graph = StateGraph(JokesState)
+    graph.add_node("generate_joke", generate_joke)
+    graph.add_node("best_joke", best_joke)
+    graph.add_conditional_edges(START, lambda state: [Send("generate_joke", {"subject": s}) for s in state["subjects"]], ["generate_joke"])
+    graph.add_edge("generate_joke", "best_joke")
+    graph.add_edge("best_joke", END)
+    return graph.compile()
+
+
+def batched_jokes_graph(joke_llm, best_joke_llm, max_concurrency: int, best_of: int, quorum: float = 1.0):
+    """The batched mode of map-reduce.py: bounded joke calls, a best_joke tournament while they arrive, and a quorum.
+    """
+
+    async def generate_and_select_jokes(state):
+        prompts = [f"Generate a joke about {s}" for s in state["subjects"]]
+        jokes = []
+
+        async def generated():
+            calls = [partial(joke_llm.ainvoke, prompt) for prompt in prompts]
+            async for _, response in as_completed_until(calls, quorum=math.ceil(quorum * len(calls)), max_concurrency=max_concurrency):
+                jokes.append(response["joke"])
+                yield response["joke"]
+
+        async def pick_best(group):
+            return group[(await best_joke_llm.ainvoke("\n\n".join(group)))["id"]]
+
+        best = await tournament(generated(), pick_best, group_size=best_of, max_concurrency=max_concurrency)
+        return {"jokes": jokes, "best_selected_joke": best}
+
+    graph = StateGraph(JokesState)
+    graph.add_node("generate_and_select_jokes", generate_and_select_jokes)
+    graph.add_edge(START, "generate_and_select_jokes")
+    graph.add_edge("generate_and_select_jokes", END)
+    return graph.compile()
+
+
+def bench_map_reduce(number: int, latency: float = 0.05, max_concurrency: int = 16, best_of: int = 10):
+    """Wall time and model calls of map-reduce.py's joke map-reduce over `number` subjects, against a fake model with `latency` seconds per call.
+
+    One joke call in 100 is a straggler that takes 40 times as long.
+    """
+    state = {"topic": "animals", "subjects": [f"animal number {i}" for i in range(number)]}
+    modes = [
+        ("Send per subject", lambda joke_llm, best_llm: send_jokes_graph(joke_llm, best_llm).invoke(state)),
+        (f"Send, max_concurrency={max_concurrency}", lambda joke_llm, best_llm: (
+            send_jokes_graph(joke_llm, best_llm).invoke(state, {"max_concurrency": max_concurrency})
+        )),
+        (f"batched + best of {best_of}", lambda joke_llm, best_llm: asyncio.run(
+            batched_jokes_graph(joke_llm, best_llm, max_concurrency, best_of).ainvoke(state)
+        )),
+        (f"batched + best of {best_of}, 98%", lambda joke_llm, best_llm: asyncio.run(
+            batched_jokes_graph(joke_llm, best_llm, max_concurrency, best_of, quorum=0.98).ainvoke(state)
+        )),
+    ]
+    for name, run in modes:
+        group_sizes = []
+
+        def pick_first(prompt):
+            group_sizes.append(prompt.count("\n\n") + 1)
+            return {"id": 0}
+
+        joke_llm = FakeLLM(lambda prompt: {"joke": f"{prompt}? No thanks."}, latency, straggler_every=100, straggler_latency=40 * latency)
+        best_joke_llm = FakeLLM(pick_first, latency)
+        start = time.perf_counter()
+        result = run(joke_llm.runnable(), best_joke_llm.runnable())
+        seconds = time.perf_counter() - start
+        assert result["best_selected_joke"]
+        print(
+            f"{name:>32}: {seconds:6.2f} s, {len(result['jokes'])} jokes from {joke_llm.calls} calls (at most {joke_llm.peak} at once), "
+            f"{best_joke_llm.calls} best_joke calls (at most {max(group_sizes)} jokes each)"
+        )
+
+
+class StubRetriever:
+    """Stands in for the Tavily and Wikipedia searches of real-case-parallelization.py, with a configurable latency distribution.
+
+    A call takes a log-normal time around `median` seconds (spread `sigma`), and with probability
+    `tail` it is `tail_factor` times slower, like a request that hits a slow replica. Used as a node,
+    it returns `{"context": [...]}` like the real searches. `calls` counts the calls made.
+    """
+
+    def __init__(self, name: str, median: float, sigma: float = 0.3, tail: float = 0.05, tail_factor: float = 20.0, seed: int = 0):
+        self.name = name
+        self.median = median
+        self.sigma = sigma
+        self.tail = tail
+        self.tail_factor = tail_factor
+        self.random = random.Random(seed)
+        self.calls = 0
+
+    def latency(self) -> float:
+        latency = self.random.lognormvariate(math.log(self.median), self.sigma)
+        return latency * self.tail_factor if self.random.random() < self.tail else latency
+
+    def search(self, query: str) -> list[str]:
+        self.calls += 1
+        time.sleep(self.latency())
+        return [f'<Document source="{self.name}"/>\nAbout {query}\n</Document>']
+
+    def __call__(self, state):
+        return {"context": self.search(state["question"])}
+
+
+class SearchState(TypedDict):
+    question: str
+    answer: str
+    context: Annotated[list, add]
+
+
+def search_graph(search_web, search_wikipedia):
+    """The graph of real-case-parallelization.py with the given search nodes and an answer that only counts the context.
+    """
+    graph = StateGraph(SearchState)
+    graph.add_node("search_web", search_web)
+    graph.add_node("search_wikipedia", search_wikipedia)
+    graph.add_node("generate_answer", lambda state: {"answer": f"{len(state['context'])} sources"})
+    graph.add_edge(START, "search_wikipedia")
+    graph.add_edge(START, "search_web")
+    graph.add_edge("search_wikipedia", "generate_answer")
+    graph.add_edge("search_web", "generate_answer")
+    graph.add_edge("generate_answer", END)
+    return graph.compile()
+
+
+def bench_hedging(number: int, median: float = 0.02, timeout: float = 0.25, hedge_after: float = 0.05):
+    """Latency percentiles of `number` questions through real-case-parallelization.py's two searches, without a policy, with a timeout, and hedged.
+
+    The stub searches take about `median` seconds and 5% of their calls are 20 times slower.
+    """
+    policies = [
+        ("no policy", None),
+        (f"timeout {timeout}s", HedgePolicy(timeout=timeout, hedge_quantile=None)),
+        ("timeout + hedge at p95", HedgePolicy(timeout=timeout, hedge_after=hedge_after)),
+    ]
+    # the timeouts are counted below instead of logged one by one
+    logging.getLogger("fan_out").setLevel(logging.ERROR)
+    for name, policy in policies:
+        web = StubRetriever("web", median, seed=1)
+        wikipedia = StubRetriever("wikipedia", 2 * median, seed=2)
+        nodes = [web, wikipedia] if policy is None else [hedged(web, policy), hedged(wikipedia, policy)]
+        graph = search_graph(*nodes)
+        seconds = []
+        complete = 0
+        for i in range(number):
+            start = time.perf_counter()
+            result = graph.invoke({"question": f"question {i}"})
+            seconds.append(time.perf_counter() - start)
+            complete += len(result["context"]) == 2
+        seconds.sort()
+        p50, p95, p99 = (1000 * seconds[int(q * (len(seconds) - 1))] for q in (0.5, 0.95, 0.99))
+        counts = "" if policy is None else (
+            f", {sum(node.hedges for node in nodes)} hedges ({sum(node.hedge_wins for node in nodes)} won), "
+            f"{sum(node.timeouts for node in nodes)} timeouts"
+        )
+        print(
+            f"{name:>24}: p50 {p50:6.1f} ms, p95 {p95:6.1f} ms, p99 {p99:6.1f} ms, "
+            f"{web.calls + wikipedia.calls} search calls, {complete / number:.0%} with both sources{counts}"
+        )
+
+
+def bench_search_cache(number: int, topics: int = 200, median: float = 0.005):
+    """Search calls and wall time of `number` questions through real-case-parallelization.py's searches, uncached and cached in memory or on disk.
+
+    Questions are about `topics` topics, popular ones asked more often (Zipf-like), and are
+    written with varying case and punctuation.
+    """
+    rng = random.Random(0)
+    weights = [1 / (rank + 1) for rank in range(topics)]
+    asked = rng.choices(range(topics), weights, k=number)
+    spellings = ["Who is topic {}?", "who is topic {}", "WHO IS  TOPIC {} ?!"]
+    questions = [rng.choice(spellings).format(topic) for topic in asked]
+    with tempfile.TemporaryDirectory() as tmp:
+        caches = [
+            ("no cache", None),
+            ("MemoryCache", MemoryCache(maxsize=topics // 2, ttl=3600)),
+            ("SqliteCache", SqliteCache(os.path.join(tmp, "search_cache.sqlite"), maxsize=topics // 2, ttl=3600)),
+        ]
+        for name, cache in caches:
+            web = StubRetriever("web", median, tail=0.0, seed=1)
+            wikipedia = StubRetriever("wikipedia", 2 * median, tail=0.0, seed=2)
+            nodes = [web, wikipedia] if cache is None else [
+                cached(web, cache, namespace="web"), cached(wikipedia, cache, namespace="wikipedia"),
+            ]
+            graph = search_graph(*nodes)
+            start = time.perf_counter()
+            for question in questions:
+                assert graph.invoke({"question": question})["answer"] == "2 sources"
+            seconds = time.perf_counter() - start
+            stats = "" if cache is None else f", hit rate {cache.hit_rate:.0%}, {cache.evictions} evictions"
+            print(f"{name:>12}: {seconds:6.2f} s, {web.calls + wikipedia.calls} search calls{stats}")
+            if isinstance(cache, SqliteCache):
+                cache.close()
+
+
+BENCHMARKS = {
+    "delta": bench_delta,
+    "forks": bench_forks,
+    "persistence": bench_persistence,
+    "coalesce": bench_coalesce,
+    "map-reduce": bench_map_reduce,
+    "serde": bench_serde,
+    "hedging": bench_hedging,
+    "search-cache": bench_search_cache,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("benchmark", choices=BENCHMARKS)
+    parser.add_argument("--number", type=int, default=500)
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args.number)
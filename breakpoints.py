@@ -6,10 +6,11 @@ from dotenv import find_dotenv, load_dotenv
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_openai import ChatOpenAI
 
-from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import MessagesState, StateGraph, START
 from langgraph.prebuilt import ToolNode, tools_condition
 
+from checkpointer import BoundedMemorySaver
+
 
 _ = load_dotenv(find_dotenv())
 openai.api_key = os.environ['OPENAI_API_KEY']
@@ -53,7 +54,8 @@ graph.add_conditional_edges(
 )
 graph.add_edge("tools", "assistant")
 
-memory = MemorySaver()
+# a thread waiting for approval may be idle for a while, so evicted threads are kept on disk
+memory = BoundedMemorySaver(max_checkpoints_per_thread=20, max_bytes=64 * 1024 * 1024, spill_dir="checkpoints")
 graph = graph.compile(interrupt_before=["tools"], checkpointer=memory)
 
 thread = {"configurable": {"thread_id": "4"}}
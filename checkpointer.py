@@ -0,0 +1,904 @@
+import atexit
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import time
+import weakref
+
+from collections import OrderedDict, defaultdict
+from typing import Any, AsyncIterator, Iterator, Mapping, NamedTuple, Optional, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+)
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.constants import INPUT, INTERRUPT, TASKS
+
+
+logger = logging.getLogger(__name__)
+
+# type tag of blobs that store a message list as references to the shared message table
+MESSAGES = "messages"
+# rebuilt fingerprint lists kept around for encoding the next delta and for walking history
+FINGERPRINT_CACHE_SIZE = 256
+
+
+def _is_message_list(value: Any) -> bool:
+    return isinstance(value, list) and all(isinstance(getattr(m, "id", None), str) for m in value)
+
+
+def _fingerprint(payload: tuple[str, bytes]) -> bytes:
+    """Content address of a serialized message: every field counts, so a message replaced under the same id with any change gets a new one.
+    """
+    return hashlib.sha256(payload[0].encode() + b"\0" + payload[1]).digest()
+
+
+class CheckpointHeader(NamedTuple):
+    """What a checkpoint is, without its state values: pass `config` to `graph.get_state` or `graph.update_state` to load or fork it.
+    """
+    config: RunnableConfig
+    parent_config: Optional[RunnableConfig]
+    step: int
+    source: str
+    # nodes whose writes made this checkpoint
+    writes: tuple[str, ...]
+    # nodes that run next from this checkpoint
+    next: tuple[str, ...]
+
+
+class BoundedMemorySaver(MemorySaver):
+    """MemorySaver that keeps its memory bounded, for long-running processes with many threads.
+
+    `max_checkpoints_per_thread` keeps only the latest checkpoints of every thread (and checkpoint
+    namespace); older ones, their pending writes and the channel values nothing else uses are dropped.
+    `max_bytes` caps the serialized size of everything held in memory: once it is exceeded, the least
+    recently used threads are evicted. With `spill_dir`, evicted threads are written to disk and loaded
+    back the next time they are used, otherwise they are forgotten. Spilled threads are part of the
+    saver's memory, so their files are removed when the process exits, and files an earlier process
+    left behind (after a crash) are removed when the saver is created: `spill_dir` can't be shared.
+
+    With `keyframe_interval`, message lists (such as the `messages` channel of MessagesState) are stored
+    as deltas: which runs of the previous version's messages are kept, and the messages that are new.
+    Every `keyframe_interval` versions the full list is stored instead, so rebuilding a version never
+    replays more than that many deltas. Deltas and keyframes only reference messages: every message
+    is serialized once into a table addressed by its content and shared by every version, fork and
+    thread that holds it, so forking a checkpoint with `update_state` copies no unchanged message.
+    Values are rebuilt when a checkpoint is read, and decoded messages are cached.
+
+    `resident_threads`, `resident_checkpoints` and `resident_bytes` tell how much is held in memory, and
+    `resident_messages` how many messages the table holds, and `pruned_checkpoints`, `evictions`,
+    `spills`, `restores`, `keyframes` and `deltas` count what was done to keep it that way.
+
+        memory = BoundedMemorySaver(max_checkpoints_per_thread=20, max_bytes=256 * 1024 * 1024, spill_dir="checkpoints")
+        memory = BoundedMemorySaver(keyframe_interval=50)
+        graph = builder.compile(checkpointer=memory)
+
+    `headers` lists a thread's checkpoints from an index kept in memory, filtered by step and by the
+    node that wrote them, without decoding any state (see `state_history`).
+
+    Listing checkpoints without a thread (`list(None)`) only covers the threads that are in memory.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_checkpoints_per_thread: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        spill_dir: Optional[str] = None,
+        keyframe_interval: Optional[int] = None,
+        decoded_cache_size: int = 10_000,
+        **kwargs: Any,
+    ) -> None:
+        # the parent of the latest checkpoint holds the pending sends of the next step, so it has to stay
+        if max_checkpoints_per_thread is not None and max_checkpoints_per_thread < 2:
+            raise ValueError("max_checkpoints_per_thread must be at least 2")
+        if keyframe_interval is not None and keyframe_interval < 1:
+            raise ValueError("keyframe_interval must be at least 1")
+        super().__init__(**kwargs)
+        self.max_checkpoints_per_thread = max_checkpoints_per_thread
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.keyframe_interval = keyframe_interval
+        self.decoded_cache_size = decoded_cache_size
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+            stale = [name for name in os.listdir(spill_dir) if name.endswith(".pkl")]
+            for name in stale:
+                os.remove(os.path.join(spill_dir, name))
+            if stale:
+                logger.info("removed %d spilled threads an earlier process left in %s", len(stale), spill_dir)
+            atexit.register(_remove_spills, weakref.ref(self))
+        # thread -> resident bytes, least recently used first
+        self._threads: OrderedDict[str, int] = OrderedDict()
+        # (thread, ns, checkpoint id) -> channel versions of the checkpoint
+        self._versions: dict[tuple[str, str, str], ChannelVersions] = {}
+        # (thread, ns) -> checkpoint id -> (step, source, writes, parent id), oldest first
+        self._headers: dict[tuple[str, str], dict[str, tuple]] = {}
+        # (thread, ns) -> (id, versions_seen) of the latest checkpoint put, the parent of the next one
+        self._seen: dict[tuple[str, str], tuple[str, dict]] = {}
+        # thread -> keys of its blobs / writes
+        self._blob_keys: defaultdict[str, set] = defaultdict(set)
+        self._write_keys: defaultdict[str, set] = defaultdict(set)
+        self._spilled: set[str] = set()
+        # fingerprint -> [serialized message, number of blobs that reference it]
+        self._messages: dict[bytes, list] = {}
+        # blob key -> fingerprints of the message list, least recently used first
+        self._fingerprints: OrderedDict[tuple, tuple] = OrderedDict()
+        # fingerprint -> decoded message, least recently used first
+        self._decoded: OrderedDict[bytes, Any] = OrderedDict()
+        # id(message) -> (message, fingerprint) of the message objects seen last, least recently used first
+        self._addresses: OrderedDict[int, tuple[Any, bytes]] = OrderedDict()
+        self._lock = threading.RLock()
+        self.resident_bytes = 0
+        self.pruned_checkpoints = 0
+        self.evictions = 0
+        self.spills = 0
+        self.restores = 0
+        self.keyframes = 0
+        self.deltas = 0
+
+    @property
+    def resident_threads(self) -> int:
+        return len(self._threads)
+
+    @property
+    def resident_checkpoints(self) -> int:
+        with self._lock:
+            return sum(len(checkpoints) for thread_id in self._threads for checkpoints in self.storage[thread_id].values())
+
+    @property
+    def resident_messages(self) -> int:
+        return len(self._messages)
+
+    @staticmethod
+    def _blob_size(blob: tuple) -> int:
+        # message list blobs hold one reference per message or run
+        return len(blob[1]) + (32 * len(blob[2][0]) if len(blob) > 2 else 0)
+
+    def _reference(self, blob: tuple, payloads: Mapping[bytes, tuple]) -> None:
+        """Count the messages a message list blob references, adding those the table doesn't have from `payloads`.
+        """
+        for op in blob[2][0]:
+            if isinstance(op, bytes):
+                if op not in self._messages:
+                    self._messages[op] = [payloads[op], 0]
+                    self.resident_bytes += len(payloads[op][1])
+                self._messages[op][1] += 1
+
+    def _release(self, blob: tuple) -> dict[bytes, tuple]:
+        """Drop the references of a blob that is removed, and the messages nothing references anymore.
+
+        Returns the serialized messages it referenced, to spill them along with the blob.
+        """
+        payloads = {}
+        if len(blob) < 3:
+            return payloads
+        for op in blob[2][0]:
+            if isinstance(op, bytes):
+                entry = self._messages[op]
+                payloads[op] = entry[0]
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._messages[op]
+                    self.resident_bytes -= len(entry[0][1])
+        return payloads
+
+    def _spill_path(self, thread_id: str) -> str:
+        return os.path.join(self.spill_dir, hashlib.sha256(str(thread_id).encode()).hexdigest() + ".pkl")
+
+    def _use(self, thread_id: str) -> None:
+        """Mark a thread as the most recently used, loading it back from disk if it was spilled.
+        """
+        if thread_id in self._threads:
+            self._threads.move_to_end(thread_id)
+        elif thread_id in self._spilled:
+            self._restore(thread_id)
+            # reading a spilled thread brings it back in memory, which may push others out
+            self._enforce_max_bytes(thread_id)
+
+    def _add_bytes(self, thread_id: str, size: int) -> None:
+        self._threads[thread_id] = self._threads.get(thread_id, 0) + size
+        self._threads.move_to_end(thread_id)
+        self.resident_bytes += size
+
+    def _restore(self, thread_id: str) -> None:
+        path = self._spill_path(thread_id)
+        with open(path, "rb") as f:
+            spilled = pickle.load(f)
+        os.remove(path)
+        self._spilled.discard(thread_id)
+        self.storage[thread_id].update(spilled["storage"])
+        self.writes.update(spilled["writes"])
+        self.blobs.update(spilled["blobs"])
+        for blob in spilled["blobs"].values():
+            if len(blob) > 2:
+                self._reference(blob, spilled["messages"])
+        self._versions.update(spilled["versions"])
+        self._headers.update(spilled["headers"])
+        self._write_keys[thread_id] = set(spilled["writes"])
+        self._blob_keys[thread_id] = set(spilled["blobs"])
+        self._add_bytes(thread_id, spilled["bytes"])
+        self.restores += 1
+        logger.debug("restored thread %s from %s", thread_id, path)
+
+    def _evict(self, thread_id: str) -> None:
+        size = self._threads.pop(thread_id)
+        self.resident_bytes -= size
+        storage = self.storage.pop(thread_id, {})
+        writes = {k: self.writes.pop(k) for k in self._write_keys.pop(thread_id, ()) if k in self.writes}
+        blobs = {k: self.blobs.pop(k) for k in self._blob_keys.pop(thread_id, ()) if k in self.blobs}
+        messages = {}
+        for blob in blobs.values():
+            messages.update(self._release(blob))
+        versions = {k: self._versions.pop(k) for k in [k for k in self._versions if k[0] == thread_id]}
+        headers = {k: self._headers.pop(k) for k in [k for k in self._headers if k[0] == thread_id]}
+        self.evictions += 1
+        if self.spill_dir:
+            with open(self._spill_path(thread_id), "wb") as f:
+                pickle.dump({"storage": dict(storage), "writes": writes, "blobs": blobs, "versions": versions, "headers": headers, "messages": messages, "bytes": size}, f)
+            self._spilled.add(thread_id)
+            self.spills += 1
+        logger.debug("evicted thread %s (%d bytes)", thread_id, size)
+
+    def _enforce_max_bytes(self, thread_id: str) -> None:
+        """Evict least recently used threads until under `max_bytes`, never the thread that is being written.
+        """
+        if self.max_bytes is None:
+            return
+        while self.resident_bytes > self.max_bytes and len(self._threads) > 1:
+            lru = next(iter(self._threads))
+            if lru == thread_id:
+                self._threads.move_to_end(thread_id)
+                lru = next(iter(self._threads))
+            self._evict(lru)
+
+    def _prune(self, thread_id: str, checkpoint_ns: str) -> None:
+        """Drop the oldest checkpoints of a thread over `max_checkpoints_per_thread`, with the blobs only they used.
+        """
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        if self.max_checkpoints_per_thread is None or len(checkpoints) <= self.max_checkpoints_per_thread:
+            return
+        freed = 0
+        # checkpoint ids sort by time
+        for checkpoint_id in sorted(checkpoints)[: len(checkpoints) - self.max_checkpoints_per_thread]:
+            checkpoint, metadata, _ = checkpoints.pop(checkpoint_id)
+            freed += len(checkpoint[1]) + len(metadata[1])
+            key = (thread_id, checkpoint_ns, checkpoint_id)
+            self._versions.pop(key, None)
+            self._headers[(thread_id, checkpoint_ns)].pop(checkpoint_id, None)
+            if key in self._write_keys[thread_id]:
+                self._write_keys[thread_id].discard(key)
+                freed += sum(len(w[2][1]) for w in self.writes.pop(key, {}).values())
+            self.pruned_checkpoints += 1
+
+        used = set()
+        for checkpoint_id in checkpoints:
+            for channel, version in self._versions.get((thread_id, checkpoint_ns, checkpoint_id), {}).items():
+                # a delta also needs the versions it was encoded against, back to the keyframe
+                while version is not None and (channel, version) not in used:
+                    used.add((channel, version))
+                    blob = self.blobs.get((thread_id, checkpoint_ns, channel, version), ())
+                    version = blob[2][2] if len(blob) > 2 else None
+        for key in [k for k in self._blob_keys[thread_id] if k[1] == checkpoint_ns and (k[2], k[3]) not in used]:
+            self._blob_keys[thread_id].discard(key)
+            blob = self.blobs.pop(key)
+            self._release(blob)
+            freed += self._blob_size(blob)
+        self._add_bytes(thread_id, -freed)
+
+    def _address(self, message: Any, payloads: dict[bytes, tuple]) -> bytes:
+        """Fingerprint of a message, serializing it only if this message object wasn't fingerprinted before.
+
+        Messages in a thread's state are the same objects from step to step, and messages decoded
+        from the table are registered here too, so a long thread only serializes its new messages.
+        The cache holds the messages themselves, so an id is never reused while it is cached.
+        """
+        cached = self._addresses.get(id(message))
+        if cached is not None and cached[0] is message:
+            self._addresses.move_to_end(id(message))
+            return cached[1]
+        payload = self.serde.dumps_typed(message)
+        fingerprint = _fingerprint(payload)
+        payloads[fingerprint] = payload
+        self._cache(self._addresses, id(message), (message, fingerprint), self.decoded_cache_size)
+        return fingerprint
+
+    def _encode(self, key: tuple, base_key: tuple, value: list) -> tuple:
+        """Blob of a message list: a delta of the blob at `base_key` when there is one to build on, otherwise a keyframe.
+        """
+        payloads: dict[bytes, tuple] = {}
+        fingerprints = tuple(self._address(m, payloads) for m in value)
+        base = self.blobs.get(base_key, ())
+        if len(base) < 3 or base[2][1] + 1 >= self.keyframe_interval:
+            ops, depth, base_version = fingerprints, 0, None
+            self.keyframes += 1
+        else:
+            # keep runs of the base version's messages as (start, stop) and reference the others
+            index = {f: i for i, f in enumerate(self._resolve(base_key))}
+            runs: list = []
+            for f in fingerprints:
+                i = index.get(f)
+                if i is None:
+                    runs.append(f)
+                elif runs and isinstance(runs[-1], list) and runs[-1][1] == i:
+                    runs[-1][1] = i + 1
+                else:
+                    runs.append([i, i + 1])
+            ops = tuple(tuple(op) if isinstance(op, list) else op for op in runs)
+            depth, base_version = base[2][1] + 1, base_key[3]
+            self.deltas += 1
+
+        blob = (MESSAGES, b"", (ops, depth, base_version))
+        # messages the table doesn't hold yet are stored, serialized again only if their fingerprint was cached
+        for f, m in zip(fingerprints, value):
+            if f not in self._messages and f not in payloads:
+                payloads[f] = self.serde.dumps_typed(m)
+        self._reference(blob, payloads)
+        self._cache(self._fingerprints, key, fingerprints, FINGERPRINT_CACHE_SIZE)
+        return blob
+
+    @staticmethod
+    def _cache(cache: OrderedDict, key: Any, value: Any, maxsize: int) -> None:
+        cache[key] = value
+        while len(cache) > maxsize:
+            cache.popitem(last=False)
+
+    def _resolve(self, key: tuple) -> tuple:
+        """Fingerprints of the message list stored at `key`, replaying deltas from the keyframe.
+        """
+        if key in self._fingerprints:
+            self._fingerprints.move_to_end(key)
+            return self._fingerprints[key]
+        ops, _, base_version = self.blobs[key][2]
+        if base_version is None:
+            fingerprints = ops
+        else:
+            base = self._resolve((*key[:3], base_version))
+            resolved = []
+            for op in ops:
+                if isinstance(op, tuple):
+                    resolved.extend(base[op[0]:op[1]])
+                else:
+                    resolved.append(op)
+            fingerprints = tuple(resolved)
+        self._cache(self._fingerprints, key, fingerprints, FINGERPRINT_CACHE_SIZE)
+        return fingerprints
+
+    def _message(self, fingerprint: bytes) -> Any:
+        if fingerprint in self._decoded:
+            self._decoded.move_to_end(fingerprint)
+            return self._decoded[fingerprint]
+        message = self.serde.loads_typed(self._messages[fingerprint][0])
+        self._cache(self._decoded, fingerprint, message, self.decoded_cache_size)
+        # the next checkpoint of the thread holds this very object, which then needn't be serialized again
+        self._cache(self._addresses, id(message), (message, fingerprint), self.decoded_cache_size)
+        return message
+
+    def _decode(self, key: tuple) -> Any:
+        blob = self.blobs[key]
+        if blob[0] != MESSAGES:
+            return self.serde.loads_typed(blob)
+        return [self._message(f) for f in self._resolve(key)]
+
+    def _load_blobs(self, thread_id: str, checkpoint_ns: str, versions: ChannelVersions) -> dict[str, Any]:
+        channel_values = {}
+        for k, v in versions.items():
+            key = (thread_id, checkpoint_ns, k, v)
+            if key in self.blobs and self.blobs[key][0] != "empty":
+                channel_values[k] = self._decode(key)
+        return channel_values
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        with self._lock:
+            self._use(config["configurable"]["thread_id"])
+            return super().get_tuple(config)
+
+    def list(self, config: Optional[RunnableConfig], **kwargs: Any) -> Iterator[CheckpointTuple]:
+        with self._lock:
+            if config:
+                self._use(config["configurable"]["thread_id"])
+            checkpoints = list(super().list(config, **kwargs))
+        yield from checkpoints
+
+    def headers(
+        self,
+        config: RunnableConfig,
+        *,
+        steps: Optional[range] = None,
+        node: Optional[str] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+        triggers: Optional[Mapping[str, Sequence[str]]] = None,
+    ) -> Iterator[CheckpointHeader]:
+        """Headers of a thread's checkpoints, newest first, with only those in `steps` and written by `node`.
+
+        Page through them with `before` and `limit` as with `list`. `next` needs the channels that
+        trigger each node of the graph (`triggers`); without them it is left empty.
+        """
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        before_id = get_checkpoint_id(before) if before else None
+        with self._lock:
+            self._use(thread_id)
+            index = list(self._headers.get((thread_id, checkpoint_ns), {}).items())
+
+        def checkpoint_config(checkpoint_id: str) -> RunnableConfig:
+            return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}}
+
+        for checkpoint_id, (step, source, writes, parent_id) in reversed(index):
+            if before_id and checkpoint_id >= before_id:
+                continue
+            if steps is not None and step not in steps:
+                continue
+            if node is not None and node not in writes:
+                continue
+            if limit is not None:
+                if limit <= 0:
+                    return
+                limit -= 1
+            yield CheckpointHeader(
+                config=checkpoint_config(checkpoint_id),
+                parent_config=checkpoint_config(parent_id) if parent_id else None,
+                step=step,
+                source=source,
+                writes=writes,
+                next=self._next_nodes(thread_id, checkpoint_ns, checkpoint_id, triggers) if triggers else (),
+            )
+
+    def _next_nodes(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str, triggers: Mapping[str, Sequence[str]]) -> tuple[str, ...]:
+        """Nodes that run next from a checkpoint, as LangGraph picks them: one per pending `Send`, then
+        those with a trigger channel that holds a value they haven't seen.
+
+        Only the checkpoint itself and its sends are decoded, not the channel values.
+        """
+        with self._lock:
+            self._use(thread_id)
+            saved = self.storage[thread_id][checkpoint_ns].get(checkpoint_id)
+            if saved is None:
+                return ()
+            checkpoint = self.serde.loads_typed(saved[0])
+            sends = self._sends(thread_id, checkpoint_ns, checkpoint_id, checkpoint.get("v", 1))
+            versions = checkpoint["channel_versions"]
+            available = {
+                channel
+                for channel, version in versions.items()
+                if self.blobs.get((thread_id, checkpoint_ns, channel, version), ("empty",))[0] != "empty"
+            }
+        null_version = type(next(iter(versions.values()), ""))()
+        return sends + tuple(
+            name
+            for name, channels in triggers.items()
+            if any(
+                channel in available and versions[channel] > checkpoint["versions_seen"].get(name, {}).get(channel, null_version)
+                for channel in channels
+            )
+        )
+
+    def _sends(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str, v: int) -> tuple[str, ...]:
+        """Nodes of the `Send`s pending on a checkpoint, which run as PUSH tasks in its step.
+
+        Before checkpoint format `v` 4 they are the TASKS writes saved on the parent checkpoint,
+        from then on the value of the checkpoint's TASKS channel.
+        """
+        if v >= 4:
+            version = self._versions.get((thread_id, checkpoint_ns, checkpoint_id), {}).get(TASKS)
+            key = (thread_id, checkpoint_ns, TASKS, version)
+            packets = self._decode(key) if version is not None and self.blobs.get(key, ("empty",))[0] != "empty" else []
+        else:
+            header = self._headers.get((thread_id, checkpoint_ns), {}).get(checkpoint_id)
+            writes = self.writes.get((thread_id, checkpoint_ns, header[3]), {}) if header and header[3] else {}
+            packets = [self.serde.loads_typed(w[2]) for _, w in sorted(writes.items(), key=lambda item: (item[1][3], *item[0])) if w[1] == TASKS]
+        return tuple(packet.node for packet in packets)
+
+    def _writers(self, thread_id: str, checkpoint_ns: str, parent_id: Optional[str], checkpoint: Checkpoint, metadata: CheckpointMetadata) -> tuple[str, ...]:
+        """Nodes whose writes made `checkpoint`: the `Send`s pending on its parent, and the nodes whose
+        seen channel versions changed since the parent, as they do for every node a step runs.
+
+        An update's `as_node` only shows in the metadata older LangGraph versions save with it.
+        """
+        latest = self._seen.get((thread_id, checkpoint_ns))
+        if parent_id is None:
+            parent_seen: dict = {}
+        elif latest is not None and latest[0] == parent_id:
+            parent_seen = latest[1]
+        else:
+            saved = self.storage[thread_id][checkpoint_ns].get(parent_id)
+            parent_seen = self.serde.loads_typed(saved[0])["versions_seen"] if saved else {}
+        seen = {name: dict(versions) for name, versions in checkpoint["versions_seen"].items()}
+        self._seen[(thread_id, checkpoint_ns)] = (checkpoint["id"], seen)
+
+        writers = list(self._sends(thread_id, checkpoint_ns, parent_id, checkpoint.get("v", 1))) if parent_id else []
+        writers.extend(name for name, versions in seen.items() if name not in (INPUT, INTERRUPT) and versions != parent_seen.get(name))
+        if metadata.get("source") == "update":
+            writers.extend(metadata.get("writes") or ())
+        return tuple(dict.fromkeys(writers))
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        with self._lock:
+            self._use(thread_id)
+            encoded = {}
+            if self.keyframe_interval:
+                values = checkpoint["channel_values"]
+                parent_versions = self._versions.get((thread_id, checkpoint_ns, config["configurable"].get("checkpoint_id")), {})
+                for channel in new_versions:
+                    if channel in values and _is_message_list(values[channel]):
+                        base_key = (thread_id, checkpoint_ns, channel, parent_versions.get(channel))
+                        key = (thread_id, checkpoint_ns, channel, new_versions[channel])
+                        encoded[channel] = self._encode(key, base_key, values[channel])
+                # the parent would store these channels in full, so it only gets the others
+                checkpoint = {**checkpoint, "channel_values": {k: v for k, v in values.items() if k not in encoded}}
+
+            next_config = super().put(config, checkpoint, metadata, new_versions)
+            for channel, blob in encoded.items():
+                self.blobs[(thread_id, checkpoint_ns, channel, new_versions[channel])] = blob
+            saved, saved_metadata, _ = self.storage[thread_id][checkpoint_ns][checkpoint["id"]]
+            size = len(saved[1]) + len(saved_metadata[1])
+            for channel, version in new_versions.items():
+                key = (thread_id, checkpoint_ns, channel, version)
+                self._blob_keys[thread_id].add(key)
+                size += self._blob_size(self.blobs[key])
+            self._versions[(thread_id, checkpoint_ns, checkpoint["id"])] = dict(checkpoint["channel_versions"])
+            parent_id = config["configurable"].get("checkpoint_id")
+            self._headers.setdefault((thread_id, checkpoint_ns), {})[checkpoint["id"]] = (
+                metadata.get("step"),
+                metadata.get("source"),
+                self._writers(thread_id, checkpoint_ns, parent_id, checkpoint, metadata),
+                parent_id,
+            )
+            self._add_bytes(thread_id, size)
+            self._prune(thread_id, checkpoint_ns)
+            self._enforce_max_bytes(thread_id)
+            return next_config
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        key = (thread_id, config["configurable"].get("checkpoint_ns", ""), config["configurable"]["checkpoint_id"])
+        with self._lock:
+            self._use(thread_id)
+            before = sum(len(w[2][1]) for w in self.writes.get(key, {}).values())
+            super().put_writes(config, writes, task_id, task_path)
+            self._write_keys[thread_id].add(key)
+            self._add_bytes(thread_id, sum(len(w[2][1]) for w in self.writes[key].values()) - before)
+            self._enforce_max_bytes(thread_id)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            if thread_id in self._spilled:
+                os.remove(self._spill_path(thread_id))
+                self._spilled.discard(thread_id)
+            if thread_id in self._threads:
+                self.resident_bytes -= self._threads.pop(thread_id)
+            self._write_keys.pop(thread_id, None)
+            for key in self._blob_keys.pop(thread_id, ()):
+                if key in self.blobs:
+                    self._release(self.blobs[key])
+            for k in [k for k in self._versions if k[0] == thread_id]:
+                del self._versions[k]
+            for k in [k for k in self._headers if k[0] == thread_id]:
+                del self._headers[k]
+            for k in [k for k in self._seen if k[0] == thread_id]:
+                del self._seen[k]
+            super().delete_thread(thread_id)
+
+
+def _remove_spills(ref: "weakref.ref[BoundedMemorySaver]") -> None:
+    if (saver := ref()) is not None:
+        with saver._lock:
+            for thread_id in list(saver._spilled):
+                os.remove(saver._spill_path(thread_id))
+            saver._spilled.clear()
+
+
+def state_history(graph: Any, config: RunnableConfig, **filters: Any) -> Iterator[CheckpointHeader]:
+    """Like `graph.get_state_history`, but yields checkpoint headers and decodes no state.
+
+    `graph` must be compiled with a BoundedMemorySaver; `filters` are those of `BoundedMemorySaver.headers`.
+    """
+    triggers = {name: node.triggers for name, node in graph.nodes.items()}
+    return graph.checkpointer.headers(config, triggers=triggers, **filters)
+
+
+class CoalescingSaver(BaseCheckpointSaver):
+    """Wraps a checkpointer so the pending writes of a superstep are saved together, when the step commits.
+
+    Every task of a superstep (like the parallel `b` and `c` of parallelization.py) saves its writes
+    as soon as it finishes, one checkpointer call per task. This buffers them instead, and hands them
+    to `saver` in one go right before the checkpoint that ends the step: in a single call if `saver`
+    has `put_many_writes` (SqliteSaver does), otherwise one `put_writes` per task. Reading a thread
+    flushes its writes first, so `get_state` always sees every write.
+
+    A step that ends without a checkpoint leaves `saver` with the same writes as without this
+    wrapper, so resuming the thread doesn't run its finished tasks again: a failed task's error or
+    an interrupt is saved right away after the buffered writes of its thread, and writes still
+    buffered `max_delay` seconds after a step's first one (a run that was cancelled, or one slow
+    step) are saved by a background thread, as they are when the process exits. Only a process
+    killed outright within `max_delay` of a write loses it.
+
+    `steps`, `writes` and `writes_per_step` tell how many writes each step made, `saver_calls` how
+    many calls reached `saver`, and `checkpointer_seconds` how long they took. With `coalesce=False`
+    every write goes straight to `saver`, which only measures it.
+
+        memory = CoalescingSaver(SqliteSaver("checkpoints.sqlite"))
+        graph = builder.compile(checkpointer=memory)
+    """
+
+    def __init__(self, saver: BaseCheckpointSaver, *, coalesce: bool = True, max_delay: float = 1.0) -> None:
+        super().__init__(serde=saver.serde)
+        self.saver = saver
+        self.coalesce = coalesce
+        self.max_delay = max_delay
+        # (thread, ns) -> checkpoint id -> buffered (writes, task id, task path)
+        self._pending: dict[tuple[str, str], dict[str, list]] = {}
+        # (thread, ns) -> id of the latest checkpoint put through this saver, the one whose step is running
+        self._open: dict[tuple[str, str], str] = {}
+        # (thread, ns) -> when its buffered writes are saved if no checkpoint comes first
+        self._deadlines: dict[tuple[str, str], float] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._flusher: Optional[threading.Thread] = None
+        atexit.register(_flush_at_exit, weakref.ref(self))
+        self.steps = 0
+        self.writes = 0
+        self.saver_calls = 0
+        self.checkpointer_seconds = 0.0
+
+    @property
+    def config_specs(self) -> list:
+        return self.saver.config_specs
+
+    @property
+    def writes_per_step(self) -> float:
+        return self.writes / self.steps if self.steps else 0.0
+
+    def _timed(self, seconds: float, calls: int = 1) -> None:
+        with self._lock:
+            self.saver_calls += calls
+            self.checkpointer_seconds += seconds
+
+    def _buffer(self, config: RunnableConfig, writes: Sequence[tuple[str, Any]], task_id: str, task_path: str) -> bool:
+        """Buffer the writes of a task if they belong to the running step, and tell whether they were.
+        """
+        key = (config["configurable"]["thread_id"], config["configurable"].get("checkpoint_ns", ""))
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        with self._lock:
+            self.writes += len(writes)
+            # errors and interrupts end the step without a checkpoint, and writes of older steps arrive late
+            if not self.coalesce or self._open.get(key) != checkpoint_id or any(channel in WRITES_IDX_MAP for channel, _ in writes):
+                return False
+            self._pending.setdefault(key, {}).setdefault(checkpoint_id, []).append((writes, task_id, task_path))
+            if key not in self._deadlines:
+                self._deadlines[key] = time.monotonic() + self.max_delay
+                self._start_flusher()
+            return True
+
+    def _start_flusher(self) -> None:
+        # one background thread for every thread's deadlines, started when needed and gone when idle
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=_flush_when_due, args=(weakref.ref(self),), name="coalescing-saver", daemon=True)
+            self._flusher.start()
+        else:
+            self._wakeup.notify()
+
+    def _keys(self, thread_id: Optional[str] = None) -> list[tuple[str, str]]:
+        with self._lock:
+            return [key for key in self._pending if thread_id is None or key[0] == thread_id]
+
+    def _take(self, key: Optional[tuple[str, str]] = None) -> list[tuple[RunnableConfig, Sequence, str, str]]:
+        """Remove and return the buffered writes of one thread and namespace, or of all of them.
+        """
+        with self._lock:
+            keys = [key] if key is not None else list(self._pending)
+            taken = []
+            for thread_id, checkpoint_ns in keys:
+                self._deadlines.pop((thread_id, checkpoint_ns), None)
+                for checkpoint_id, tasks in self._pending.pop((thread_id, checkpoint_ns), {}).items():
+                    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}}
+                    taken.extend((config, writes, task_id, task_path) for writes, task_id, task_path in tasks)
+            return taken
+
+    def flush_thread(self, thread_id: Optional[str]) -> None:
+        """Save the buffered writes of every namespace of a thread, or of every thread if `thread_id` is None.
+        """
+        for key in self._keys(thread_id):
+            self.flush(key)
+
+    async def aflush_thread(self, thread_id: Optional[str]) -> None:
+        for key in self._keys(thread_id):
+            await self.aflush(key)
+
+    def flush(self, key: Optional[tuple[str, str]] = None) -> None:
+        batch = self._take(key)
+        if not batch:
+            return
+        start = time.perf_counter()
+        # savers that can store several tasks' writes at once (like SqliteSaver) get them in one call
+        if hasattr(self.saver, "put_many_writes"):
+            self.saver.put_many_writes(batch)
+            self._timed(time.perf_counter() - start)
+        else:
+            for config, writes, task_id, task_path in batch:
+                self.saver.put_writes(config, writes, task_id, task_path)
+            self._timed(time.perf_counter() - start, len(batch))
+
+    async def aflush(self, key: Optional[tuple[str, str]] = None) -> None:
+        batch = self._take(key)
+        if not batch:
+            return
+        start = time.perf_counter()
+        if hasattr(self.saver, "aput_many_writes"):
+            await self.saver.aput_many_writes(batch)
+            self._timed(time.perf_counter() - start)
+        else:
+            for config, writes, task_id, task_path in batch:
+                await self.saver.aput_writes(config, writes, task_id, task_path)
+            self._timed(time.perf_counter() - start, len(batch))
+
+    def _committing(self, config: RunnableConfig, checkpoint: Checkpoint) -> tuple[str, str]:
+        key = (config["configurable"]["thread_id"], config["configurable"].get("checkpoint_ns", ""))
+        with self._lock:
+            self.steps += 1
+            self._open[key] = checkpoint["id"]
+        return key
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        self.flush_thread(config["configurable"]["thread_id"])
+        start = time.perf_counter()
+        result = self.saver.get_tuple(config)
+        self._timed(time.perf_counter() - start)
+        return result
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        self.flush_thread(config["configurable"].get("thread_id") if config else None)
+        return self.saver.list(config, filter=filter, before=before, limit=limit)
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        key = self._committing(config, checkpoint)
+        self.flush(key)
+        start = time.perf_counter()
+        result = self.saver.put(config, checkpoint, metadata, new_versions)
+        self._timed(time.perf_counter() - start)
+        return result
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        if not self._buffer(config, writes, task_id, task_path):
+            # an error or interrupt may come from a subgraph, so every namespace of the thread is saved before it
+            self.flush_thread(config["configurable"]["thread_id"])
+            start = time.perf_counter()
+            self.saver.put_writes(config, writes, task_id, task_path)
+            self._timed(time.perf_counter() - start)
+
+    def _forget(self, thread_id: str) -> None:
+        with self._lock:
+            for key in [key for key in self._pending if key[0] == thread_id]:
+                del self._pending[key]
+                self._deadlines.pop(key, None)
+            for key in [key for key in self._open if key[0] == thread_id]:
+                del self._open[key]
+
+    def delete_thread(self, thread_id: str) -> None:
+        self._forget(thread_id)
+        self.saver.delete_thread(thread_id)
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        await self.aflush_thread(config["configurable"]["thread_id"])
+        start = time.perf_counter()
+        result = await self.saver.aget_tuple(config)
+        self._timed(time.perf_counter() - start)
+        return result
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        await self.aflush_thread(config["configurable"].get("thread_id") if config else None)
+        async for checkpoint in self.saver.alist(config, filter=filter, before=before, limit=limit):
+            yield checkpoint
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        key = self._committing(config, checkpoint)
+        await self.aflush(key)
+        start = time.perf_counter()
+        result = await self.saver.aput(config, checkpoint, metadata, new_versions)
+        self._timed(time.perf_counter() - start)
+        return result
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        if not self._buffer(config, writes, task_id, task_path):
+            await self.aflush_thread(config["configurable"]["thread_id"])
+            start = time.perf_counter()
+            await self.saver.aput_writes(config, writes, task_id, task_path)
+            self._timed(time.perf_counter() - start)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        self._forget(thread_id)
+        await self.saver.adelete_thread(thread_id)
+
+    def get_next_version(self, current: Optional[Any], channel: Any) -> Any:
+        return self.saver.get_next_version(current, channel)
+
+
+def _flush_when_due(ref: "weakref.ref[CoalescingSaver]") -> None:
+    """Body of a CoalescingSaver's background thread: save buffered writes whose deadline passed.
+
+    It only holds the saver while it works, and stops after a while without buffered writes.
+    """
+    while (saver := ref()) is not None:
+        with saver._wakeup:
+            if not saver._deadlines:
+                if not saver._wakeup.wait(10 * saver.max_delay) and not saver._deadlines:
+                    saver._flusher = None
+                    return
+                continue
+            now = time.monotonic()
+            due = [key for key, deadline in saver._deadlines.items() if deadline <= now]
+            if not due:
+                saver._wakeup.wait(min(saver._deadlines.values()) - now)
+                continue
+        for key in due:
+            try:
+                saver.flush(key)
+            except Exception:
+                logger.exception("saving the buffered writes of %s failed", key)
+        del saver
+
+def _flush_at_exit(ref: "weakref.ref[CoalescingSaver]") -> None:
+    if (saver := ref()) is not None:
+        saver.flush()
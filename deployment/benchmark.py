@@ -0,0 +1,249 @@
+"""Micro-benchmarks and load tests for task_maistro.
+
+Run them from this directory, for example: `python benchmark.py extractors`
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+import timeit
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+# nothing here calls OpenAI, but ChatOpenAI refuses to be built without a key
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from trustcall import create_extractor
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langgraph.store.base import Item
+from langgraph.store.memory import InMemoryStore
+
+import memory
+import task_maistro
+
+from extractors import get_extractor, get_tool_model
+from indexed_store import IndexedInMemoryStore
+from memory import ACTIVE_TODOS, TODO_PAGE_SIZE, Memories, MemoryCache, relevant_todos, render_todos, todos_due
+from task_maistro import Spy, ToDo, UpdateMemory, model
+from vector_store import HashingEmbeddings, VectorInMemoryStore
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model that answers every call with the same message after a fixed latency.
+    """
+    latency: float = 0.0
+    response: str = "Sure, noted."
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def _result(self) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.response))])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.latency)
+        return self._result()
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return self._result()
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+
+class SlowStore(InMemoryStore):
+    """InMemoryStore that waits `latency` seconds on every round trip, like a remote database.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+
+    def batch(self, ops):
+        time.sleep(self.latency)
+        return super().batch(ops)
+
+    async def abatch(self, ops):
+        await asyncio.sleep(self.latency)
+        return await super().abatch(ops)
+
+
+def bench_extractors(number: int):
+    """Per-turn cost of preparing the ToDo extractor and the tool-bound model, before and after the registry.
+    """
+
+    def rebuild_per_turn():
+        create_extractor(model, tools=[ToDo], tool_choice="ToDo", enable_inserts=True).with_listeners(on_end=Spy())
+        model.bind_tools([UpdateMemory], parallel_tool_calls=False)
+
+    def reuse_from_registry():
+        get_extractor(model, ToDo, tool_choice="ToDo", enable_inserts=True).with_listeners(on_end=Spy())
+        get_tool_model(model, [UpdateMemory], parallel_tool_calls=False)
+
+    for name, fn in [("rebuild per turn", rebuild_per_turn), ("registry", reuse_from_registry)]:
+        seconds = min(timeit.repeat(fn, number=number, repeat=3))
+        print(f"{name:>20}: {seconds / number * 1000:.3f} ms/turn")
+
+
+def load_test(number: int, model_latency: float = 0.2, store_latency: float = 0.02):
+    """Throughput of `number` concurrent conversation threads against a fake model and a slow store.
+
+    Every thread belongs to a different user, so each turn misses the memory cache and goes to the store.
+    """
+    task_maistro.model_with_tools = FakeChatModel(latency=model_latency)
+    graph = task_maistro.graph.builder.compile(store=SlowStore(latency=store_latency))
+
+    def turn_config(i: int, async_nodes: bool = False) -> dict:
+        return {"configurable": {"user_id": f"user-{i}", "async_nodes": async_nodes}}
+
+    turn_input = {"messages": [("user", "Remind me to book a dentist appointment.")]}
+
+    def run_sync():
+        with ThreadPoolExecutor() as executor:
+            list(executor.map(lambda i: graph.invoke(turn_input, turn_config(i)), range(number)))
+
+    def run_async(async_nodes: bool):
+        async def main():
+            await asyncio.gather(*(graph.ainvoke(turn_input, turn_config(i, async_nodes)) for i in range(number)))
+        asyncio.run(main())
+
+    for name, fn in [
+        ("sync graph", run_sync),
+        ("async graph, sync nodes", lambda: run_async(False)),
+        ("async graph, async nodes", lambda: run_async(True)),
+    ]:
+        task_maistro.memory_cache = MemoryCache()
+        start = time.perf_counter()
+        fn()
+        seconds = time.perf_counter() - start
+        print(f"{name:>25}: {number / seconds:8.1f} turns/s ({seconds:.2f}s for {number} threads)")
+
+
+def make_todos(number: int, seed: int = 0) -> list[dict]:
+    """Realistic-looking ToDo documents, as `ToDo.model_dump(mode="json")` stores them.
+    """
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    todos = []
+    for i in range(number):
+        todos.append(ToDo(
+            task=f"Task {i}: {rng.choice(['book', 'call', 'buy', 'plan', 'review'])} {rng.choice(['dentist', 'groceries', 'flights', 'report', 'birthday gift'])}",
+            time_to_complete=rng.choice([None, 15, 30, 60, 120]),
+            deadline=rng.choice([None, start + timedelta(days=rng.randrange(365))]),
+            solutions=rng.sample(["search online", "ask a friend", "call the office", "use the app", "visit in person"], k=rng.randrange(1, 3)),
+            status=rng.choice(["not started", "not started", "in progress", "done", "archived"]),
+        ).model_dump(mode="json"))
+    return todos
+
+
+def bench_render(number: int):
+    """Size and formatting time of the ToDo block of the prompt, before and after the compact renderer.
+    """
+    now = datetime.now(timezone.utc)
+    items = [Item(value=v, key=str(i), namespace=("todo", "general", "user"), created_at=now, updated_at=now) for i, v in enumerate(make_todos(number))]
+    memories = Memories(todos=items)
+
+    def after_a_write():
+        # the next turn after one ToDo was updated: a new list where only that item has a new version
+        changed = items[0]
+        items[0] = Item(value=changed.value, key=changed.key, namespace=changed.namespace, created_at=now, updated_at=datetime.now(timezone.utc))
+        return render_todos(items, include_archived=False)
+
+    def first():
+        # an empty render cache, as in a new process
+        memory._rendered.clear()
+        return render_todos(items, include_archived=False)
+
+    variants = [
+        ("python repr", lambda: "\n".join(f"{mem.value}" for mem in items)),
+        ("compact, first", first),
+        ("compact, after a write", after_a_write),
+        ("compact, cached", lambda: memories.todo_block(include_archived=False)),
+    ]
+    for name, fn in variants:
+        seconds = min(timeit.repeat(fn, number=20, repeat=3)) / 20
+        print(f"{name:>22}: {len(fn()):8d} chars, {seconds * 1000:.3f} ms")
+
+
+def bench_todo_index(number: int):
+    """ToDo queries against one user with `number` ToDos, scanning InMemoryStore versus IndexedInMemoryStore.
+    """
+    namespace = ("todo", "general", "user")
+    week_start = datetime(2025, 3, 3, tzinfo=timezone.utc)
+    week_end = week_start + timedelta(days=7)
+
+    def all_pages(store, **search):
+        items, page = [], None
+        while page is None or len(page) == TODO_PAGE_SIZE:
+            page = store.search(namespace, limit=TODO_PAGE_SIZE, offset=len(items), **search)
+            items.extend(page)
+        return items
+
+    def due_this_week_in_python(store):
+        return [
+            item for item in all_pages(store, filter=ACTIVE_TODOS)
+            if item.value["deadline"] and week_start <= datetime.fromisoformat(item.value["deadline"]) < week_end
+        ]
+
+    stores = {"InMemoryStore": InMemoryStore(), "IndexedInMemoryStore": IndexedInMemoryStore()}
+    for store in stores.values():
+        for i, value in enumerate(make_todos(number)):
+            store.put(namespace, str(i), value)
+
+    queries = [
+        ("first page of open todos", lambda store: store.search(namespace, filter=ACTIVE_TODOS, limit=TODO_PAGE_SIZE)),
+        ("all 'in progress' todos", lambda store: all_pages(store, filter={"status": "in progress"})),
+        ("due this week", lambda store: (
+            todos_due(store, "general", "user", week_start, week_end)
+            if isinstance(store, IndexedInMemoryStore)
+            else due_this_week_in_python(store)
+        )),
+    ]
+    for query, fn in queries:
+        for name, store in stores.items():
+            seconds = min(timeit.repeat(lambda: fn(store), number=5, repeat=3)) / 5
+            print(f"{query:>26} | {name:>20}: {len(fn(store)):5d} todos, {seconds * 1000:8.3f} ms")
+
+
+def bench_vector_search(number: int, k: int = 5):
+    """Indexing and top-`k` semantic search over `number` ToDos, InMemoryStore's index versus VectorInMemoryStore.
+    """
+    namespace = ("todo", "general", "user")
+    todos = make_todos(number)
+    queries = ["book the flights", "buy a birthday gift", "call the dentist", "review the report", "plan groceries"]
+    index = {"dims": 256, "embed": HashingEmbeddings(256), "fields": ["task"]}
+
+    for name, store in [("InMemoryStore", InMemoryStore(index=index)), ("VectorInMemoryStore", VectorInMemoryStore(index=index))]:
+        start = time.perf_counter()
+        for i, value in enumerate(todos):
+            store.put(namespace, str(i), value)
+        put = (time.perf_counter() - start) / number
+
+        search = min(timeit.repeat(
+            lambda: [relevant_todos(store, "general", "user", query, k) for query in queries], number=5, repeat=3
+        )) / 5 / len(queries)
+        top = [item.value["task"] for item in relevant_todos(store, "general", "user", queries[0], 3)]
+        print(f"{name:>20}: put {put * 1000:6.3f} ms/todo, top-{k} search {search * 1000:8.3f} ms, {queries[0]!r} -> {top}")
+
+
+BENCHMARKS = {
+    "extractors": bench_extractors,
+    "load": load_test,
+    "render": bench_render,
+    "todo-index": bench_todo_index,
+    "vector-search": bench_vector_search,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("benchmark", choices=BENCHMARKS)
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args.number)
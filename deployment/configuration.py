@@ -13,6 +13,22 @@ class Configuration:
     user_id: str = "default-user"
     todo_category: str = "general" 
     task_maistro_role: str = "You are a helpful task management assistant. You help you create, organize, and manage the user's ToDo list."
+    # send only the ToDos most relevant to the latest messages to the extractor (0 sends all of them)
+    todo_working_set_size: int = 0
+    # use the async node implementations (ainvoke/asearch/aput) when the graph runs asynchronously
+    async_nodes: bool = False
+    # only show the update nodes the latest messages that fit in this many tokens (0 sends the whole thread)
+    extraction_token_budget: int = 0
+    # route messages that obviously update one kind of memory without the task_mAIstro model call
+    fast_path_routing: bool = False
+    # let the model ask for several memory updates at once and run them concurrently
+    parallel_updates: bool = False
+    # load archived ToDos too, for the model's prompt and the ToDo extractor
+    include_archived_todos: bool = False
+    # respond right away and run the memory updates of a turn in the background
+    background_memory_writes: bool = False
+    # put only the ToDos most relevant to the user's latest message in the prompt (0 puts all of them), needs a store with a semantic index
+    relevant_todos_k: int = 0
 
     @classmethod
     def from_runnable_config(
@@ -23,8 +39,18 @@ class Configuration:
             config["configurable"] if config and "configurable" in config else {}
         )
         values: dict[str, Any] = {
-            f.name: os.environ.get(f.name.upper(), configurable.get(f.name))
+            f.name: _coerce(f.type, os.environ.get(f.name.upper(), configurable.get(f.name)))
             for f in fields(cls)
             if f.init
         }
-        return cls(**{k: v for k, v in values.items() if v})
\ No newline at end of file
+        return cls(**{k: v for k, v in values.items() if v})
+
+
+def _coerce(type_: Any, value: Any) -> Any:
+    """Convert values coming from environment variables to the field's type.
+    """
+    if not isinstance(value, str) or type_ is str:
+        return value
+    if type_ is bool:
+        return value.strip().lower() in ("1", "true", "yes")
+    return type_(value)
\ No newline at end of file
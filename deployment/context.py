@@ -0,0 +1,129 @@
+import json
+import logging
+import os
+import threading
+
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional, Sequence
+
+from langchain_core.messages import AnyMessage, HumanMessage, trim_messages
+
+
+logger = logging.getLogger(__name__)
+
+# rough per-message overhead of the chat format (role, separators), as in OpenAI's cookbook
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class TokenCounter:
+    """Counts message tokens with a local tokenizer, caching the count of every message by its id.
+
+    A message stays in the graph state for many turns, and is tokenized only the first time. It can
+    still change under the same id (`add_messages` replaces a message with the same id, as summaries
+    and `update_state` do), so every count is kept with a hash of what was counted and redone when
+    that changed.
+    """
+
+    def __init__(self, encode: Optional[Callable[[str], list]] = None, model_name: str = "gpt-4o", maxsize: int = 100_000):
+        self._encode = encode
+        self.model_name = model_name
+        self.maxsize = maxsize
+        # message id -> (hash of its content and tool calls, token count)
+        self._counts: OrderedDict[str, tuple[int, int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def encode(self, text: str) -> list:
+        if self._encode is None:
+            # tiktoken downloads the encoding the first time it is used, so load it lazily
+            import tiktoken
+            self._encode = tiktoken.encoding_for_model(self.model_name).encode
+        return self._encode(text)
+
+    @staticmethod
+    def _parts(message: AnyMessage) -> tuple[str, ...]:
+        """The texts of a message that are counted: its content and its tool calls.
+        """
+        content = message.content if isinstance(message.content, str) else json.dumps(message.content)
+        tool_calls = getattr(message, "tool_calls", None) or []
+        return (content, *(tool_call["name"] + json.dumps(tool_call["args"]) for tool_call in tool_calls))
+
+    def _count(self, parts: tuple[str, ...]) -> int:
+        return sum(len(self.encode(part)) for part in parts) + MESSAGE_OVERHEAD_TOKENS
+
+    def count(self, message: AnyMessage) -> int:
+        parts = self._parts(message)
+        if message.id is None:
+            return self._count(parts)
+        # str caches its hash, so checking a long content that didn't change is cheap
+        version = hash(parts)
+        with self._lock:
+            cached = self._counts.get(message.id)
+            if cached is not None and cached[0] == version:
+                self._counts.move_to_end(message.id)
+                return cached[1]
+        tokens = self._count(parts)
+        with self._lock:
+            self._counts[message.id] = (version, tokens)
+            self._counts.move_to_end(message.id)
+            while len(self._counts) > self.maxsize:
+                self._counts.popitem(last=False)
+        return tokens
+
+    def __call__(self, messages: Sequence[AnyMessage]) -> int:
+        return sum(self.count(m) for m in messages)
+
+
+def window_messages(messages: Sequence[AnyMessage], max_tokens: int, token_counter: TokenCounter) -> list[AnyMessage]:
+    """Keep the most recent messages that fit in `max_tokens`, starting on a human message.
+
+    Starting on a human message keeps tool messages from being separated from the AI message that
+    called them. If not even the latest turn fits, the latest turn is kept whole (from its human
+    message on), since a tool message sent without the AI message that called it is rejected.
+    """
+    windowed = trim_messages(
+        messages,
+        max_tokens=max_tokens,
+        token_counter=token_counter,
+        strategy="last",
+        start_on="human",
+    )
+    if windowed:
+        return windowed
+    for i in range(len(messages) - 1, -1, -1):
+        if isinstance(messages[i], HumanMessage):
+            return list(messages[i:])
+    return list(messages)
+
+
+class PrefixStats:
+    """Measures how much of each prompt repeats the start of the previous prompt with the same key.
+
+    The shared prefix is what a provider-side or local prompt cache can reuse between turns.
+    """
+
+    def __init__(self, maxsize: int = 10_000):
+        self.maxsize = maxsize
+        self.prompts = 0
+        self.prompt_chars = 0
+        self.reused_chars = 0
+        self._last: OrderedDict[Hashable, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, key: Hashable, prompt: str) -> int:
+        """Remember `prompt` as the latest one for `key` and return how many characters it shares with the previous one.
+        """
+        with self._lock:
+            previous = self._last.pop(key, "")
+            self._last[key] = prompt
+            while len(self._last) > self.maxsize:
+                self._last.popitem(last=False)
+            shared = len(os.path.commonprefix([previous, prompt]))
+            self.prompts += 1
+            self.prompt_chars += len(prompt)
+            self.reused_chars += shared
+        logger.debug("prompt prefix reuse: %d of %d characters", shared, len(prompt))
+        return shared
+
+    @property
+    def reuse_ratio(self) -> float:
+        return self.reused_chars / self.prompt_chars if self.prompt_chars else 0.0
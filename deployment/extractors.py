@@ -0,0 +1,44 @@
+import threading
+
+from typing import Any, Callable, Hashable, Sequence
+
+from trustcall import create_extractor
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.runnables import Runnable
+
+
+_registry: dict[Hashable, tuple[BaseChatModel, Runnable]] = {}
+_lock = threading.Lock()
+
+
+def _options_key(options: dict[str, Any]) -> tuple:
+    return tuple(sorted(options.items()))
+
+
+def _get_or_build(key: Hashable, llm: BaseChatModel, build: Callable[[], Runnable]) -> Runnable:
+    with _lock:
+        # keep a reference to the model so its id can't be reused while the entry is alive
+        entry = _registry.get(key)
+        if entry is None:
+            entry = _registry[key] = (llm, build())
+        return entry[1]
+
+
+def get_extractor(llm: BaseChatModel, schema: type, **options: Any) -> Runnable:
+    """Return the trustcall extractor for `schema`, building it only the first time it is asked for.
+
+    Building an extractor converts the schema to a tool and wraps the model in several runnables,
+    so it is done once per process and reused. Per-run listeners such as `Spy` should be attached
+    with `.with_listeners(...)` on the returned extractor, which does not rebuild it.
+    """
+    key = ("extractor", id(llm), schema, _options_key(options))
+    return _get_or_build(key, llm, lambda: create_extractor(llm, tools=[schema], **options))
+
+
+def get_tool_model(llm: BaseChatModel, tools: Sequence[type], **options: Any) -> Runnable:
+    """Return `llm` with `tools` bound, building the binding only the first time it is asked for.
+    """
+    key = ("tools", id(llm), tuple(tools), _options_key(options))
+    return _get_or_build(key, llm, lambda: llm.bind_tools(list(tools), **options))
+
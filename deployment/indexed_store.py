@@ -0,0 +1,155 @@
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Iterable, Optional
+
+from langgraph.store.base import Item, PutOp, SearchOp
+from langgraph.store.memory import InMemoryStore, _compare_values
+
+
+RANGE_OPERATORS = {"$gt", "$gte", "$lt", "$lte"}
+
+
+def _sort_key(value: Any) -> Any:
+    """Make ISO-8601 strings comparable as points in time, assuming UTC when no offset is given.
+    """
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return value
+    if isinstance(value, datetime) and value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _rangeable(value: Any) -> bool:
+    """Whether a value can go in a range index; unparseable strings are left out, as no range can match them.
+    """
+    return value is not None and not isinstance(_sort_key(value), str)
+
+
+class IndexedInMemoryStore(InMemoryStore):
+    """InMemoryStore with secondary indexes on document fields, for namespaces under `namespace_prefix`.
+
+    `equality_fields` are indexed by value and serve `{"field": value}`, `$eq` and `$ne` filters.
+    `range_fields` are kept sorted and serve `$gt`, `$gte`, `$lt` and `$lte` filters, comparing
+    ISO-8601 strings such as ToDo deadlines as datetimes. Range results come back in field order,
+    so `limit`/`offset` pages through them like a cursor. Searches the indexes can't serve fall
+    back to the InMemoryStore scan.
+
+        store = IndexedInMemoryStore()
+        store.search(("todo", "general", user_id), filter={"status": {"$ne": "archived"}}, limit=100)
+        store.search(("todo", "general", user_id), filter={"deadline": {"$gte": monday, "$lt": next_monday}})
+    """
+
+    def __init__(
+        self,
+        *,
+        namespace_prefix: tuple[str, ...] = ("todo",),
+        equality_fields: Iterable[str] = ("status",),
+        range_fields: Iterable[str] = ("deadline",),
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(**kwargs)
+        self.namespace_prefix = namespace_prefix
+        self.equality_fields = tuple(equality_fields)
+        self.range_fields = tuple(range_fields)
+        # [(namespace, field)][value] -> keys, in insertion order
+        self._equality: dict[tuple[tuple[str, ...], str], dict[Any, dict[str, None]]] = defaultdict(lambda: defaultdict(dict))
+        # [(namespace, field)] -> sorted [(value, key)]
+        self._ranges: dict[tuple[tuple[str, ...], str], list[tuple[Any, str]]] = defaultdict(list)
+
+    def _indexed(self, namespace: tuple[str, ...]) -> bool:
+        return namespace[: len(self.namespace_prefix)] == self.namespace_prefix
+
+    def _unindex(self, namespace: tuple[str, ...], key: str, value: dict[str, Any]) -> None:
+        for f in self.equality_fields:
+            self._equality[(namespace, f)][_hashable(value.get(f))].pop(key, None)
+        for f in self.range_fields:
+            if _rangeable(value.get(f)):
+                entries = self._ranges[(namespace, f)]
+                i = bisect_left(entries, (_sort_key(value[f]), key))
+                if i < len(entries) and entries[i][1] == key:
+                    del entries[i]
+
+    def _index(self, namespace: tuple[str, ...], key: str, value: dict[str, Any]) -> None:
+        for f in self.equality_fields:
+            self._equality[(namespace, f)][_hashable(value.get(f))][key] = None
+        for f in self.range_fields:
+            if _rangeable(value.get(f)):
+                insort(self._ranges[(namespace, f)], (_sort_key(value[f]), key))
+
+    def _apply_put_ops(self, put_ops: dict[tuple[tuple[str, ...], str], PutOp]) -> None:
+        for (namespace, key), op in put_ops.items():
+            if not self._indexed(namespace):
+                continue
+            if (old := self._data[namespace].get(key)) is not None:
+                self._unindex(namespace, key, old.value)
+            if op.value is not None:
+                self._index(namespace, key, op.value)
+        super()._apply_put_ops(put_ops)
+
+    def _candidate_keys(self, namespace: tuple[str, ...], filter: dict[str, Any]) -> tuple[Optional[list[str]], set[str]]:
+        """Keys matching the part of `filter` the indexes can serve (None if they serve none of it), and the fields served.
+        """
+        keys: Optional[list[str]] = None
+        served = set()
+        for f, condition in filter.items():
+            if f in self.range_fields and isinstance(condition, dict) and condition and set(condition) <= RANGE_OPERATORS:
+                matched = self._range_keys(namespace, f, condition)
+            elif f in self.equality_fields and not (isinstance(condition, dict) and set(condition) - {"$eq", "$ne"}):
+                matched = self._equality_keys(namespace, f, condition)
+            else:
+                continue
+            served.add(f)
+            if keys is None:
+                keys = matched
+            else:
+                matched_set = set(matched)
+                keys = [k for k in keys if k in matched_set]
+        return keys, served
+
+    def _equality_keys(self, namespace: tuple[str, ...], f: str, condition: Any) -> list[str]:
+        index = self._equality[(namespace, f)]
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        keys = list(index[_hashable(condition["$eq"])]) if "$eq" in condition else list(self._data[namespace])
+        if "$ne" in condition:
+            excluded = index[_hashable(condition["$ne"])]
+            keys = [k for k in keys if k not in excluded]
+        return keys
+
+    def _range_keys(self, namespace: tuple[str, ...], f: str, condition: dict[str, Any]) -> list[str]:
+        entries = self._ranges[(namespace, f)]
+        lo, hi = 0, len(entries)
+        if "$gte" in condition:
+            lo = max(lo, bisect_left(entries, (_sort_key(condition["$gte"]),)))
+        if "$gt" in condition:
+            lo = max(lo, bisect_right(entries, (_sort_key(condition["$gt"]), "\U0010ffff")))
+        if "$lte" in condition:
+            hi = min(hi, bisect_right(entries, (_sort_key(condition["$lte"]), "\U0010ffff")))
+        if "$lt" in condition:
+            hi = min(hi, bisect_left(entries, (_sort_key(condition["$lt"]),)))
+        return [key for _, key in entries[lo:hi]]
+
+    def _filter_items(self, op: SearchOp) -> list[tuple[Item, list[list[float]]]]:
+        namespace = op.namespace_prefix
+        if op.query or not op.filter or not self._indexed(namespace) or namespace not in self._data:
+            return super()._filter_items(op)
+        keys, served = self._candidate_keys(namespace, op.filter)
+        if keys is None:
+            return super()._filter_items(op)
+
+        # conditions the indexes can't serve are still checked item by item
+        rest = {f: condition for f, condition in op.filter.items() if f not in served}
+        items = self._data[namespace]
+        return [
+            (items[key], [])
+            for key in keys
+            if all(_compare_values(items[key].value.get(f), condition) for f, condition in rest.items())
+        ]
+
+
+def _hashable(value: Any) -> Any:
+    return tuple(value) if isinstance(value, list) else value
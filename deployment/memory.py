@@ -0,0 +1,396 @@
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import threading
+import uuid
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Optional, Sequence
+
+from langchain_core.messages import AnyMessage
+from langgraph.store.base import BaseStore, Item, PutOp, SearchOp
+
+from indexed_store import IndexedInMemoryStore, _rangeable, _sort_key
+
+
+logger = logging.getLogger(__name__)
+
+
+# ToDo fields in the order they are rendered, and the values left out of the prompt because they say nothing
+TODO_FIELDS = ("task", "status", "deadline", "time_to_complete", "solutions")
+TODO_DEFAULTS = {"status": "not started"}
+_TODO_FIELD_SET = frozenset(TODO_FIELDS)
+_MISSING = object()
+# one encoder for every ToDo, json.dumps builds a new one per call when given options
+_ENCODER = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False, default=str)
+# rendered ToDos by (namespace, key, updated_at), which changes on every put of the item
+RENDER_CACHE_SIZE = 100_000
+_rendered: OrderedDict[tuple, str] = OrderedDict()
+_rendered_lock = threading.Lock()
+
+
+def render_todo(value: dict[str, Any]) -> str:
+    """Render one ToDo as compact JSON with a stable field order, leaving out empty and default fields.
+    """
+    # ToDos written by the extractor only have the schema's fields, so their order is known up front
+    keys = TODO_FIELDS if value.keys() <= _TODO_FIELD_SET else [k for k in TODO_FIELDS if k in value] + sorted(k for k in value if k not in _TODO_FIELD_SET)
+    compact = {}
+    for k in keys:
+        v = value.get(k)
+        if v is not None and v != [] and TODO_DEFAULTS.get(k, _MISSING) != v:
+            compact[k] = v
+    return _ENCODER.encode(compact)
+
+
+def _render_item(item: Item) -> str:
+    key = (item.namespace, item.key, item.updated_at)
+    with _rendered_lock:
+        rendered = _rendered.get(key)
+        if rendered is not None:
+            _rendered.move_to_end(key)
+            return rendered
+    rendered = render_todo(item.value)
+    with _rendered_lock:
+        _rendered[key] = rendered
+        while len(_rendered) > RENDER_CACHE_SIZE:
+            _rendered.popitem(last=False)
+    return rendered
+
+
+def render_todos(todos: Sequence[Item], include_archived: bool = False) -> str:
+    """Render a ToDo list for the prompt, one ToDo per line, leaving out archived ToDos unless asked.
+
+    Each ToDo is rendered once per version, so after a write only the ToDos that changed are rendered again.
+    """
+    return "\n".join(
+        _render_item(item) for item in todos
+        if include_archived or item.value.get("status") != "archived"
+    )
+
+
+@dataclass
+class Memories:
+    """The items of the user's profile, ToDo and instructions namespaces, as loaded for one turn.
+    """
+    profile: list[Item] = field(default_factory=list)
+    todos: list[Item] = field(default_factory=list)
+    instructions: list[Item] = field(default_factory=list)
+    _rendered_todos: dict[bool, str] = field(default_factory=dict, repr=False)
+
+    def todo_block(self, include_archived: bool = False) -> str:
+        """The rendered ToDo list, kept with the cached memories so it is only rendered again after a write.
+        """
+        if include_archived not in self._rendered_todos:
+            self._rendered_todos[include_archived] = render_todos(self.todos, include_archived)
+        return self._rendered_todos[include_archived]
+
+
+def memory_namespaces(todo_category: str, user_id: str) -> dict[str, tuple[str, ...]]:
+    """Return the store namespaces of the three memory types of a user.
+    """
+    return {
+        "profile": ("profile", todo_category, user_id),
+        "todo": ("todo", todo_category, user_id),
+        "instructions": ("instructions", todo_category, user_id),
+    }
+
+
+# ToDos are read a page at a time, so a long list is never cut off by the store's default search limit
+TODO_PAGE_SIZE = 100
+ACTIVE_TODOS = {"status": {"$ne": "archived"}}
+# how many times a read that a concurrent write shifted is started over before its pages are taken as they are
+PAGE_READ_ATTEMPTS = 3
+
+
+def _todo_search(namespace: tuple[str, ...], include_archived: bool, offset: int = 0) -> SearchOp:
+    return SearchOp(namespace, filter=None if include_archived else ACTIVE_TODOS, limit=TODO_PAGE_SIZE, offset=offset)
+
+
+def _search_args(op: SearchOp) -> dict[str, Any]:
+    return {"filter": op.filter, "limit": op.limit, "offset": op.offset}
+
+
+def _same_item(a: Item, b: Item) -> bool:
+    return a.namespace == b.namespace and a.key == b.key
+
+
+def _next_offset(todos: list[Item], page: list[Item]) -> Optional[int]:
+    """Where the next page starts, or None after the last page.
+
+    BaseStore pages by offset, not by cursor, so a write landing between two pages can shift the
+    items (stores such as Postgres order by `updated_at`) and make a read skip or repeat a ToDo.
+    Each page therefore starts on the last item of the previous one, and `_add_page` checks it.
+    """
+    return len(todos) - 1 if len(page) == TODO_PAGE_SIZE else None
+
+
+def _add_page(todos: list[Item], page: list[Item]) -> bool:
+    """Append a page that overlaps `todos` by one item; False if the overlap moved, i.e. the list shifted.
+    """
+    if not page or not _same_item(page[0], todos[-1]):
+        return False
+    todos.extend(page[1:])
+    return True
+
+
+def _dedupe(todos: list[Item]) -> list[Item]:
+    seen = set()
+    return [item for item in todos if not ((item.namespace, item.key) in seen or seen.add((item.namespace, item.key)))]
+
+
+def _read_pages(search: Callable[[int], list[Item]], first_page: Optional[list[Item]] = None) -> list[Item]:
+    """All the items of a paged search, `search(offset)` returning one page, started over when a write shifts them.
+    """
+    for attempt in range(PAGE_READ_ATTEMPTS):
+        page = todos = list(first_page if first_page is not None and attempt == 0 else search(0))
+        consistent = True
+        while (offset := _next_offset(todos, page)) is not None:
+            page = search(offset)
+            if not _add_page(todos, page):
+                consistent = False
+                break
+        if consistent:
+            return todos
+    logger.warning("ToDos kept changing while they were read, some may be missing")
+    return _dedupe(todos + page)
+
+
+async def _aread_pages(search: Callable[[int], Awaitable[list[Item]]], first_page: Optional[list[Item]] = None) -> list[Item]:
+    """Async version of `_read_pages`.
+    """
+    for attempt in range(PAGE_READ_ATTEMPTS):
+        page = todos = list(first_page if first_page is not None and attempt == 0 else await search(0))
+        consistent = True
+        while (offset := _next_offset(todos, page)) is not None:
+            page = await search(offset)
+            if not _add_page(todos, page):
+                consistent = False
+                break
+        if consistent:
+            return todos
+    logger.warning("ToDos kept changing while they were read, some may be missing")
+    return _dedupe(todos + page)
+
+
+class MemoryCache:
+    """Per-user read-through cache of the profile, ToDo and instructions namespaces.
+
+    Entries are keyed by `(todo_category, user_id)` and only dropped when `invalidate` is called,
+    so every node that writes one of the three namespaces must invalidate after its `store.put`.
+    The cache lives in the process, so it assumes one process serves a given user.
+
+    Archived ToDos are filtered out by the store unless `include_archived` is passed, and the two
+    views of a user's ToDos are cached separately.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[tuple[str, str, bool], Memories] = OrderedDict()
+        self._generations: dict[tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key: tuple[str, str, bool]) -> tuple[Optional[Memories], int]:
+        with self._lock:
+            generation = self._generations.get(key[:2], 0)
+            memories = self._entries.get(key)
+            if memories is not None:
+                self._entries.move_to_end(key)
+            return memories, generation
+
+    def _set(self, key: tuple[str, str, bool], memories: Memories, generation: int) -> None:
+        with self._lock:
+            # a write happened while we were loading, so what we read may already be stale
+            if self._generations.get(key[:2], 0) != generation:
+                return
+            self._entries[key] = memories
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, todo_category: str, user_id: str) -> None:
+        """Drop the cached memories of a user after one of their namespaces was written.
+        """
+        with self._lock:
+            self._entries.pop((todo_category, user_id, False), None)
+            self._entries.pop((todo_category, user_id, True), None)
+            self._generations[(todo_category, user_id)] = self._generations.get((todo_category, user_id), 0) + 1
+
+    def load(self, store: BaseStore, todo_category: str, user_id: str, include_archived: bool = False) -> Memories:
+        """Load the memories of a user, fetching the three namespaces in a single store batch on a miss.
+        """
+        key = (todo_category, user_id, include_archived)
+        memories, generation = self._get(key)
+        if memories is not None:
+            return memories
+
+        namespaces = memory_namespaces(todo_category, user_id)
+        todo_search = _todo_search(namespaces["todo"], include_archived)
+        profile, todos, instructions = store.batch(
+            [SearchOp(namespaces["profile"]), todo_search, SearchOp(namespaces["instructions"])]
+        )
+        todos = _read_pages(
+            lambda offset: store.search(namespaces["todo"], **_search_args(_todo_search(namespaces["todo"], include_archived, offset))),
+            todos,
+        )
+
+        memories = Memories(profile=profile, todos=todos, instructions=instructions)
+        self._set(key, memories, generation)
+        return memories
+
+    async def aload(self, store: BaseStore, todo_category: str, user_id: str, include_archived: bool = False) -> Memories:
+        """Load the memories of a user, fetching the three namespaces concurrently on a miss.
+        """
+        key = (todo_category, user_id, include_archived)
+        memories, generation = self._get(key)
+        if memories is not None:
+            return memories
+
+        namespaces = memory_namespaces(todo_category, user_id)
+        todo_search = _todo_search(namespaces["todo"], include_archived)
+        profile, todos, instructions = await asyncio.gather(
+            store.asearch(namespaces["profile"]),
+            store.asearch(namespaces["todo"], **_search_args(todo_search)),
+            store.asearch(namespaces["instructions"]),
+        )
+        todos = await _aread_pages(
+            lambda offset: store.asearch(namespaces["todo"], **_search_args(_todo_search(namespaces["todo"], include_archived, offset))),
+            todos,
+        )
+
+        memories = Memories(profile=profile, todos=todos, instructions=instructions)
+        self._set(key, memories, generation)
+        return memories
+
+
+def todos_due(store: BaseStore, todo_category: str, user_id: str, start: datetime, end: datetime) -> list[Item]:
+    """The user's open ToDos with a deadline in `[start, end)`, earliest first, e.g. what's due this week.
+
+    With an `IndexedInMemoryStore` the deadline range runs in the store's index. Other stores don't
+    compare ISO strings as datetimes (InMemoryStore casts range bounds to float), so there the open
+    ToDos are read and their deadlines compared here.
+    """
+    namespace = memory_namespaces(todo_category, user_id)["todo"]
+    if isinstance(store, IndexedInMemoryStore):
+        due_filter = {**ACTIVE_TODOS, "deadline": {"$gte": start.isoformat(), "$lt": end.isoformat()}}
+        due = _read_pages(lambda offset: store.search(namespace, filter=due_filter, limit=TODO_PAGE_SIZE, offset=offset))
+    else:
+        start, end = _sort_key(start), _sort_key(end)
+        todos = _read_pages(lambda offset: store.search(namespace, filter=ACTIVE_TODOS, limit=TODO_PAGE_SIZE, offset=offset))
+        due = [item for item in todos if _rangeable(item.value.get("deadline")) and start <= _sort_key(item.value["deadline"]) < end]
+    return sorted(due, key=lambda item: (_sort_key(item.value["deadline"]), item.key))
+
+
+def relevant_todos(store: BaseStore, todo_category: str, user_id: str, query: str, k: int, include_archived: bool = False) -> list[Item]:
+    """The user's `k` ToDos most relevant to `query`, most relevant first.
+
+    Relevance is ranked by the store's semantic index, such as `VectorInMemoryStore` or a store
+    configured with an `index`; without one, the store returns `k` ToDos in its own order.
+    """
+    namespace = memory_namespaces(todo_category, user_id)["todo"]
+    return store.search(namespace, query=query, filter=None if include_archived else ACTIVE_TODOS, limit=k)
+
+
+async def arelevant_todos(store: BaseStore, todo_category: str, user_id: str, query: str, k: int, include_archived: bool = False) -> list[Item]:
+    """Async version of `relevant_todos`.
+    """
+    namespace = memory_namespaces(todo_category, user_id)["todo"]
+    return await store.asearch(namespace, query=query, filter=None if include_archived else ACTIVE_TODOS, limit=k)
+
+
+def content_hash(value: dict[str, Any]) -> str:
+    """Hash a memory document independently of its key order.
+    """
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def changed_documents(result: dict[str, Any], existing_items: Sequence[Item]) -> list[tuple[str, dict[str, Any]]]:
+    """Return the `(key, value)` pairs of a trustcall result that differ from what is already stored.
+
+    Documents the extractor left untouched come back with the same content, so writing them again
+    is skipped.
+    """
+    existing_hashes = {item.key: content_hash(item.value) for item in existing_items}
+    changed = []
+    for r, rmeta in zip(result["responses"], result["response_metadata"]):
+        key = rmeta.get("json_doc_id", str(uuid.uuid4()))
+        value = r.model_dump(mode="json")
+        if existing_hashes.get(key) != content_hash(value):
+            changed.append((key, value))
+    return changed
+
+
+_WORD = re.compile(r"[a-z0-9]{3,}")
+
+
+def _keywords(text: str) -> set[str]:
+    return set(_WORD.findall(text.lower()))
+
+
+def select_working_set(todos: Sequence[Item], messages: Sequence[AnyMessage], size: int, window: int = 4) -> list[Item]:
+    """Pick the ToDos whose `task` shares the most keywords with the latest messages.
+
+    At most `size` ToDos are returned, and ToDos sharing no keyword at all are left out, so only
+    the part of a long ToDo list the conversation is about is sent to the extractor.
+    """
+    recent = " ".join(m.content for m in messages[-window:] if isinstance(m.content, str))
+    keywords = _keywords(recent)
+    scored = [(len(keywords & _keywords(item.value.get("task", ""))), i) for i, item in enumerate(todos)]
+    relevant = sorted((s for s in scored if s[0] > 0), key=lambda s: (-s[0], s[1]))[:size]
+    return [todos[i] for _, i in relevant]
+
+
+class WriteStats:
+    """Running totals of the store writes made by the memory update nodes.
+
+    `turns` counts the updates that wrote something, so the per-turn figures are those of a write;
+    updates that found nothing changed are counted in `skipped`.
+    """
+
+    def __init__(self):
+        self.turns = 0
+        self.skipped = 0
+        self.ops = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def record(self, ops: Sequence[PutOp]) -> None:
+        if not ops:
+            with self._lock:
+                self.skipped += 1
+            return
+        size = sum(len(json.dumps(op.value, default=str)) for op in ops if op.value is not None)
+        with self._lock:
+            self.turns += 1
+            self.ops += len(ops)
+            self.bytes += size
+        logger.debug("memory write: %d ops, %d bytes", len(ops), size)
+
+    @property
+    def ops_per_turn(self) -> float:
+        return self.ops / self.turns if self.turns else 0.0
+
+    @property
+    def bytes_per_turn(self) -> float:
+        return self.bytes / self.turns if self.turns else 0.0
+
+
+def write_documents(store: BaseStore, namespace: tuple[str, ...], documents: Sequence[tuple[str, dict[str, Any]]], stats: WriteStats) -> None:
+    """Write all the documents of one update as a single store batch.
+    """
+    ops = [PutOp(namespace, key, value) for key, value in documents]
+    stats.record(ops)
+    if ops:
+        store.batch(ops)
+
+
+async def awrite_documents(store: BaseStore, namespace: tuple[str, ...], documents: Sequence[tuple[str, dict[str, Any]]], stats: WriteStats) -> None:
+    """Async version of `write_documents`.
+    """
+    ops = [PutOp(namespace, key, value) for key, value in documents]
+    stats.record(ops)
+    if ops:
+        await store.abatch(ops)
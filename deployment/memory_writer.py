@@ -0,0 +1,68 @@
+import logging
+import threading
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Hashable, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryWriter:
+    """Background queue that runs memory extraction jobs after the user already got a response.
+
+    Jobs are queued per user and a user's jobs run one at a time, in the order they were submitted,
+    on a shared worker pool. A job submitted while another job of the same kind is still waiting
+    for the same thread of the same user replaces it, since the newer one sees that thread plus the
+    latest messages; jobs of other threads only see their own messages, so they are all kept.
+    `wait` blocks until every job of a user is done, so a new turn can be made to read only memories
+    that include what the previous turns wrote.
+    """
+
+    def __init__(self, max_workers: int = 4):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="memory-writer")
+        # [user][(thread, kind)] -> job, in submission order
+        self._pending: dict[Hashable, OrderedDict[tuple[Hashable, Hashable], Callable[[], Any]]] = {}
+        self._running: set[Hashable] = set()
+        self._idle = threading.Condition()
+        self.submitted = 0
+        self.merged = 0
+        self.failed = 0
+
+    def submit(self, user: Hashable, thread: Hashable, kind: Hashable, job: Callable[[], Any]) -> None:
+        with self._idle:
+            self.submitted += 1
+            pending = self._pending.setdefault(user, OrderedDict())
+            if (thread, kind) in pending:
+                self.merged += 1
+            pending[(thread, kind)] = job
+            if user not in self._running:
+                self._running.add(user)
+                self._executor.submit(self._drain, user)
+
+    def _drain(self, user: Hashable) -> None:
+        while True:
+            with self._idle:
+                pending = self._pending.get(user)
+                if not pending:
+                    self._pending.pop(user, None)
+                    self._running.discard(user)
+                    self._idle.notify_all()
+                    return
+                (thread, kind), job = pending.popitem(last=False)
+            try:
+                job()
+            except Exception:
+                with self._idle:
+                    self.failed += 1
+                logger.exception("background memory update %r for %r in thread %r failed", kind, user, thread)
+
+    def wait(self, user: Hashable, timeout: Optional[float] = None) -> bool:
+        """Block until every job of `user` has run; returns False if `timeout` ran out first.
+        """
+        with self._idle:
+            return self._idle.wait_for(lambda: user not in self._running, timeout=timeout)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,93 @@
+import logging
+import re
+import threading
+
+from typing import Optional
+
+
+logger = logging.getLogger(__name__)
+
+# the outcome for small talk, which the model answers without being able to update any memory
+NO_UPDATE = "none"
+
+# the message opens with a phrase that, on its own, tells us which memory it should update
+PATTERNS = {
+    "todo": re.compile(
+        r"^(please )?(remind me to|add .+ to my (todo|to-do|to do|task) list|put .+ on my (todo|to-do|to do|task) list"
+        r"|mark .+ as (done|complete|completed|archived))\b"
+    ),
+    "user": re.compile(r"^(my name is|i live in|i'm from|i am from|i work as an?|i work at)\b"),
+    "instructions": re.compile(
+        r"^(from now on|whenever you (add|create|update)|when you (add|create|update) (a )?(todo|task)s?"
+        r"|always (add|include|set)|never (add|include|set))\b"
+    ),
+}
+
+# words that hint at a kind of memory anywhere in a message; a message opening with one kind that
+# also mentions another one asks for mixed updates, which the model sorts out
+MENTIONS = {
+    "todo": re.compile(r"\b(remind|todo|to-do|to do|task|deadline|due|need to|have to)\b"),
+    "user": re.compile(r"\b(my name|i live|i'm from|i am from|i work|my (wife|husband|partner|son|daughter|kids?|mom|dad|boss))\b"),
+    "instructions": re.compile(r"\b(from now on|whenever|always|never)\b"),
+}
+
+SMALL_TALK = re.compile(
+    r"^(hi|hello|hey|thanks|thank you|thx|ok|okay|got it|great|cool|nice|bye|goodbye|good (morning|afternoon|evening|night))"
+    r"( there| so much| a lot)?[\s!.]*$"
+)
+
+# a question asks for an answer, even one that sounds like an update ("do I have to pay the bill?")
+QUESTION = re.compile(
+    r"\?|^(what|when|where|who|whom|why|how|which|do|does|did|is|are|am|was|were|can|could|would|will|should|shall|have|has|may)\b"
+)
+
+
+class FastPathClassifier:
+    """Rule-based guess of which memory a user message should update, in front of the routing model call.
+
+    A message is only classified when several cues agree: it opens with a phrase of exactly one kind
+    of memory, it isn't a question, it doesn't mention another kind of memory, and it is at most
+    `max_words` long. Small talk ("thanks!") is classified as NO_UPDATE. Anything else makes `classify`
+    return None and the full model decides. `hits` and `fallbacks` count both outcomes.
+    """
+
+    def __init__(self, patterns: dict[str, re.Pattern] = PATTERNS, mentions: dict[str, re.Pattern] = MENTIONS, max_words: int = 40):
+        self.patterns = patterns
+        self.mentions = mentions
+        self.max_words = max_words
+        self.hits: dict[str, int] = {update_type: 0 for update_type in [*patterns, NO_UPDATE]}
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+
+    def decide(self, text: str) -> Optional[str]:
+        """The outcome for `text` without counting it: an update type, NO_UPDATE, or None for the model to decide.
+        """
+        text = " ".join(text.lower().split())
+        if SMALL_TALK.match(text):
+            return NO_UPDATE
+        if QUESTION.search(text) or len(text.split()) > self.max_words:
+            return None
+        matches = [update_type for update_type, pattern in self.patterns.items() if pattern.match(text)]
+        if len(matches) != 1:
+            return None
+        # instructions are about ToDos, so only a mention of the profile makes them mixed
+        others = [t for t in self.mentions if t != matches[0] and not (matches[0] == "instructions" and t == "todo")]
+        if any(self.mentions[update_type].search(text) for update_type in others):
+            return None
+        return matches[0]
+
+    def classify(self, text: str) -> Optional[str]:
+        outcome = self.decide(text)
+        with self._lock:
+            if outcome is None:
+                self.fallbacks += 1
+            else:
+                self.hits[outcome] += 1
+        if outcome is not None:
+            logger.debug("fast path routed to %s", outcome)
+        return outcome
+
+    @property
+    def hit_rate(self) -> float:
+        hits = sum(self.hits.values())
+        return hits / (hits + self.fallbacks) if hits + self.fallbacks else 0.0
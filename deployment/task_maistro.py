@@ -1,20 +1,29 @@
 import uuid
 
 from datetime import datetime
+from functools import lru_cache, partial
 from pydantic import BaseModel, Field
-from trustcall import create_extractor
-from typing import Literal, Optional, TypedDict
+from typing import Callable, Literal, Optional, TypedDict
 
-from langchain_core.messages import merge_message_runs, HumanMessage, SystemMessage
+from langchain_core.messages import merge_message_runs, AIMessage, HumanMessage, SystemMessage
 from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables.config import run_in_executor
 
 from langchain_openai import ChatOpenAI
 
+from langgraph.constants import Send
 from langgraph.graph import END, START, StateGraph, MessagesState
 from langgraph.store.base import BaseStore
+from langgraph.utils.runnable import RunnableCallable
 
 import configuration
 
+from context import PrefixStats, TokenCounter, window_messages
+from extractors import get_extractor, get_tool_model
+from memory import Memories, MemoryCache, WriteStats, arelevant_todos, awrite_documents, changed_documents, relevant_todos, select_working_set, write_documents
+from memory_writer import MemoryWriter
+from router import NO_UPDATE, FastPathClassifier
+
 
 class Spy:
     def __init__(self):
@@ -122,34 +131,35 @@ class UpdateMemory(TypedDict):
 
 model = ChatOpenAI(model="gpt-4o", temperature=0)
 
-profile_extractor = create_extractor(
-    model,
-    tools=[Profile],
-    tool_choice="Profile",
-)
-
-MODEL_SYSTEM_MESSAGE = """
-    {task_maistro_role} 
-
+# memories are read on every turn and every loop back from an update node, but only change when an update node writes them
+memory_cache = MemoryCache()
+# every update node writes its documents as one store batch and records how many ops and bytes that was
+write_stats = WriteStats()
+# token counts of thread messages, cached by message id for the extraction token budget
+token_counter = TokenCounter()
+# rule-based routing that skips the task_mAIstro model call for obvious memory updates
+fast_path_classifier = FastPathClassifier()
+# how much of each system message repeats the previous one of the same user, i.e. what a prompt cache can reuse
+prefix_stats = PrefixStats()
+# runs memory updates after the response when `background_memory_writes` is configured
+memory_writer = MemoryWriter()
+
+# extractors and the tool-bound model are built once here instead of on every turn
+profile_extractor = get_extractor(model, Profile, tool_choice="Profile")
+todo_extractor = get_extractor(model, ToDo, tool_choice="ToDo", enable_inserts=True)
+model_with_tools = get_tool_model(model, [UpdateMemory], parallel_tool_calls=False)
+parallel_model_with_tools = get_tool_model(model, [UpdateMemory], parallel_tool_calls=True)
+
+# the system message is assembled from the most to the least stable segment, so consecutive turns share
+# the longest possible prefix for the provider's prompt cache: static instructions, then the assistant's
+# role, then the memories of this turn
+MODEL_SYSTEM_MESSAGE_STATIC = """
     You have a long term memory which keeps track of three things:
     1. The user's profile (general information about them) 
     2. The user's ToDo list
     3. General instructions for updating the ToDo list
 
-    Here is the current User Profile (may be empty if no information has been collected yet):
-    <user_profile>
-    {user_profile}
-    </user_profile>
-
-    Here is the current ToDo List (may be empty if no tasks have been added yet):
-    <todo>
-    {todo}
-    </todo>
-
-    Here are the current user-specified preferences for updating the ToDo list (may be empty if no preferences have been specified yet):
-    <instructions>
-    {instructions}
-    </instructions>
+    The current contents of your long term memory are given at the end of this message.
 
     Here are your instructions for reasoning about the user's messages:
 
@@ -170,6 +180,27 @@ MODEL_SYSTEM_MESSAGE = """
     5. Respond naturally to user user after a tool call was made to save memories, or if no tool call was made.
 """
 
+MODEL_SYSTEM_MESSAGE_ROLE = """
+    {task_maistro_role} 
+"""
+
+MODEL_SYSTEM_MESSAGE_MEMORY = """
+    Here is the current User Profile (may be empty if no information has been collected yet):
+    <user_profile>
+    {user_profile}
+    </user_profile>
+
+    Here is the current ToDo List (may be empty if no tasks have been added yet):
+    <todo>
+    {todo}
+    </todo>
+
+    Here are the current user-specified preferences for updating the ToDo list (may be empty if no preferences have been specified yet):
+    <instructions>
+    {instructions}
+    </instructions>
+"""
+
 TRUSTCALL_INSTRUCTION = """
     Reflect on following interaction. 
 
@@ -192,36 +223,102 @@ CREATE_INSTRUCTIONS = """
     </current_instructions>
 """
 
-def task_mAIstro(state: MessagesState, config: RunnableConfig, store: BaseStore):
-    """Load memories from the store and use them to personalize the chatbot's response.
+@lru_cache(maxsize=128)
+def _system_message_prefix(task_maistro_role: str) -> str:
+    """The static and per-assistant segments of the system message, formatted once per role.
     """
-    
-    configurable = configuration.Configuration.from_runnable_config(config)
-    user_id = configurable.user_id
-    todo_category = configurable.todo_category
-    task_maistro_role = configurable.task_maistro_role
+    return MODEL_SYSTEM_MESSAGE_STATIC + MODEL_SYSTEM_MESSAGE_ROLE.format(task_maistro_role=task_maistro_role)
 
-    namespace = ("profile", todo_category, user_id)
-    memories = store.search(namespace)
-    if memories:
-        user_profile = memories[0].value
+def _system_message(configurable: configuration.Configuration, memories: Memories) -> SystemMessage:
+    if memories.profile:
+        user_profile = memories.profile[0].value
     else:
         user_profile = None
 
-    namespace = ("todo", todo_category, user_id)
-    memories = store.search(namespace)
-    todo = "\n".join(f"{mem.value}" for mem in memories)
+    todo = memories.todo_block(configurable.include_archived_todos)
 
-    namespace = ("instructions", todo_category, user_id)
-    memories = store.search(namespace)
-    if memories:
-        instructions = memories[0].value
+    if memories.instructions:
+        instructions = memories.instructions[0].value
     else:
         instructions = ""
+
+    system_msg = _system_message_prefix(configurable.task_maistro_role) + MODEL_SYSTEM_MESSAGE_MEMORY.format(user_profile=user_profile, todo=todo, instructions=instructions)
+    prefix_stats.record((configurable.todo_category, configurable.user_id), system_msg)
+    return SystemMessage(content=system_msg)
+
+def _history(state: MessagesState, configurable: configuration.Configuration) -> list:
+    """The thread history the update nodes reflect on, cut down to the configured token budget.
+    """
+    history = state["messages"][:-1]
+    if configurable.extraction_token_budget:
+        history = window_messages(history, configurable.extraction_token_budget, token_counter)
+    return history
+
+def _trustcall_messages(state: MessagesState, configurable: configuration.Configuration) -> list:
+    TRUSTCALL_INSTRUCTION_FORMATTED=TRUSTCALL_INSTRUCTION.format(time=datetime.now().isoformat())
+    return list(merge_message_runs(messages=[SystemMessage(content=TRUSTCALL_INSTRUCTION_FORMATTED)] + _history(state, configurable)))
+
+def _existing_memories(existing_items: list, tool_name: str) -> Optional[list]:
+    return (
+        [
+            (existing_item.key, tool_name, existing_item.value)
+            for existing_item in existing_items
+        ]
+        if existing_items
+        else None
+    )
+
+def _instructions_messages(state: MessagesState, configurable: configuration.Configuration, existing_memory) -> list:
+    system_msg = CREATE_INSTRUCTIONS.format(current_instructions=existing_memory.value if existing_memory else None)
+    return [SystemMessage(content=system_msg)]+_history(state, configurable) + [HumanMessage(content="Please update the instructions based on the conversation")]
+
+def _tool_response(state: MessagesState, content: str) -> dict:
+    # a node fanned out to with Send answers every tool call it was sent, otherwise the single tool call made
+    tool_call_ids = state.get("tool_call_ids") or [state['messages'][-1].tool_calls[0]['id']]
+    return {"messages": [{"role": "tool", "content": content, "tool_call_id": tool_call_id} for tool_call_id in tool_call_ids]}
+
+def _latest_request(state: MessagesState) -> str:
+    """The user's latest message, which the relevant ToDos are ranked against.
+    """
+    for message in reversed(state["messages"]):
+        if isinstance(message, HumanMessage) and isinstance(message.content, str):
+            return message.content
+    return ""
+
+def _tool_model(state: MessagesState, configurable: configuration.Configuration):
+    message = state["messages"][-1]
+    if configurable.fast_path_routing and isinstance(message, HumanMessage) and isinstance(message.content, str):
+        # small talk the fast path is sure needs no memory update is answered by the model without tools
+        if fast_path_classifier.decide(message.content) == NO_UPDATE:
+            return model
+    return parallel_model_with_tools if configurable.parallel_updates else model_with_tools
+
+def task_mAIstro(state: MessagesState, config: RunnableConfig, store: BaseStore):
+    """Load memories from the store and use them to personalize the chatbot's response.
+    """
     
-    system_msg = MODEL_SYSTEM_MESSAGE.format(task_maistro_role=task_maistro_role, user_profile=user_profile, todo=todo, instructions=instructions)
+    configurable = configuration.Configuration.from_runnable_config(config)
+    memories = memory_cache.load(store, configurable.todo_category, configurable.user_id, configurable.include_archived_todos)
+    if configurable.relevant_todos_k:
+        # only the ToDos the user is talking about go in the prompt, ranked by the store's semantic index
+        todos = relevant_todos(store, configurable.todo_category, configurable.user_id, _latest_request(state), configurable.relevant_todos_k, configurable.include_archived_todos)
+        memories = Memories(profile=memories.profile, todos=todos, instructions=memories.instructions)
+
+    response = _tool_model(state, configurable).invoke([_system_message(configurable, memories)]+state["messages"])
+
+    return {"messages": [response]}
+
+async def atask_mAIstro(state: MessagesState, config: RunnableConfig, store: BaseStore):
+    """Async version of `task_mAIstro`.
+    """
     
-    response = model.bind_tools([UpdateMemory], parallel_tool_calls=False).invoke([SystemMessage(content=system_msg)]+state["messages"])
+    configurable = configuration.Configuration.from_runnable_config(config)
+    memories = await memory_cache.aload(store, configurable.todo_category, configurable.user_id, configurable.include_archived_todos)
+    if configurable.relevant_todos_k:
+        todos = await arelevant_todos(store, configurable.todo_category, configurable.user_id, _latest_request(state), configurable.relevant_todos_k, configurable.include_archived_todos)
+        memories = Memories(profile=memories.profile, todos=todos, instructions=memories.instructions)
+
+    response = await _tool_model(state, configurable).ainvoke([_system_message(configurable, memories)]+state["messages"])
 
     return {"messages": [response]}
 
@@ -233,31 +330,35 @@ def update_profile(state: MessagesState, config: RunnableConfig, store: BaseStor
     user_id = configurable.user_id
     todo_category = configurable.todo_category
     namespace = ("profile", todo_category, user_id)
-    existing_items = store.search(namespace)
+    existing_items = memory_cache.load(store, todo_category, user_id, configurable.include_archived_todos).profile
 
-    tool_name = "Profile"
-    existing_memories = (
-        [
-            (existing_item.key, tool_name, existing_item.value)
-            for existing_item in existing_items
-        ]
-        if existing_items
-        else None
-    )
+    result = profile_extractor.invoke({"messages": _trustcall_messages(state, configurable), 
+                                         "existing": _existing_memories(existing_items, "Profile")})
 
-    TRUSTCALL_INSTRUCTION_FORMATTED=TRUSTCALL_INSTRUCTION.format(time=datetime.now().isoformat())
-    updated_messages=list(merge_message_runs(messages=[SystemMessage(content=TRUSTCALL_INSTRUCTION_FORMATTED)] + state["messages"][:-1]))
+    changed = changed_documents(result, existing_items)
+    write_documents(store, namespace, changed, write_stats)
+    if changed:
+        memory_cache.invalidate(todo_category, user_id)
+    return _tool_response(state, "updated profile")
 
-    result = profile_extractor.invoke({"messages": updated_messages, 
-                                         "existing": existing_memories})
+async def aupdate_profile(state: MessagesState, config: RunnableConfig, store: BaseStore):
+    """Async version of `update_profile`.
+    """
+    
+    configurable = configuration.Configuration.from_runnable_config(config)
+    user_id = configurable.user_id
+    todo_category = configurable.todo_category
+    namespace = ("profile", todo_category, user_id)
+    existing_items = (await memory_cache.aload(store, todo_category, user_id, configurable.include_archived_todos)).profile
 
-    for r, rmeta in zip(result["responses"], result["response_metadata"]):
-        store.put(namespace,
-                  rmeta.get("json_doc_id", str(uuid.uuid4())),
-                  r.model_dump(mode="json"),
-            )
-    tool_calls = state['messages'][-1].tool_calls
-    return {"messages": [{"role": "tool", "content": "updated profile", "tool_call_id":tool_calls[0]['id']}]}
+    result = await profile_extractor.ainvoke({"messages": _trustcall_messages(state, configurable), 
+                                                "existing": _existing_memories(existing_items, "Profile")})
+
+    changed = changed_documents(result, existing_items)
+    await awrite_documents(store, namespace, changed, write_stats)
+    if changed:
+        memory_cache.invalidate(todo_category, user_id)
+    return _tool_response(state, "updated profile")
 
 def update_todos(state: MessagesState, config: RunnableConfig, store: BaseStore):
     """Reflect on the chat history and update the memory collection.
@@ -267,48 +368,57 @@ def update_todos(state: MessagesState, config: RunnableConfig, store: BaseStore)
     user_id = configurable.user_id
     todo_category = configurable.todo_category
     namespace = ("todo", todo_category, user_id)
-    existing_items = store.search(namespace)
+    existing_items = memory_cache.load(store, todo_category, user_id, configurable.include_archived_todos).todos
+    if configurable.todo_working_set_size:
+        existing_items = select_working_set(existing_items, state["messages"][:-1], configurable.todo_working_set_size)
 
     tool_name = "ToDo"
-    existing_memories = (
-        [
-            (existing_item.key, tool_name, existing_item.value)
-            for existing_item in existing_items
-        ]
-        if existing_items
-        else None
+    spy = Spy()
+
+    result = todo_extractor.with_listeners(on_end=spy).invoke(
+        {
+            "messages": _trustcall_messages(state, configurable), 
+            "existing": _existing_memories(existing_items, tool_name)
+        }
     )
 
-    TRUSTCALL_INSTRUCTION_FORMATTED=TRUSTCALL_INSTRUCTION.format(time=datetime.now().isoformat())
-    updated_messages=list(merge_message_runs(messages=[SystemMessage(content=TRUSTCALL_INSTRUCTION_FORMATTED)] + state["messages"][:-1]))
+    changed = changed_documents(result, existing_items)
+    write_documents(store, namespace, changed, write_stats)
+    if changed:
+        memory_cache.invalidate(todo_category, user_id)
 
-    spy = Spy()
+    todo_update_msg = extract_tool_info(spy.called_tools, tool_name)
+    return _tool_response(state, todo_update_msg)
+
+async def aupdate_todos(state: MessagesState, config: RunnableConfig, store: BaseStore):
+    """Async version of `update_todos`.
+    """
     
-    todo_extractor = create_extractor(
-        model,
-        tools=[ToDo],
-        tool_choice=tool_name,
-        enable_inserts=True
-    ).with_listeners(on_end=spy)
-
-    result = todo_extractor.invoke(
+    configurable = configuration.Configuration.from_runnable_config(config)
+    user_id = configurable.user_id
+    todo_category = configurable.todo_category
+    namespace = ("todo", todo_category, user_id)
+    existing_items = (await memory_cache.aload(store, todo_category, user_id, configurable.include_archived_todos)).todos
+    if configurable.todo_working_set_size:
+        existing_items = select_working_set(existing_items, state["messages"][:-1], configurable.todo_working_set_size)
+
+    tool_name = "ToDo"
+    spy = Spy()
+
+    result = await todo_extractor.with_listeners(on_end=spy).ainvoke(
         {
-            "messages": updated_messages, 
-            "existing": existing_memories
+            "messages": _trustcall_messages(state, configurable), 
+            "existing": _existing_memories(existing_items, tool_name)
         }
     )
 
-    for r, rmeta in zip(result["responses"], result["response_metadata"]):
-        store.put(
-            namespace,
-            rmeta.get("json_doc_id", str(uuid.uuid4())),
-            r.model_dump(mode="json"),
-        )
-        
-    tool_calls = state['messages'][-1].tool_calls
+    changed = changed_documents(result, existing_items)
+    await awrite_documents(store, namespace, changed, write_stats)
+    if changed:
+        memory_cache.invalidate(todo_category, user_id)
 
     todo_update_msg = extract_tool_info(spy.called_tools, tool_name)
-    return {"messages": [{"role": "tool", "content": todo_update_msg, "tool_call_id": tool_calls[0]['id']}]}
+    return _tool_response(state, todo_update_msg)
 
 def update_instructions(state: MessagesState, config: RunnableConfig, store: BaseStore):
     """Reflect on the chat history and update the memory collection.
@@ -321,22 +431,133 @@ def update_instructions(state: MessagesState, config: RunnableConfig, store: Bas
     namespace = ("instructions", todo_category, user_id)
 
     existing_memory = store.get(namespace, "user_instructions")
-        
-    system_msg = CREATE_INSTRUCTIONS.format(current_instructions=existing_memory.value if existing_memory else None)
-    new_memory = model.invoke([SystemMessage(content=system_msg)]+state['messages'][:-1] + [HumanMessage(content="Please update the instructions based on the conversation")])
+    new_memory = model.invoke(_instructions_messages(state, configurable, existing_memory))
 
     key = "user_instructions"
-    store.put(namespace, key, {"memory": new_memory.content})
-    tool_calls = state['messages'][-1].tool_calls
+    write_documents(store, namespace, [(key, {"memory": new_memory.content})], write_stats)
+    memory_cache.invalidate(todo_category, user_id)
+
+    return _tool_response(state, "updated instructions")
+
+async def aupdate_instructions(state: MessagesState, config: RunnableConfig, store: BaseStore):
+    """Async version of `update_instructions`.
+    """
+    
+    configurable = configuration.Configuration.from_runnable_config(config)
+    user_id = configurable.user_id
+    todo_category = configurable.todo_category
+    
+    namespace = ("instructions", todo_category, user_id)
+
+    existing_memory = await store.aget(namespace, "user_instructions")
+    new_memory = await model.ainvoke(_instructions_messages(state, configurable, existing_memory))
+
+    key = "user_instructions"
+    await awrite_documents(store, namespace, [(key, {"memory": new_memory.content})], write_stats)
+    memory_cache.invalidate(todo_category, user_id)
+
+    return _tool_response(state, "updated instructions")
+
+def node(func: Callable, afunc: Callable) -> RunnableCallable:
+    """Make a graph node that runs `func` when the graph is invoked synchronously.
+
+    When the graph runs asynchronously (as it does under the LangGraph API server), the node awaits
+    `afunc` if `async_nodes` is configured, and otherwise runs `func` in a worker thread as LangGraph
+    does for plain sync nodes.
+    """
 
-    return {"messages": [{"role": "tool", "content": "updated instructions", "tool_call_id":tool_calls[0]['id']}]}
+    async def dispatch(state: MessagesState, config: RunnableConfig, store: BaseStore):
+        if configuration.Configuration.from_runnable_config(config).async_nodes:
+            return await afunc(state, config, store)
+        return await run_in_executor(config, func, state, config, store)
 
-def route_message(state: MessagesState, config: RunnableConfig, store: BaseStore) -> Literal[END, "update_todos", "update_instructions", "update_profile"]:
+    return RunnableCallable(func, dispatch, name=func.__name__)
+
+def classify_message(state: MessagesState, config: RunnableConfig):
+    """Route obvious memory updates without asking the model, when `fast_path_routing` is configured.
+
+    A confident guess is recorded as an UpdateMemory tool call, so the update node answers it as if
+    the model had made it. Otherwise nothing is written and `task_mAIstro` decides as usual.
+
+    Every turn starts here, whatever route it then takes, so this is also where a turn waits for
+    the background memory writes of the previous turns.
+    """
+
+    configurable = configuration.Configuration.from_runnable_config(config)
+    if configurable.background_memory_writes:
+        memory_writer.wait((configurable.todo_category, configurable.user_id))
+    message = state["messages"][-1]
+    if not configurable.fast_path_routing or not isinstance(message, HumanMessage) or not isinstance(message.content, str):
+        return {}
+
+    update_type = fast_path_classifier.classify(message.content)
+    if update_type is None or update_type == NO_UPDATE:
+        # task_mAIstro answers small talk without the UpdateMemory tool, see `_tool_model`
+        return {}
+
+    tool_call = {"name": "UpdateMemory", "args": {"update_type": update_type}, "id": f"fast_path_{uuid.uuid4()}"}
+    return {"messages": [AIMessage(content="", tool_calls=[tool_call])]}
+
+def route_classified(state: MessagesState, config: RunnableConfig, store: BaseStore) -> Literal["task_mAIstro", "update_todos", "update_instructions", "update_profile", "schedule_memory_updates"]:
+    """Go straight to the update node the fast path picked, or to `task_mAIstro` if it didn't pick one."""
+    if isinstance(state["messages"][-1], AIMessage):
+        return route_message(state, config, store)
+    return "task_mAIstro"
+
+UPDATE_NODES = {"user": "update_profile", "todo": "update_todos", "instructions": "update_instructions"}
+UPDATE_FUNCTIONS = {"user": update_profile, "todo": update_todos, "instructions": update_instructions}
+
+def _tool_calls_by_type(state: MessagesState) -> dict[str, list[str]]:
+    tool_call_ids: dict[str, list[str]] = {}
+    for tool_call in state['messages'][-1].tool_calls:
+        update_type = tool_call['args']['update_type']
+        if update_type not in UPDATE_NODES:
+            raise ValueError
+        tool_call_ids.setdefault(update_type, []).append(tool_call['id'])
+    return tool_call_ids
+
+def fan_out_updates(state: MessagesState) -> list[Send]:
+    """Send every kind of memory update the model asked for to its node, so they run concurrently.
+
+    Tool calls for the same kind of memory are grouped so each update node runs once and answers all of them.
+    The tool messages of all nodes are merged by `add_messages` before `task_mAIstro` responds once.
+    """
+    return [
+        Send(UPDATE_NODES[update_type], {"messages": state["messages"], "tool_call_ids": ids})
+        for update_type, ids in _tool_calls_by_type(state).items()
+    ]
+
+def schedule_memory_updates(state: MessagesState, config: RunnableConfig, store: BaseStore):
+    """Hand the memory updates the model asked for to the background memory writer and answer the tool calls right away.
+
+    The update nodes then run on the writer's workers with a snapshot of the thread, while `task_mAIstro`
+    already responds to the user.
+    """
+
+    configurable = configuration.Configuration.from_runnable_config(config)
+    user = (configurable.todo_category, configurable.user_id)
+    # only what Configuration reads is kept, the rest of the config belongs to this run
+    job_config = {"configurable": {k: v for k, v in config["configurable"].items() if not k.startswith("__")}}
+
+    messages = []
+    for update_type, ids in _tool_calls_by_type(state).items():
+        job_state = {"messages": list(state["messages"]), "tool_call_ids": ids}
+        update = UPDATE_FUNCTIONS[update_type]
+        memory_writer.submit(user, config["configurable"].get("thread_id"), update_type, partial(update, job_state, job_config, store))
+        messages.extend({"role": "tool", "content": f"{update_type} memory update scheduled", "tool_call_id": i} for i in ids)
+    return {"messages": messages}
+
+def route_message(state: MessagesState, config: RunnableConfig, store: BaseStore) -> Literal[END, "update_todos", "update_instructions", "update_profile", "schedule_memory_updates"]:
 
     """Reflect on the memories and chat history to decide whether to update the memory collection."""
     message = state['messages'][-1]
+    configurable = configuration.Configuration.from_runnable_config(config)
     if len(message.tool_calls) ==0:
         return END
+    elif configurable.background_memory_writes:
+        return "schedule_memory_updates"
+    elif configurable.parallel_updates:
+        return fan_out_updates(state)
     else:
         tool_call = message.tool_calls[0]
         if tool_call['args']['update_type'] == "user":
@@ -350,15 +571,19 @@ def route_message(state: MessagesState, config: RunnableConfig, store: BaseStore
 
 graph = StateGraph(MessagesState, config_schema=configuration.Configuration)
 
-graph.add_node(task_mAIstro)
-graph.add_node(update_todos)
-graph.add_node(update_profile)
-graph.add_node(update_instructions)
+graph.add_node(classify_message)
+graph.add_node("task_mAIstro", node(task_mAIstro, atask_mAIstro))
+graph.add_node("update_todos", node(update_todos, aupdate_todos))
+graph.add_node("update_profile", node(update_profile, aupdate_profile))
+graph.add_node("update_instructions", node(update_instructions, aupdate_instructions))
+graph.add_node(schedule_memory_updates)
 
-graph.add_edge(START, "task_mAIstro")
+graph.add_edge(START, "classify_message")
+graph.add_conditional_edges("classify_message", route_classified)
 graph.add_conditional_edges("task_mAIstro", route_message)
 graph.add_edge("update_todos", "task_mAIstro")
 graph.add_edge("update_profile", "task_mAIstro")
 graph.add_edge("update_instructions", "task_mAIstro")
+graph.add_edge("schedule_memory_updates", "task_mAIstro")
 
 graph = graph.compile()
\ No newline at end of file
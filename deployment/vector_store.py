@@ -0,0 +1,231 @@
+import asyncio
+import re
+import zlib
+
+from typing import Any, Iterable, Optional
+
+import numpy as np
+
+from langchain_core.embeddings import Embeddings
+from langgraph.store.base import IndexConfig, Op, PutOp, Result, SearchItem, SearchOp
+from langgraph.store.memory import InMemoryStore, _compare_values
+
+
+_WORD = re.compile(r"[a-z0-9]{3,}")
+
+
+class HashingEmbeddings(Embeddings):
+    """Deterministic local embedder: every word of a text is hashed into one of `dims` buckets.
+
+    Texts that share words get similar vectors, so relevance ranking can be tried and benchmarked
+    offline, without an embedding API or a model download.
+
+        store = VectorInMemoryStore(index={"dims": 256, "embed": HashingEmbeddings(256), "fields": ["task"]})
+    """
+
+    def __init__(self, dims: int = 256):
+        self.dims = dims
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        vectors = np.zeros((len(texts), self.dims), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in _WORD.findall(text.lower()):
+                h = zlib.crc32(word.encode())
+                # the top bit picks the sign, so unrelated words cancel out instead of piling up
+                vectors[i, h % self.dims] += 1.0 if h >> 31 else -1.0
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+
+class _VectorIndex:
+    """Unit-length vectors of one namespace in a single matrix, one row per `(key, path)`.
+
+    Rows are appended in place (the matrix doubles when full) and a removed row is filled with
+    the last one, so the first `len(ids)` rows are always the live vectors.
+    """
+
+    def __init__(self, dims: int):
+        self.vectors = np.empty((16, dims), dtype=np.float32)
+        self.ids: list[tuple[str, str]] = []
+        self.rows: dict[tuple[str, str], int] = {}
+        # key -> paths of that key that have a vector
+        self.paths: dict[str, set[str]] = {}
+
+    def set(self, key: str, path: str, vector: Any) -> None:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if (key, path) not in self.rows:
+            if len(self.ids) == len(self.vectors):
+                self.vectors = np.concatenate([self.vectors, np.empty_like(self.vectors)])
+            self.rows[(key, path)] = len(self.ids)
+            self.ids.append((key, path))
+            self.paths.setdefault(key, set()).add(path)
+        self.vectors[self.rows[(key, path)]] = vector / norm if norm else vector
+
+    def remove(self, key: str, path: str) -> None:
+        row = self.rows.pop((key, path))
+        last = self.ids.pop()
+        if last != (key, path):
+            self.vectors[row] = self.vectors[len(self.ids)]
+            self.ids[row] = last
+            self.rows[last] = row
+        self.paths[key].discard(path)
+        if not self.paths[key]:
+            del self.paths[key]
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        return self.vectors[: len(self.ids)] @ query
+
+
+class VectorInMemoryStore(InMemoryStore):
+    """InMemoryStore whose semantic search (`store.search(namespace, query=...)`) ranks with NumPy.
+
+    InMemoryStore keeps vectors as Python lists and turns every candidate into an array on every
+    search, then sorts all of them. Here each namespace keeps its vectors normalized in one matrix
+    that puts update in place, and a search is one matrix-vector product and a partial sort for the
+    top `offset + limit`. Filters are only checked on the best-scoring items, until enough match.
+
+    Puts are embedded in batches of `embed_batch_size` texts, and a text that is already embedded at
+    the same path isn't embedded again, so writing back a ToDo whose `task` didn't change costs no
+    embedding call. `embedded` and `reused` count both. With `HashingEmbeddings` it runs offline.
+
+        store = VectorInMemoryStore(index={"dims": 1536, "embed": "openai:text-embedding-3-small", "fields": ["task"]})
+        store.search(("todo", "general", user_id), query="groceries for the party", limit=5)
+    """
+
+    def __init__(self, *, index: IndexConfig, embed_batch_size: int = 256, **kwargs: Any) -> None:
+        super().__init__(index=index, **kwargs)
+        self.embed_batch_size = embed_batch_size
+        self._indexes: dict[tuple[str, ...], _VectorIndex] = {}
+        # (namespace, key, path) -> the text its vector was embedded from
+        self._texts: dict[tuple[tuple[str, ...], str, str], str] = {}
+        self.embedded = 0
+        self.reused = 0
+
+    def batch(self, ops: Iterable[Op]) -> list[Result]:
+        results, put_ops, search_ops = self._prepare_ops(ops)
+        if search_ops:
+            queries = self._embed_search_queries(search_ops)
+            self._batch_search(search_ops, queries, results)
+        to_embed, texts = self._texts_to_embed(put_ops)
+        vectors = []
+        for i in range(0, len(texts), self.embed_batch_size):
+            vectors.extend(self.embeddings.embed_documents(texts[i : i + self.embed_batch_size]))
+        self._insert_vectors(to_embed, texts, vectors)
+        self._apply_put_ops(put_ops)
+        return results
+
+    async def abatch(self, ops: Iterable[Op]) -> list[Result]:
+        results, put_ops, search_ops = self._prepare_ops(ops)
+        if search_ops:
+            queries = await self._aembed_search_queries(search_ops)
+            self._batch_search(search_ops, queries, results)
+        to_embed, texts = self._texts_to_embed(put_ops)
+        chunks = await asyncio.gather(*(
+            self.embeddings.aembed_documents(texts[i : i + self.embed_batch_size])
+            for i in range(0, len(texts), self.embed_batch_size)
+        ))
+        self._insert_vectors(to_embed, texts, [vector for chunk in chunks for vector in chunk])
+        self._apply_put_ops(put_ops)
+        return results
+
+    def _texts_to_embed(self, put_ops: dict[tuple[tuple[str, ...], str], PutOp]) -> tuple[dict[str, list], list[str]]:
+        """Drop the vectors the puts replace, and return the texts to index and which of them need embedding.
+        """
+        to_embed = self._extract_texts(put_ops)
+        kept = {(namespace, key, path) for ids in to_embed.values() for namespace, key, path in ids}
+        for namespace, key in put_ops:
+            index = self._indexes.get(namespace)
+            for path in list(index.paths.get(key, ())) if index else ():
+                if (namespace, key, path) not in kept:
+                    index.remove(key, path)
+                    del self._texts[(namespace, key, path)]
+        texts = [text for text, ids in to_embed.items() if any(self._texts.get(id) != text for id in ids)]
+        self.embedded += len(texts)
+        self.reused += len(to_embed) - len(texts)
+        return to_embed, texts
+
+    def _insert_vectors(self, to_embed: dict[str, list], texts: list[str], vectors: list[list[float]]) -> None:
+        if len(vectors) != len(texts):
+            raise ValueError(f"Got {len(vectors)} embeddings for {len(texts)} texts")
+        # a text used by several items or paths is embedded once and indexed for each of them
+        for text, vector in zip(texts, vectors):
+            for namespace, key, path in to_embed[text]:
+                if namespace not in self._indexes:
+                    self._indexes[namespace] = _VectorIndex(len(vector))
+                self._indexes[namespace].set(key, path, vector)
+                self._texts[(namespace, key, path)] = text
+
+    def _filter_items(self, op: SearchOp) -> list:
+        # semantic searches pick their candidates from the vector indexes instead
+        if op.query and self.embeddings:
+            return []
+        return super()._filter_items(op)
+
+    def _batch_search(self, ops: dict[int, tuple[SearchOp, list]], queries: dict[str, list[float]], results: list[Result]) -> None:
+        rest = {}
+        for i, (op, candidates) in ops.items():
+            if op.query and self.embeddings:
+                results[i] = self._vector_search(op, np.asarray(queries[op.query], dtype=np.float32))
+            else:
+                rest[i] = (op, candidates)
+        super()._batch_search(rest, queries, results)
+
+    def _matches(self, value: dict[str, Any], filter: Optional[dict[str, Any]]) -> bool:
+        return not filter or all(_compare_values(value.get(k), condition) for k, condition in filter.items())
+
+    def _vector_search(self, op: SearchOp, query: np.ndarray) -> list[SearchItem]:
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        wanted = op.offset + op.limit
+        if not wanted:
+            return []
+        prefix = op.namespace_prefix
+        hits: list[tuple[float, tuple[str, ...], str]] = []
+        for namespace, items in self._data.items():
+            if namespace[: len(prefix)] != prefix or not (index := self._indexes.get(namespace)) or not index.ids:
+                continue
+            scores = index.scores(query)
+            found: dict[str, float] = {}
+            k = min(wanted, len(scores))
+            while True:
+                # the k best rows, best first; rows of keys already found or filtered out are skipped
+                top = np.argpartition(-scores, k - 1)[:k]
+                for row in top[np.argsort(-scores[top], kind="stable")]:
+                    key = index.ids[row][0]
+                    if key not in found and self._matches(items[key].value, op.filter):
+                        found[key] = float(scores[row])
+                        if len(found) == wanted:
+                            break
+                if len(found) == wanted or k == len(scores):
+                    break
+                found.clear()
+                k = min(2 * k, len(scores))
+            hits.extend((score, namespace, key) for key, score in found.items())
+        hits.sort(key=lambda hit: -hit[0])
+        kept = [(score, self._data[namespace][key]) for score, namespace, key in hits[op.offset : wanted]]
+        if len(kept) < op.limit:
+            # like InMemoryStore, fill up with items that have nothing to embed, unscored
+            for namespace, items in self._data.items():
+                if namespace[: len(prefix)] != prefix:
+                    continue
+                index = self._indexes.get(namespace)
+                for key, item in items.items():
+                    if len(kept) >= op.limit:
+                        break
+                    if (not index or key not in index.paths) and self._matches(item.value, op.filter):
+                        kept.append((None, item))
+        return [
+            SearchItem(
+                namespace=item.namespace,
+                key=item.key,
+                value=item.value,
+                created_at=item.created_at,
+                updated_at=item.updated_at,
+                score=score,
+            )
+            for score, item in kept
+        ]
@@ -0,0 +1,230 @@
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Iterable, NamedTuple, Optional, TypeVar
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+async def as_completed_until(
+    calls: Iterable[Callable[[], Awaitable[T]]],
+    *,
+    quorum: Optional[int] = None,
+    deadline: Optional[float] = None,
+    max_concurrency: Optional[int] = None,
+) -> AsyncIterator[tuple[int, T]]:
+    """Run `calls` concurrently and yield `(index, result)` as each one finishes, for a fan-in that doesn't wait for stragglers.
+
+    Stops once `quorum` results are in or `deadline` seconds have passed, whichever comes first,
+    and cancels the calls still running (or still waiting for one of the `max_concurrency` slots).
+    A call that raises is logged and left out, so the results of the others are kept; once the
+    quorum can't be met any more the rest are still awaited until `deadline`, and only when every
+    call fails is the error raised. Calls are passed uncalled, e.g. `partial(llm.ainvoke, prompt)`,
+    so the ones that never start are never created.
+    """
+    limit = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+
+    async def run(call: Callable[[], Awaitable[T]]) -> T:
+        if limit is None:
+            return await call()
+        async with limit:
+            return await call()
+
+    loop = asyncio.get_running_loop()
+    end = loop.time() + deadline if deadline is not None else None
+    index = {asyncio.create_task(run(call)): i for i, call in enumerate(calls)}
+    tasks = set(index)
+    finished = failed = 0
+    try:
+        while tasks and (quorum is None or finished < quorum):
+            timeout = end - loop.time() if end is not None else None
+            if timeout is not None and timeout <= 0:
+                break
+            done, tasks = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                error = task.exception()
+                if error is None:
+                    finished += 1
+                    yield index[task], task.result()
+                    continue
+                failed += 1
+                if failed == len(index):
+                    raise error
+                logger.warning("call %d failed, continuing without it", index[task], exc_info=error)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def tournament(
+    results: AsyncIterable[T],
+    pick_best: Callable[[list[T]], Awaitable[T]],
+    *,
+    group_size: int = 10,
+    max_concurrency: int = 16,
+) -> Optional[T]:
+    """Reduce results to the best one while they are still arriving.
+
+    As soon as `group_size` results are in, they are handed to `pick_best` (e.g. one model call
+    that picks the best joke of a group), and the winners go through the same rounds until one
+    is left. So the reduce overlaps the map and no call ever sees more than `group_size` results,
+    however many there are. At most `max_concurrency` `pick_best` calls run at once.
+    """
+    if group_size < 2:
+        raise ValueError("group_size must be at least 2")
+    limit = asyncio.Semaphore(max_concurrency)
+    pending: list[T] = []
+    running: set[asyncio.Task] = set()
+
+    async def pick(group: list[T]) -> T:
+        async with limit:
+            return await pick_best(group)
+
+    def start_full_groups() -> None:
+        nonlocal pending
+        while len(pending) >= group_size:
+            running.add(asyncio.create_task(pick(pending[:group_size])))
+            pending = pending[group_size:]
+
+    def collect_winners() -> None:
+        for task in [task for task in running if task.done()]:
+            running.discard(task)
+            pending.append(task.result())
+
+    try:
+        async for result in results:
+            pending.append(result)
+            collect_winners()
+            start_full_groups()
+        # the last groups are smaller than group_size
+        while running or len(pending) > 1:
+            start_full_groups()
+            if not running and len(pending) > 1:
+                running.add(asyncio.create_task(pick(pending)))
+                pending = []
+            await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            collect_winners()
+    finally:
+        for task in running:
+            task.cancel()
+    return pending[0] if pending else None
+
+
+class HedgePolicy(NamedTuple):
+    """Timeout and hedging of a node, declared where it is added like LangGraph's RetryPolicy.
+
+        graph.add_node("search_web", hedged(search_web, HedgePolicy(timeout=10.0, hedge_after=2.0)))
+    """
+    # seconds after which the node gives up and returns `fallback`, None waits as long as it takes
+    timeout: Optional[float] = None
+    # a call slower than this quantile of the node's recent latencies gets a duplicate, and the first to finish wins
+    hedge_quantile: Optional[float] = 0.95
+    # hedge delay in seconds until `min_samples` latencies are known, None doesn't hedge until then
+    hedge_after: Optional[float] = None
+    min_samples: int = 20
+    max_hedges: int = 1
+    # what the node returns on timeout; None writes nothing, so the graph goes on with what the other branches wrote
+    fallback: Any = None
+
+
+class HedgedNode:
+    """A node function run under a HedgePolicy; see `hedged`.
+    """
+
+    def __init__(self, func: Callable[[Any], Any], policy: HedgePolicy, window: int = 200):
+        self.func = func
+        self.policy = policy
+        self.__name__ = getattr(func, "__name__", type(func).__name__)
+        # latencies of the latest successful calls, which the hedge delay is taken from
+        self.latencies: deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.timeouts = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        with self._lock:
+            if self.policy.hedge_quantile is None or len(self.latencies) < self.policy.min_samples:
+                return self.policy.hedge_after
+            latencies = sorted(self.latencies)
+        return latencies[int(self.policy.hedge_quantile * (len(latencies) - 1))]
+
+    def _start(self, state: Any) -> Future:
+        # a daemon thread per attempt rather than a pool, so stragglers that never return can't use up the workers.
+        # each attempt runs in its own copy of the caller's context, so the config, callbacks and tracing
+        # LangChain keeps in context variables reach the search like they do without hedging
+        future: Future = Future()
+        context = contextvars.copy_context()
+
+        def run() -> None:
+            if not future.set_running_or_notify_cancel():
+                return
+            start = time.monotonic()
+            try:
+                update = context.run(self.func, state)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result((time.monotonic() - start, update))
+
+        threading.Thread(target=run, name=f"{self.__name__}-attempt", daemon=True).start()
+        return future
+
+    def __call__(self, state: Any) -> Any:
+        with self._lock:
+            self.calls += 1
+        start = time.monotonic()
+        end = start + self.policy.timeout if self.policy.timeout is not None else None
+        delay = self.hedge_delay()
+        hedge_at = start + delay if delay is not None and self.policy.max_hedges > 0 else None
+        primary = self._start(state)
+        attempts = {primary}
+        hedges = 0
+        error: Optional[BaseException] = None
+        while attempts:
+            now = time.monotonic()
+            if end is not None and now >= end:
+                break
+            if hedge_at is not None and now >= hedge_at:
+                attempts.add(self._start(state))
+                hedges += 1
+                hedge_at = now + delay if hedges < self.policy.max_hedges else None
+            wake = min((t for t in (end, hedge_at) if t is not None), default=None)
+            done, attempts = wait(attempts, timeout=None if wake is None else max(0.0, wake - now), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                latency, update = future.result()
+                with self._lock:
+                    self.latencies.append(latency)
+                    self.hedges += hedges
+                    self.hedge_wins += future is not primary
+                # attempts still running finish in their thread and their result is dropped
+                return update
+        with self._lock:
+            self.hedges += hedges
+        if not attempts and error is not None:
+            raise error
+        with self._lock:
+            self.timeouts += 1
+        logger.warning("%s timed out after %gs, continuing without it", self.__name__, self.policy.timeout)
+        return self.policy.fallback
+
+
+def hedged(func: Callable[[Any], Any], policy: HedgePolicy) -> HedgedNode:
+    """Wrap a node function (taking the state only) so it runs under `policy`: cut off at
+    `policy.timeout`, and duplicated when it takes longer than usual, keeping whichever call
+    finishes first. The tail latency of a fan-out is its slowest branch, and hedging the
+    branches cuts that tail. `calls`, `hedges`, `hedge_wins` and `timeouts` count what happened.
+    """
+    return HedgedNode(func, policy)
@@ -1,7 +1,9 @@
+import math
 import openai
 import os
 
 from dotenv import find_dotenv, load_dotenv
+from functools import partial
 from operator import add
 from pydantic import BaseModel
 from typing import Annotated, List, TypedDict
@@ -10,6 +12,9 @@ from langchain_openai import ChatOpenAI
 
 from langgraph.constants import Send
 from langgraph.graph import END, StateGraph, START
+from langgraph.types import StreamWriter
+
+from fan_out import as_completed_until, tournament
 
 
 _ = load_dotenv(find_dotenv())
@@ -17,6 +22,14 @@ openai.api_key = os.environ['OPENAI_API_KEY']
 
 llm = ChatOpenAI(model="gpt-3.5-turbo")
 
+# at most this many joke calls are in flight at once, however many subjects there are
+MAX_CONCURRENCY = 16
+# with many subjects, best_joke picks the best of every BEST_OF jokes, then the best of the winners
+BEST_OF = 10
+# the batched mode stops waiting for jokes once this share of the subjects have one, or after this many seconds
+JOKES_QUORUM = 0.9
+JOKES_DEADLINE = 60.0
+
 subjects_prompt = """
     Generate a list of 3 sub-topics that are all related to this overall topic: {topic}.
     """
@@ -78,5 +91,53 @@ graph.add_edge("best_joke", END)
 
 graph = graph.compile()
 
-for s in graph.stream({"topic": "super junior"}):
-    print(s)
\ No newline at end of file
+# max_concurrency caps how many of the generate_joke sends run at the same time
+for s in graph.stream({"topic": "super junior"}, {"max_concurrency": MAX_CONCURRENCY}):
+    print(s)
+
+
+# batched mode, for thousands of subjects: instead of one generate_joke task per subject, one node
+# makes all the joke calls, at most MAX_CONCURRENCY at a time, and picks the best joke in groups of
+# BEST_OF while the other jokes are still being generated. best_joke doesn't wait for the slowest
+# calls either: once JOKES_QUORUM of the jokes are in (or JOKES_DEADLINE has passed) the rest are cancelled
+
+joke_llm = llm.with_structured_output(Joke)
+best_joke_llm = llm.with_structured_output(BestJoke)
+
+async def generate_and_select_jokes(state: OverallState, writer: StreamWriter):
+    prompts = [joke_prompt.format(subject=s) for s in state["subjects"]]
+    jokes = []
+
+    async def generated():
+        calls = [partial(joke_llm.ainvoke, prompt) for prompt in prompts]
+        quorum = math.ceil(JOKES_QUORUM * len(calls))
+        async for _, response in as_completed_until(calls, quorum=quorum, deadline=JOKES_DEADLINE, max_concurrency=MAX_CONCURRENCY):
+            jokes.append(response.joke)
+            yield response.joke
+
+    async def pick_best(group):
+        prompt = best_joke_prompt.format(topic=state["topic"], jokes="\n\n".join(group))
+        response = await best_joke_llm.ainvoke(prompt)
+        best = group[response.id] if 0 <= response.id < len(group) else group[0]
+        # streamed with stream_mode="custom", so the best joke so far shows up before all jokes are done
+        writer({"best_so_far": best})
+        return best
+
+    best = await tournament(generated(), pick_best, group_size=BEST_OF, max_concurrency=MAX_CONCURRENCY)
+    return {"jokes": jokes, "best_selected_joke": best}
+
+batched_graph = StateGraph(OverallState)
+batched_graph.add_node("generate_topics", generate_topics)
+batched_graph.add_node("generate_and_select_jokes", generate_and_select_jokes)
+batched_graph.add_edge(START, "generate_topics")
+batched_graph.add_edge("generate_topics", "generate_and_select_jokes")
+batched_graph.add_edge("generate_and_select_jokes", END)
+
+batched_graph = batched_graph.compile()
+
+# import asyncio
+#
+# async def batched():
+#     async for mode, chunk in batched_graph.astream({"topic": "super junior"}, stream_mode=["updates", "custom"]):
+#         print(mode, chunk)
+# asyncio.run(batched())
\ No newline at end of file
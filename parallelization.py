@@ -3,6 +3,9 @@ from typing import Annotated, Any, TypedDict
 
 from langgraph.graph import END, StateGraph, START
 
+from checkpointer import CoalescingSaver
+from sqlite_persistence import SqliteSaver
+
 
 class State(TypedDict):
     state: Annotated[list, add]
@@ -30,9 +33,14 @@ graph.add_edge("a", "c")
 graph.add_edge("b", "d")
 graph.add_edge("c", "d")
 graph.add_edge("d", END)
-graph = graph.compile()
-
-# graph.invoke({"state": []})
+# B and C run in the same step, so their writes are saved together when that step's checkpoint is saved.
+# that takes a checkpointer that saves a batch of writes in one call: SqliteSaver does (here an in-memory
+# database, so every run starts fresh like with MemorySaver), MemorySaver would still get one call per task
+memory = CoalescingSaver(SqliteSaver(":memory:"))
+graph = graph.compile(checkpointer=memory)
+
+# graph.invoke({"state": []}, {"configurable": {"thread_id": "1"}})
+# print(f"{memory.writes_per_step:.1f} writes per step, {memory.checkpointer_seconds * 1000:.2f} ms in the checkpointer")
 # the result:
 # Adding I'm A to []
 # Adding I'm B to ["I'm A"]
@@ -6,10 +6,11 @@ from dotenv import find_dotenv, load_dotenv
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_openai import ChatOpenAI
 
-from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import MessagesState, StateGraph, START
 from langgraph.prebuilt import ToolNode, tools_condition
 
+from checkpointer import BoundedMemorySaver
+
 
 _ = load_dotenv(find_dotenv())
 openai.api_key = os.environ['OPENAI_API_KEY']
@@ -41,7 +42,9 @@ class Agent:
 
         self.llm_with_tools = self.llm.bind_tools(self.tools)
 
-        self.memory = MemorySaver()
+        # keep the latest 20 checkpoints of every thread and at most 64 MB of them in memory,
+        # storing the messages of each checkpoint as a delta of the previous one
+        self.memory = BoundedMemorySaver(max_checkpoints_per_thread=20, max_bytes=64 * 1024 * 1024, keyframe_interval=50)
         
         graph = StateGraph(MessagesState)
         graph.add_node("assistant", self.assistant)
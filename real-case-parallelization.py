@@ -1,17 +1,26 @@
+import asyncio
 import getpass 
+import math
 import openai
 import os
 
 from dotenv import find_dotenv, load_dotenv
+from functools import partial
 from operator import add
 from typing import Annotated, TypedDict
 
-from langchain_community.document_loaders import WikipediaLoader
 from langchain_community.tools import TavilySearchResults
+from langchain_community.utilities import WikipediaAPIWrapper
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_openai import ChatOpenAI
 
 from langgraph.graph import END, StateGraph, START
+from langgraph.types import StreamWriter
+
+from checkpointer import CoalescingSaver
+from fan_out import HedgePolicy, as_completed_until, hedged
+from search_cache import MemoryCache, cached
+from sqlite_persistence import SqliteSaver
 
 
 _ = load_dotenv(find_dotenv())
@@ -29,10 +38,13 @@ class State(TypedDict):
     answer: str
     context: Annotated[list, add]
 
+# the search clients are created once and reused by every call
+tavily_search = TavilySearchResults(max_results=3)
+wikipedia = WikipediaAPIWrapper(top_k_results=2)
+
 def search_web(state):
     """Retrieve docs from web search.
     """
-    tavily_search = TavilySearchResults(max_results=3)
     search_docs = tavily_search.invoke(state['question'])
 
     formatted_search_docs = "\n\n---\n\n".join(
@@ -47,10 +59,7 @@ def search_web(state):
 def search_wikipedia(state):
     """Retrieve docs from wikipedia.
     """
-    search_docs = WikipediaLoader(
-        query=state['question'], 
-        load_max_docs=2
-    ).load()
+    search_docs = wikipedia.load(state['question'])
 
     formatted_search_docs = "\n\n---\n\n".join(
         [
@@ -78,10 +87,19 @@ def generate_answer(state):
       
     return {"answer": answer}
 
+# each search is cut off after 10 seconds, so the answer goes on with the context of the other one,
+# and a search slower than 95% of the previous ones (3 seconds until 20 are known) is sent a second
+# time, keeping whichever answer comes back first
+SEARCH_POLICY = HedgePolicy(timeout=10.0, hedge_after=3.0)
+
+# a question asked again within an hour (up to case and punctuation) is answered from the cache
+# without searching; SqliteCache("search_cache.sqlite") from search_cache.py keeps it across runs
+search_cache = MemoryCache(maxsize=1024, ttl=3600)
+
 graph = StateGraph(State)
 
-graph.add_node("search_web", search_web)
-graph.add_node("search_wikipedia", search_wikipedia)
+graph.add_node("search_web", cached(hedged(search_web, SEARCH_POLICY), search_cache))
+graph.add_node("search_wikipedia", cached(hedged(search_wikipedia, SEARCH_POLICY), search_cache))
 graph.add_node("generate_answer", generate_answer)
 
 graph.add_edge(START, "search_wikipedia")
@@ -89,7 +107,54 @@ graph.add_edge(START, "search_web")
 graph.add_edge("search_wikipedia", "generate_answer")
 graph.add_edge("search_web", "generate_answer")
 graph.add_edge("generate_answer", END)
-graph = graph.compile()
+# search_web and search_wikipedia run in the same step, so their writes are saved together, in one
+# SqliteSaver call (MemorySaver has no batched write, so wrapping it would only delay the same calls)
+memory = CoalescingSaver(SqliteSaver(":memory:"))
+graph = graph.compile(checkpointer=memory)
 
-result = graph.invoke({"question": "Who is super junior?"})
+result = graph.invoke({"question": "Who is super junior?"}, {"configurable": {"thread_id": "1"}})
 print(result['answer'].content)
+print(f"{memory.writes_per_step:.1f} writes per step, {memory.checkpointer_seconds * 1000:.2f} ms in the checkpointer")
+print(f"search cache hit rate: {search_cache.hit_rate:.0%}")
+
+
+
+# incremental fan-in: generate_answer above only runs once both searches are done, so one slow
+# source (often the Wikipedia load) holds up the answer. here a single node runs both searches at
+# once and hands generate_answer the context that arrived once SEARCH_QUORUM of the searches (here
+# the first one of the two) are done or SEARCH_DEADLINE seconds have passed; a search still running
+# then is cancelled, and one that fails is left out, so the answer uses the context of the others
+
+SEARCH_QUORUM = 0.5
+SEARCH_DEADLINE = 5.0
+SEARCHES = {"search_web": search_web, "search_wikipedia": search_wikipedia}
+
+async def search_until_deadline(state, writer: StreamWriter):
+    """Run all searches at once and keep the context of those that finish in time.
+
+    generate_answer gets one context entry per search that made it, in the order they finished: a
+    search that was cancelled or failed adds nothing. If none finished by the deadline the context
+    is empty and the model answers without any; if every search failed, the node raises.
+    """
+    # the loaders block, so they run in threads; a cancelled one finishes in the background and its result is dropped
+    searches = [partial(asyncio.to_thread, search, state) for search in SEARCHES.values()]
+    quorum = math.ceil(SEARCH_QUORUM * len(searches))
+    context = []
+    async for i, update in as_completed_until(searches, quorum=quorum, deadline=SEARCH_DEADLINE):
+        context.extend(update["context"])
+        # streamed with stream_mode="custom", to show which sources made it
+        writer({"search_done": list(SEARCHES)[i]})
+    return {"context": context}
+
+incremental_graph = StateGraph(State)
+incremental_graph.add_node("search_until_deadline", search_until_deadline)
+incremental_graph.add_node("generate_answer", generate_answer)
+incremental_graph.add_edge(START, "search_until_deadline")
+incremental_graph.add_edge("search_until_deadline", "generate_answer")
+incremental_graph.add_edge("generate_answer", END)
+incremental_graph = incremental_graph.compile()
+
+# async def incremental():
+#     async for mode, chunk in incremental_graph.astream({"question": "Who is super junior?"}, stream_mode=["custom", "values"]):
+#         print(mode, chunk)
+# asyncio.run(incremental())
\ No newline at end of file
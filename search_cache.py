@@ -0,0 +1,189 @@
+import json
+import re
+import threading
+import time
+import unicodedata
+
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+from sqlite_persistence import connect
+
+
+# only punctuation that ends a sentence: the rest can be part of what is searched ("C++", "C#", "Node.js")
+_TRAILING_PUNCTUATION = re.compile(r"[\s?!.,]+$")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """The cache key of a query: case, Unicode forms, extra spaces and the punctuation ending it don't matter.
+
+    So "Who is Super Junior?" and "who is  super junior" are the same search, but "what is C++" and
+    "what is C#" are not.
+    """
+    query = unicodedata.normalize("NFKC", query).casefold()
+    return _TRAILING_PUNCTUATION.sub("", _SPACES.sub(" ", query).strip())
+
+
+class _CacheStats:
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class MemoryCache(_CacheStats):
+    """In-memory search results, dropped `ttl` seconds after they were fetched or beyond `maxsize` entries, least recently used first.
+
+    `hits`, `misses`, `expired` (misses because the entry was too old), `evictions` and `hit_rate` count the lookups.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = 3600.0) -> None:
+        super().__init__()
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.time() - entry[0] > self.ttl:
+                del self._entries[key]
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+SEARCH_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS search_cache (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS search_cache_used_at ON search_cache (used_at);
+"""
+
+
+class SqliteCache(_CacheStats):
+    """MemoryCache kept in a local SQLite file, so the results outlive the process and are shared by the processes using the file.
+
+    Values are stored as JSON, which the `{"context": [...]}` updates of the search nodes are.
+    """
+
+    def __init__(self, path: str = "search_cache.sqlite", maxsize: int = 100_000, ttl: Optional[float] = 24 * 3600.0) -> None:
+        super().__init__()
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.conn = connect(path)
+        self.conn.executescript(SEARCH_CACHE_SCHEMA)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock, self.conn:
+            row = self.conn.execute("SELECT value, fetched_at FROM search_cache WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                self.conn.execute("DELETE FROM search_cache WHERE key = ?", (key,))
+                self.expired += 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE search_cache SET used_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any) -> None:
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO search_cache (key, value, fetched_at, used_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now),
+            )
+            over = self.conn.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0] - self.maxsize
+            if over > 0:
+                self.conn.execute(
+                    "DELETE FROM search_cache WHERE key IN (SELECT key FROM search_cache ORDER BY used_at LIMIT ?)", (over,)
+                )
+                self.evictions += over
+
+    def clear(self) -> None:
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM search_cache")
+
+
+class CachedNode:
+    """A search node whose updates are cached; see `cached`.
+    """
+
+    def __init__(self, func: Callable[[Any], Any], cache: Any, query: Callable[[Any], str], namespace: str):
+        self.func = func
+        self.cache = cache
+        self.query = query
+        self.namespace = namespace
+        self.__name__ = getattr(func, "__name__", type(func).__name__)
+
+    def __call__(self, state: Any) -> Any:
+        key = f"{self.namespace}:{normalize_query(self.query(state))}"
+        update = self.cache.get(key)
+        if update is None:
+            update = self.func(state)
+            # a search that timed out (see `hedged`) returns None, and is tried again next time
+            if update is not None:
+                self.cache.set(key, update)
+        return update
+
+
+def cached(
+    func: Callable[[Any], Any],
+    cache: Any,
+    *,
+    query: Callable[[Any], str] = lambda state: state["question"],
+    namespace: Optional[str] = None,
+) -> CachedNode:
+    """Wrap a search node so a question it has already searched (after `normalize_query`) is answered from `cache`.
+
+    `cache` is a MemoryCache or a SqliteCache and can be shared by several nodes: entries are
+    keyed by `namespace` (the function's name by default) and the normalized query.
+
+        cache = MemoryCache(maxsize=1024, ttl=3600)
+        graph.add_node("search_web", cached(search_web, cache))
+    """
+    return CachedNode(func, cache, query, namespace or getattr(func, "__name__", type(func).__name__))
@@ -0,0 +1,204 @@
+import importlib
+import logging
+import zlib
+
+from datetime import datetime
+from functools import lru_cache, partial
+from typing import Any, Iterable, Optional
+
+import ormsgpack
+
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    BaseMessage,
+    ChatMessage,
+    FunctionMessage,
+    HumanMessage,
+    RemoveMessage,
+    SystemMessage,
+    ToolMessage,
+)
+from langgraph.checkpoint.serde.base import SerializerProtocol
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer, _msgpack_default, _msgpack_ext_hook
+from pydantic import BaseModel
+
+
+logger = logging.getLogger(__name__)
+
+# LangGraph's own extension types use codes 0-5, these start well above them
+EXT_DATETIME = 33
+EXT_MESSAGE = 35
+EXT_MODEL = 36
+# the first format stored fields by position; it is still read, always with validation
+EXT_MESSAGE_POSITIONAL = 32
+EXT_MODEL_POSITIONAL = 34
+
+# message classes get a one-byte code instead of their module and class name; append only, the codes are stored
+MESSAGE_TYPES = [HumanMessage, AIMessage, SystemMessage, ToolMessage, RemoveMessage, ChatMessage, FunctionMessage, AIMessageChunk]
+MESSAGE_CODES = {cls: code for code, cls in enumerate(MESSAGE_TYPES)}
+
+OPTIONS = (
+    ormsgpack.OPT_NON_STR_KEYS
+    | ormsgpack.OPT_PASSTHROUGH_DATACLASS
+    | ormsgpack.OPT_PASSTHROUGH_DATETIME
+    | ormsgpack.OPT_PASSTHROUGH_ENUM
+    | ormsgpack.OPT_PASSTHROUGH_UUID
+)
+
+
+@lru_cache(maxsize=None)
+def _schema(cls: type) -> tuple[tuple[str, ...], tuple[Any, ...], tuple[Any, ...], int]:
+    """Field names of a pydantic model in declaration order, their defaults, their default factories, and the schema id.
+
+    The schema id changes when a field is added, removed, renamed, reordered or changes type,
+    e.g. after editing ToDo or upgrading langchain-core.
+    """
+    names = tuple(cls.model_fields)
+    defaults = tuple(field.get_default(call_default_factory=True) for field in cls.model_fields.values())
+    factories = tuple(field.default_factory for field in cls.model_fields.values())
+    schema_id = zlib.crc32(repr([(name, repr(field.annotation)) for name, field in cls.model_fields.items()]).encode())
+    return names, defaults, factories, schema_id
+
+
+# (module, class name) of the models this process encoded, which it can always load back
+_ENCODED: set[tuple[str, str]] = set()
+
+
+@lru_cache(maxsize=None)
+def _load(module: str, name: str) -> Any:
+    return getattr(importlib.import_module(module), name)
+
+
+def _import(module: str, name: str, allowed_modules: frozenset[str]) -> Optional[type]:
+    """The model class a payload names, if it may be loaded: encoded by this process or from one of `allowed_modules`.
+
+    The path comes from stored data, so anything else isn't imported at all.
+    """
+    if (module, name) not in _ENCODED and not any(module == m or module.startswith(m + ".") for m in allowed_modules):
+        logger.warning("not loading %s.%s, which is neither in allowed_modules nor encoded by this process", module, name)
+        return None
+    cls = _load(module, name)
+    if not (isinstance(cls, type) and issubclass(cls, BaseModel)):
+        logger.warning("not loading %s.%s, which isn't a pydantic model", module, name)
+        return None
+    return cls
+
+
+def _fields(obj: BaseModel) -> tuple[int, dict[str, Any]]:
+    """The schema id of a model and its fields that differ from their default, by name; defaults are filled back in on decode.
+
+    Extra fields of models that allow them (messages do, e.g. `AIMessage(content="", custom=1)`) are kept along with them.
+    """
+    names, defaults, _, schema_id = _schema(type(obj))
+    values = obj.__dict__
+    fields = {name: values[name] for name, default in zip(names, defaults) if values[name] != default}
+    if obj.__pydantic_extra__:
+        fields.update(obj.__pydantic_extra__)
+    return schema_id, fields
+
+
+def _construct(cls: type, schema_id: int, fields: dict[str, Any]) -> BaseModel:
+    names, defaults, factories, current_id = _schema(cls)
+    if schema_id != current_id:
+        # the model changed since it was encoded, so the values are checked against what it is now
+        extra = cls.model_config.get("extra") == "allow"
+        known = {name: value for name, value in fields.items() if extra or name in cls.model_fields}
+        if len(known) < len(fields):
+            logger.warning("dropping fields %s that %s no longer has", sorted(set(fields) - set(known)), cls.__qualname__)
+        return cls.model_validate(known)
+    # defaults are filled in here rather than by model_construct, which inspects every default factory's signature
+    values = {name: factory() if factory else default for name, default, factory in zip(names, defaults, factories)}
+    values.update(fields)
+    # the values were valid when they were encoded with this very schema, so they aren't validated again
+    return cls.model_construct(set(fields), **values)
+
+
+def _construct_positional(cls: type, fields: dict[int, Any]) -> BaseModel:
+    names = _schema(cls)[0]
+    # positions may point at other fields since, so these are only trusted after validation
+    return cls.model_validate({names[i]: value for i, value in fields.items() if i < len(names)})
+
+
+def _default(obj: Any) -> Any:
+    if type(obj) in MESSAGE_CODES:
+        return ormsgpack.Ext(EXT_MESSAGE, _pack([MESSAGE_CODES[type(obj)], *_fields(obj)]))
+    if isinstance(obj, datetime):
+        return ormsgpack.Ext(EXT_DATETIME, obj.isoformat().encode())
+    if isinstance(obj, BaseModel):
+        cls = type(obj)
+        _ENCODED.add((cls.__module__, cls.__qualname__))
+        return ormsgpack.Ext(EXT_MODEL, _pack([cls.__module__, cls.__qualname__, *_fields(obj)]))
+    # anything else is encoded the way LangGraph's serializer does it
+    return _msgpack_default(obj)
+
+
+def _ext_hook(allowed_modules: frozenset[str], code: int, data: bytes) -> Any:
+    # a model that may not be loaded comes back as the dict of its stored fields
+    if code == EXT_MESSAGE:
+        message_code, schema_id, fields = _unpack(data, allowed_modules)
+        return _construct(MESSAGE_TYPES[message_code], schema_id, fields)
+    if code == EXT_DATETIME:
+        return datetime.fromisoformat(data.decode())
+    if code == EXT_MODEL:
+        module, name, schema_id, fields = _unpack(data, allowed_modules)
+        cls = _import(module, name, allowed_modules)
+        return _construct(cls, schema_id, fields) if cls is not None else fields
+    if code == EXT_MESSAGE_POSITIONAL:
+        message_code, fields = _unpack(data, allowed_modules)
+        return _construct_positional(MESSAGE_TYPES[message_code], fields)
+    if code == EXT_MODEL_POSITIONAL:
+        module, name, fields = _unpack(data, allowed_modules)
+        cls = _import(module, name, allowed_modules)
+        return _construct_positional(cls, fields) if cls is not None else fields
+    return _msgpack_ext_hook(code, data)
+
+
+def _pack(obj: Any) -> bytes:
+    return ormsgpack.packb(obj, default=_default, option=OPTIONS)
+
+
+def _unpack(data: bytes, allowed_modules: frozenset[str] = frozenset()) -> Any:
+    return ormsgpack.unpackb(data, ext_hook=partial(_ext_hook, allowed_modules), option=ormsgpack.OPT_NON_STR_KEYS)
+
+
+class CompactSerializer(SerializerProtocol):
+    """Checkpoint and store serializer with compact fast paths for messages, pydantic models and datetimes.
+
+    Messages and models are stored as their non-default fields by name, with an id of their
+    schema; messages also replace their class path with a one-byte code. A value whose model
+    changed since it was stored is validated on load instead of rebuilt as is. Datetimes are
+    stored as ISO strings. Everything else, and anything written by LangGraph's default serializer, goes
+    through JsonPlusSerializer, so an existing checkpointer can switch to it.
+
+    Stored data names the module and class of each model, so only models from `allowed_modules`
+    (or their submodules) and those this process encoded itself are loaded; any other model is
+    logged and loaded as the dict of its fields, without importing anything.
+
+        memory = BoundedMemorySaver(serde=CompactSerializer(allowed_modules=["task_maistro"]))
+        store = SqliteStore("store.sqlite", serde=CompactSerializer(allowed_modules=["task_maistro"]))
+    """
+
+    def __init__(self, allowed_modules: Iterable[str] = ()) -> None:
+        self.fallback = JsonPlusSerializer()
+        self.allowed_modules = frozenset(allowed_modules)
+
+    def dumps(self, obj: Any) -> bytes:
+        return _pack(obj)
+
+    def loads(self, data: bytes) -> Any:
+        return _unpack(data, self.allowed_modules)
+
+    def dumps_typed(self, obj: Any) -> tuple[str, bytes]:
+        if obj is None or isinstance(obj, (bytes, bytearray)):
+            return self.fallback.dumps_typed(obj)
+        try:
+            return "compact", _pack(obj)
+        except ormsgpack.MsgpackEncodeError:
+            # e.g. strings that aren't valid UTF-8, which JsonPlusSerializer stores as JSON
+            return self.fallback.dumps_typed(obj)
+
+    def loads_typed(self, data: tuple[str, bytes]) -> Any:
+        if data[0] == "compact":
+            return _unpack(data[1], self.allowed_modules)
+        return self.fallback.loads_typed(data)
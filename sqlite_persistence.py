@@ -0,0 +1,487 @@
+import asyncio
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Iterable, Iterator, Optional, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.serde.base import SerializerProtocol
+from langgraph.checkpoint.serde.types import TASKS
+from langgraph.store.base import BaseStore, GetOp, Item, ListNamespacesOp, Op, PutOp, Result, SearchItem, SearchOp
+from langgraph.store.memory import _compare_values, _does_match
+
+
+logger = logging.getLogger(__name__)
+
+# sqlite3 keeps this many prepared statements per connection, keyed by their SQL text, so every
+# statement below is a constant and is compiled only once
+STATEMENT_CACHE_SIZE = 256
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """Open a SQLite database in WAL mode, so readers don't wait for the writer and commits don't rewrite the database.
+    """
+    conn = sqlite3.connect(path, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # with WAL, NORMAL only syncs at checkpoints and still can't corrupt the database
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+CHECKPOINT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT,
+    checkpoint BLOB,
+    metadata_type TEXT,
+    metadata BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    channel TEXT NOT NULL,
+    version TEXT NOT NULL,
+    type TEXT NOT NULL,
+    blob BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT,
+    value BLOB,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+"""
+
+INSERT_CHECKPOINT = "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+INSERT_BLOB = "INSERT OR IGNORE INTO blobs VALUES (?, ?, ?, ?, ?, ?)"
+UPSERT_WRITE = "INSERT OR REPLACE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+INSERT_WRITE = "INSERT OR IGNORE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+SELECT_CHECKPOINT = (
+    "SELECT checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata FROM checkpoints "
+    "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?"
+)
+SELECT_LATEST_CHECKPOINT = (
+    "SELECT checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata FROM checkpoints "
+    "WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC LIMIT 1"
+)
+SELECT_BLOB = "SELECT type, blob FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?"
+SELECT_WRITES = (
+    "SELECT task_id, channel, type, value, task_path, idx FROM writes "
+    "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx"
+)
+SELECT_CHECKPOINTS = (
+    "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata "
+    "FROM checkpoints WHERE (? IS NULL OR thread_id = ?) AND (? IS NULL OR checkpoint_ns = ?) "
+    "AND (? IS NULL OR checkpoint_id = ?) AND (? IS NULL OR checkpoint_id < ?) "
+    "ORDER BY checkpoint_id DESC"
+)
+DELETE_THREAD = [
+    "DELETE FROM checkpoints WHERE thread_id = ?",
+    "DELETE FROM blobs WHERE thread_id = ?",
+    "DELETE FROM writes WHERE thread_id = ?",
+]
+
+
+class SqliteSaver(BaseCheckpointSaver[str]):
+    """Checkpointer that keeps checkpoints in a local SQLite file, a durable single-node option between MemorySaver and Postgres.
+
+    Like MemorySaver, channel values are stored per version, so a checkpoint only writes the
+    channels that changed. Checkpoints are committed right away, and so are errors and interrupts,
+    which a resumed thread needs. The other pending writes of a superstep stay in the open
+    transaction and are committed with the checkpoint that ends the step; a timer commits them
+    after `max_commit_delay` seconds if no checkpoint comes first, and so do `flush` and `close`.
+    The async methods run the sync ones in a worker thread, so the event loop isn't blocked.
+
+        with SqliteSaver("checkpoints.sqlite") as memory:
+            graph = builder.compile(checkpointer=memory)
+    """
+
+    def __init__(self, path: str = "checkpoints.sqlite", *, max_commit_delay: float = 1.0, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.path = path
+        self.max_commit_delay = max_commit_delay
+        self.conn = connect(path)
+        self.conn.executescript(CHECKPOINT_SCHEMA)
+        self._lock = threading.RLock()
+        # when the open transaction started, None if there is none
+        self._dirty_since: Optional[float] = None
+        # commits the open transaction `max_commit_delay` seconds after it started
+        self._timer: Optional[threading.Timer] = None
+        self.commits = 0
+
+    def __enter__(self) -> "SqliteSaver":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._dirty_since is not None:
+                self.conn.commit()
+                self._dirty_since = None
+                self.commits += 1
+
+    def close(self) -> None:
+        with self._lock:
+            self.flush()
+            self.conn.close()
+
+    def _written(self, commit: bool = False) -> None:
+        """Note that the open transaction has changes, and commit them now or start the commit timer.
+        """
+        if commit:
+            self._dirty_since = self._dirty_since or time.monotonic()
+            self.flush()
+        elif self._dirty_since is None:
+            self._dirty_since = time.monotonic()
+            self._timer = threading.Timer(self.max_commit_delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _tuple(self, thread_id: str, checkpoint_ns: str, row: tuple) -> CheckpointTuple:
+        checkpoint_id, parent_checkpoint_id, type_, checkpoint_b, metadata_type, metadata_b = row
+        checkpoint: Checkpoint = self.serde.loads_typed((type_, checkpoint_b))
+        channel_values = {}
+        for channel, version in checkpoint["channel_versions"].items():
+            blob = self.conn.execute(SELECT_BLOB, (thread_id, checkpoint_ns, channel, version)).fetchone()
+            if blob and blob[0] != "empty":
+                channel_values[channel] = self.serde.loads_typed(blob)
+        writes = self.conn.execute(SELECT_WRITES, (thread_id, checkpoint_ns, checkpoint_id)).fetchall()
+        sends = []
+        if parent_checkpoint_id:
+            parent_writes = self.conn.execute(SELECT_WRITES, (thread_id, checkpoint_ns, parent_checkpoint_id)).fetchall()
+            # same order as MemorySaver: by task path, task id and write index
+            sends = sorted((w for w in parent_writes if w[1] == TASKS), key=lambda w: (w[4], w[0], w[5]))
+
+        def config(checkpoint_id: str) -> RunnableConfig:
+            return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}}
+
+        return CheckpointTuple(
+            config=config(checkpoint_id),
+            checkpoint={
+                **checkpoint,
+                "channel_values": channel_values,
+                "pending_sends": [self.serde.loads_typed((w[2], w[3])) for w in sends],
+            },
+            metadata=self.serde.loads_typed((metadata_type, metadata_b)),
+            parent_config=config(parent_checkpoint_id) if parent_checkpoint_id else None,
+            pending_writes=[(w[0], w[1], self.serde.loads_typed((w[2], w[3]))) for w in writes],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        with self._lock:
+            if checkpoint_id := get_checkpoint_id(config):
+                row = self.conn.execute(SELECT_CHECKPOINT, (thread_id, checkpoint_ns, checkpoint_id)).fetchone()
+            else:
+                row = self.conn.execute(SELECT_LATEST_CHECKPOINT, (thread_id, checkpoint_ns)).fetchone()
+            return self._tuple(thread_id, checkpoint_ns, row) if row else None
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        configurable = config["configurable"] if config else {}
+        thread_id = configurable.get("thread_id")
+        checkpoint_ns = configurable.get("checkpoint_ns")
+        checkpoint_id = get_checkpoint_id(config) if config else None
+        before_id = get_checkpoint_id(before) if before else None
+        with self._lock:
+            rows = self.conn.execute(
+                SELECT_CHECKPOINTS,
+                (thread_id, thread_id, checkpoint_ns, checkpoint_ns, checkpoint_id, checkpoint_id, before_id, before_id),
+            ).fetchall()
+        for row in rows:
+            if limit is not None and limit <= 0:
+                break
+            with self._lock:
+                result = self._tuple(row[0], row[1], row[2:])
+            if filter and not all(result.metadata.get(k) == v for k, v in filter.items()):
+                continue
+            if limit is not None:
+                limit -= 1
+            yield result
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        c = checkpoint.copy()
+        c.pop("pending_sends", None)
+        values = c.pop("channel_values")
+        blobs = [
+            (thread_id, checkpoint_ns, channel, version, *(self.serde.dumps_typed(values[channel]) if channel in values else ("empty", None)))
+            for channel, version in new_versions.items()
+        ]
+        type_, checkpoint_b = self.serde.dumps_typed(c)
+        metadata_type, metadata_b = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        with self._lock:
+            self.conn.executemany(INSERT_BLOB, blobs)
+            self.conn.execute(
+                INSERT_CHECKPOINT,
+                (thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"), type_, checkpoint_b, metadata_type, metadata_b),
+            )
+            # a checkpoint ends a superstep, so it commits the writes of that step along with it
+            self._written(commit=True)
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def _write_rows(self, config: RunnableConfig, writes: Sequence[tuple[str, Any]], task_id: str, task_path: str) -> tuple[str, list]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        # special writes (errors, interrupts) replace earlier ones, regular writes are only stored once
+        query = UPSERT_WRITE if all(channel in WRITES_IDX_MAP for channel, _ in writes) else INSERT_WRITE
+        rows = [
+            (thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx), channel, *self.serde.dumps_typed(value), task_path)
+            for idx, (channel, value) in enumerate(writes)
+        ]
+        return query, rows
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        self.put_many_writes([(config, writes, task_id, task_path)])
+
+    def put_many_writes(self, batch: Sequence[tuple[RunnableConfig, Sequence[tuple[str, Any]], str, str]]) -> None:
+        """`put_writes` for the writes of several tasks at once, `(config, writes, task_id, task_path)` each.
+        """
+        queries: dict[str, list] = {}
+        for config, writes, task_id, task_path in batch:
+            query, rows = self._write_rows(config, writes, task_id, task_path)
+            queries.setdefault(query, []).extend(rows)
+        with self._lock:
+            for query, rows in queries.items():
+                self.conn.executemany(query, rows)
+            # errors and interrupts end the step without a checkpoint, and resuming needs them
+            self._written(commit=any(channel in WRITES_IDX_MAP for _, writes, _, _ in batch for channel, _ in writes))
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            for query in DELETE_THREAD:
+                self.conn.execute(query, (thread_id,))
+            self._written(commit=True)
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        checkpoints = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for checkpoint in checkpoints:
+            yield checkpoint
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def aput_many_writes(self, batch: Sequence[tuple[RunnableConfig, Sequence[tuple[str, Any]], str, str]]) -> None:
+        return await asyncio.to_thread(self.put_many_writes, batch)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def get_next_version(self, current: Optional[str], channel: Any) -> str:
+        # same versions as MemorySaver: a counter, then a random part so forks don't collide
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+
+STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS store (
+    prefix TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (prefix, key)
+);
+"""
+
+SELECT_ITEM = "SELECT prefix, key, value, created_at, updated_at FROM store WHERE prefix = ? AND key = ?"
+UPSERT_ITEM = (
+    "INSERT INTO store VALUES (?, ?, ?, ?, ?) "
+    "ON CONFLICT (prefix, key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at"
+)
+DELETE_ITEM = "DELETE FROM store WHERE prefix = ? AND key = ?"
+# namespace labels can't contain periods, so the namespaces under a prefix are the prefix itself and
+# those between "prefix." and "prefix/" ("/" sorts right after "."), a range the primary key serves
+SEARCH_ITEMS = (
+    "SELECT prefix, key, value, created_at, updated_at FROM store "
+    "WHERE prefix = ? OR (prefix >= ? AND prefix < ?) ORDER BY updated_at DESC, key"
+)
+SEARCH_ITEMS_PAGE = SEARCH_ITEMS + " LIMIT ? OFFSET ?"
+SELECT_NAMESPACES = "SELECT DISTINCT prefix FROM store"
+
+
+class SqliteStore(BaseStore):
+    """Store that keeps long-term memories in a local SQLite file, in WAL mode.
+
+    Every `batch` runs in one transaction, so all the puts of a batch cost a single commit.
+    Filters are checked like InMemoryStore's; semantic search (`query`) isn't supported and
+    `query` is ignored, as InMemoryStore does without an index.
+
+    Values are stored as JSON text, or as the bytes of `serde` when one is given (e.g.
+    CompactSerializer from serializer.py); JSON rows can still be read after switching.
+
+        store = SqliteStore("store.sqlite")
+        graph = builder.compile(checkpointer=SqliteSaver("checkpoints.sqlite"), store=store)
+    """
+
+    def __init__(self, path: str = "store.sqlite", *, serde: Optional[SerializerProtocol] = None) -> None:
+        self.path = path
+        self.serde = serde
+        self.conn = connect(path)
+        self.conn.executescript(STORE_SCHEMA)
+        self._lock = threading.Lock()
+        self.commits = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+    def _dumps(self, value: dict[str, Any]) -> Any:
+        return self.serde.dumps(value) if self.serde is not None else json.dumps(value)
+
+    def _loads(self, value: Any) -> dict[str, Any]:
+        if isinstance(value, bytes):
+            if self.serde is None:
+                raise ValueError(f"{self.path} has values written with a serializer, pass the same `serde`")
+            return self.serde.loads(value)
+        return json.loads(value)
+
+    def _item(self, row: tuple, search: bool = False) -> Item:
+        prefix, key, value, created_at, updated_at = row
+        cls = SearchItem if search else Item
+        return cls(
+            namespace=tuple(prefix.split(".")),
+            key=key,
+            value=self._loads(value),
+            created_at=datetime.fromisoformat(created_at),
+            updated_at=datetime.fromisoformat(updated_at),
+        )
+
+    def _search(self, op: SearchOp) -> list[SearchItem]:
+        prefix = ".".join(op.namespace_prefix)
+        params = (prefix, prefix + ".", prefix + "/")
+        if not op.filter:
+            rows = self.conn.execute(SEARCH_ITEMS_PAGE, (*params, op.limit, op.offset)).fetchall()
+            return [self._item(row, search=True) for row in rows]
+        matches = []
+        for row in self.conn.execute(SEARCH_ITEMS, params):
+            value = self._loads(row[2])
+            if all(_compare_values(value.get(k), condition) for k, condition in op.filter.items()):
+                matches.append(row)
+                if len(matches) >= op.offset + op.limit:
+                    break
+        return [self._item(row, search=True) for row in matches[op.offset:]]
+
+    def _list_namespaces(self, op: ListNamespacesOp) -> list[tuple[str, ...]]:
+        namespaces = [tuple(row[0].split(".")) for row in self.conn.execute(SELECT_NAMESPACES)]
+        if op.match_conditions:
+            namespaces = [ns for ns in namespaces if all(_does_match(condition, ns) for condition in op.match_conditions)]
+        if op.max_depth is not None:
+            namespaces = sorted({ns[: op.max_depth] for ns in namespaces})
+        else:
+            namespaces = sorted(namespaces)
+        return namespaces[op.offset : op.offset + op.limit]
+
+    def batch(self, ops: Iterable[Op]) -> list[Result]:
+        results: list[Result] = []
+        wrote = False
+        with self._lock:
+            for op in ops:
+                if isinstance(op, GetOp):
+                    row = self.conn.execute(SELECT_ITEM, (".".join(op.namespace), op.key)).fetchone()
+                    results.append(self._item(row) if row else None)
+                elif isinstance(op, SearchOp):
+                    results.append(self._search(op))
+                elif isinstance(op, ListNamespacesOp):
+                    results.append(self._list_namespaces(op))
+                elif isinstance(op, PutOp):
+                    prefix = ".".join(op.namespace)
+                    if op.value is None:
+                        self.conn.execute(DELETE_ITEM, (prefix, op.key))
+                    else:
+                        now = datetime.now(timezone.utc).isoformat()
+                        self.conn.execute(UPSERT_ITEM, (prefix, op.key, self._dumps(op.value), now, now))
+                    wrote = True
+                    results.append(None)
+                else:
+                    raise ValueError(f"Unknown operation type: {type(op)}")
+            if wrote:
+                self.conn.commit()
+                self.commits += 1
+        return results
+
+    async def abatch(self, ops: Iterable[Op]) -> list[Result]:
+        return await asyncio.to_thread(self.batch, list(ops))
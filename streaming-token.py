@@ -1,5 +1,6 @@
 import openai
 import os
+import threading
 
 from dotenv import find_dotenv, load_dotenv
 
@@ -15,8 +16,15 @@ openai.api_key = os.environ['OPENAI_API_KEY']
 
 model = ChatOpenAI(model="gpt-4o")
 
+# summarize once the messages since the last summary are over this many tokens
+SUMMARY_TOKEN_THRESHOLD = 400
+# summarize in the background after the reply instead of before it
+SUMMARIZE_AFTER_END = False
+
 class State(MessagesState):
     summary: str
+    # id of the last message the summary covers
+    summarized_until: str
 
 def call_model(state: State):
     
@@ -34,6 +42,20 @@ def call_model(state: State):
     response = model.invoke(messages)
     return {"messages": response}
 
+def unsummarized_messages(state: State):
+    """Return the messages added after the last message the summary already covers.
+    """
+    messages = state["messages"]
+    summarized_until = state.get("summarized_until")
+    for i, m in enumerate(messages):
+        if m.id == summarized_until:
+            return messages[i + 1:]
+    return messages
+
+def needs_summary(state: State):
+    # only the new messages are counted, so this check doesn't grow with the conversation
+    return model.get_num_tokens_from_messages(unsummarized_messages(state)) > SUMMARY_TOKEN_THRESHOLD
+
 def summarize_conversation(state: State):
     
     # we get any existing summary
@@ -47,25 +69,41 @@ def summarize_conversation(state: State):
     else:
         summary_message = """Create a summary of the conversation above:"""
 
-    messages = state["messages"] + [HumanMessage(content=summary_message)]
+    # the summary already covers everything before the new messages, so only those are sent
+    messages = unsummarized_messages(state) + [HumanMessage(content=summary_message)]
     response = model.invoke(messages)
     
     # delete all but the 2 most recent messages
     delete_messages = [RemoveMessage(id=m.id) for m in state["messages"][:-2]]
-    return {"summary": response.content, "messages": delete_messages}
+    return {"summary": response.content, "messages": delete_messages, "summarized_until": state["messages"][-1].id}
 
 def should_continue(state: State):
     """Return the next node to execute.
     """
-    messages = state["messages"]
     
-    # if there are more than six messages, then we summarize the conversation
-    if len(messages) > 6:
+    # if the messages since the last summary are over the token threshold, then we summarize them,
+    # unless the summary is left for after the reply (see summarize_after_end)
+    if not SUMMARIZE_AFTER_END and needs_summary(state):
         return "summarize_conversation"
     
     # otherwise we can just end
     return END
 
+def summarize_after_end(config):
+    """Summarize the thread in a background thread after the reply was returned.
+
+    The result is saved as if the summarize_conversation node had run. Join the returned thread
+    before the next turn on the same conversation thread.
+    """
+    def run():
+        state = graph.get_state(config).values
+        if needs_summary(state):
+            graph.update_state(config, summarize_conversation(state), as_node="summarize_conversation")
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
 graph = StateGraph(State)
 graph.add_node("conversation", call_model)
 graph.add_node(summarize_conversation)
@@ -0,0 +1,7 @@
+import os
+import sys
+
+
+# the scripts and the deployment app import their modules by file name, as they are run from their own directory
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "deployment")]
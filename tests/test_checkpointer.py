@@ -0,0 +1,195 @@
+import operator
+import time
+import weakref
+
+from typing import Annotated, TypedDict
+
+import pytest
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import END, MessagesState, StateGraph, START
+from langgraph.types import Send
+
+from checkpointer import BoundedMemorySaver, CoalescingSaver, _remove_spills, state_history
+
+
+REPLY = "Here is a reasonably long answer to your question. " * 20
+
+
+def chat_graph(checkpointer):
+    graph = StateGraph(MessagesState)
+    graph.add_node("chat", lambda state: {"messages": [AIMessage(content=REPLY)]})
+    graph.add_edge(START, "chat")
+    graph.add_edge("chat", END)
+    return graph.compile(checkpointer=checkpointer)
+
+
+def thread(i):
+    return {"configurable": {"thread_id": f"thread-{i}"}}
+
+
+def test_reading_spilled_threads_keeps_memory_under_max_bytes(tmp_path):
+    memory = BoundedMemorySaver(max_bytes=5000, spill_dir=str(tmp_path))
+    graph = chat_graph(memory)
+    for i in range(5):
+        for turn in range(3):
+            graph.invoke({"messages": [HumanMessage(content=f"question {turn} of thread {i}")]}, thread(i))
+    assert memory.spills >= 4
+
+    for i in range(5):
+        messages = graph.get_state(thread(i)).values["messages"]
+        assert [m.content for m in messages if m.type == "human"] == [f"question {turn} of thread {i}" for turn in range(3)]
+        # only the thread that was just read may stay over the cap, on its own
+        assert memory.resident_bytes <= memory.max_bytes or memory.resident_threads == 1
+    assert memory.restores >= 4
+
+
+
+def test_spill_files_do_not_outlive_the_process(tmp_path):
+    stale = tmp_path / ("0" * 64 + ".pkl")
+    stale.write_bytes(b"left by a process that crashed")
+    memory = BoundedMemorySaver(max_bytes=5000, spill_dir=str(tmp_path))
+    assert not stale.exists()
+
+    graph = chat_graph(memory)
+    for i in range(3):
+        graph.invoke({"messages": [HumanMessage(content="hi")]}, thread(i))
+    assert memory.spills and list(tmp_path.glob("*.pkl"))
+    # what atexit runs
+    _remove_spills(weakref.ref(memory))
+    assert not list(tmp_path.glob("*.pkl"))
+
+@pytest.mark.parametrize("keyframe_interval", [None, 1, 50])
+def test_update_that_only_changes_message_metadata_is_kept(keyframe_interval):
+    memory = BoundedMemorySaver(keyframe_interval=keyframe_interval)
+    graph = chat_graph(memory)
+    config = thread(0)
+    graph.invoke({"messages": [HumanMessage(content="hi", id="human-1")]}, config)
+    reply = graph.get_state(config).values["messages"][-1]
+
+    # same id and content, only the metadata fields differ
+    edited = AIMessage(
+        content=reply.content,
+        id=reply.id,
+        name="assistant",
+        additional_kwargs={"refusal": None},
+        response_metadata={"model_name": "gpt-4o"},
+        usage_metadata={"input_tokens": 1, "output_tokens": 2, "total_tokens": 3},
+    )
+    graph.update_state(config, {"messages": [edited]})
+    graph.invoke({"messages": [HumanMessage(content="again", id="human-2")]}, config)
+
+    messages = graph.get_state(config).values["messages"]
+    assert [m.id for m in messages[:2]] == ["human-1", reply.id]
+    assert messages[1].name == "assistant"
+    assert messages[1].additional_kwargs == {"refusal": None}
+    assert messages[1].response_metadata == {"model_name": "gpt-4o"}
+    assert messages[1].usage_metadata["total_tokens"] == 3
+    # the checkpoint before the edit still has the message as the model wrote it
+    before = [s for s in graph.get_state_history(config) if s.metadata["source"] == "loop" and s.metadata["step"] == 1][0]
+    assert before.values["messages"][1].name is None
+    assert before.values["messages"][1].response_metadata == {}
+
+
+def open_step(saver, i):
+    """Put a checkpoint for thread i and buffer one task write on it, as a running step does.
+    """
+    config = saver.put({"configurable": {"thread_id": f"thread-{i}", "checkpoint_ns": ""}}, empty_checkpoint(), {}, {})
+    saver.put_writes(config, [("messages", f"write of thread {i}")], f"task-{i}")
+    return config
+
+
+def saved_writes(saver, config):
+    return [value for _, _, value in saver.get_tuple(config).pending_writes]
+
+
+def test_reading_a_thread_only_saves_its_own_writes():
+    memory = MemorySaver()
+    saver = CoalescingSaver(memory)
+    first, second = open_step(saver, 0), open_step(saver, 1)
+
+    assert saved_writes(saver, first) == ["write of thread 0"]
+    assert saved_writes(memory, second) == []
+    assert saved_writes(saver, second) == ["write of thread 1"]
+
+
+def test_writes_of_a_step_that_never_ends_are_saved_after_max_delay():
+    memory = MemorySaver()
+    saver = CoalescingSaver(memory, max_delay=0.05)
+    config = open_step(saver, 0)
+    assert saved_writes(memory, config) == []
+
+    deadline = time.monotonic() + 5
+    while not saved_writes(memory, config) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert saved_writes(memory, config) == ["write of thread 0"]
+
+
+def test_failed_step_keeps_the_writes_of_finished_tasks():
+    def fails(state):
+        time.sleep(0.05)
+        raise ValueError("boom")
+
+    graph = StateGraph(MessagesState)
+    graph.add_node("finishes", lambda state: {"messages": [AIMessage(content="done")]})
+    graph.add_node("fails", fails)
+    graph.add_edge(START, "finishes")
+    graph.add_edge(START, "fails")
+    memory = MemorySaver()
+    graph = graph.compile(checkpointer=CoalescingSaver(memory, max_delay=60))
+
+    with pytest.raises(ValueError):
+        graph.invoke({"messages": [HumanMessage(content="hi")]}, thread(0))
+    # the wrapped saver has the finished task's write even though no checkpoint ended the step
+    writes = memory.get_tuple(thread(0)).pending_writes
+    assert {channel for _, channel, _ in writes} >= {"messages", "__error__"}
+
+
+class WithoutWritesMetadata(BoundedMemorySaver):
+    """Saves checkpoint metadata as LangGraph 1.x does, without the `writes` of the step.
+    """
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        return super().put(config, checkpoint, {k: v for k, v in metadata.items() if k != "writes"}, new_versions)
+
+
+class Jokes(TypedDict):
+    subjects: list
+    jokes: Annotated[list, operator.add]
+
+
+def send_graph(checkpointer):
+    graph = StateGraph(Jokes)
+    graph.add_node("plan", lambda state: {})
+    graph.add_node("joke", lambda state: {"jokes": [f"a joke about {state['subject']}"]})
+    graph.add_node("pick", lambda state: {})
+    graph.add_edge(START, "plan")
+    graph.add_conditional_edges("plan", lambda state: [Send("joke", {"subject": s}) for s in state["subjects"]], ["joke"])
+    graph.add_edge("joke", "pick")
+    graph.add_edge("pick", END)
+    return graph.compile(checkpointer=checkpointer)
+
+
+@pytest.mark.parametrize("saver", [BoundedMemorySaver, WithoutWritesMetadata])
+def test_state_history_filters_on_the_nodes_that_ran(saver):
+    graph = send_graph(saver())
+    config = thread(0)
+    graph.invoke({"subjects": ["cats", "dogs", "owls"], "jokes": []}, config)
+
+    assert [(h.step, h.writes) for h in state_history(graph, config, node="plan")] == [(1, ("plan",))]
+    assert [(h.step, h.writes) for h in state_history(graph, config, node="joke")] == [(2, ("joke",))]
+    assert [h.step for h in state_history(graph, config, node="pick")] == [3]
+
+
+@pytest.mark.parametrize("saver", [BoundedMemorySaver, WithoutWritesMetadata])
+def test_state_history_next_includes_pending_sends(saver):
+    graph = send_graph(saver())
+    config = thread(0)
+    graph.invoke({"subjects": ["cats", "dogs", "owls"], "jokes": []}, config)
+
+    expected = [(s.config["configurable"]["checkpoint_id"], s.next) for s in graph.get_state_history(config)]
+    assert [(h.config["configurable"]["checkpoint_id"], h.next) for h in state_history(graph, config)] == expected
+    assert ("joke", "joke", "joke") in [next for _, next in expected]
@@ -0,0 +1,45 @@
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.graph.message import add_messages
+
+from context import TokenCounter, window_messages
+
+
+def word_counter():
+    calls = []
+
+    def encode(text):
+        calls.append(text)
+        return text.split()
+
+    return TokenCounter(encode=encode), calls
+
+
+def test_each_message_is_tokenized_once():
+    counter, calls = word_counter()
+    messages = [HumanMessage(content="one two three", id="1"), AIMessage(content="four five", id="2")]
+    assert counter(messages) == counter(messages) == 5 + 2 * 4
+    assert calls == ["one two three", "four five"]
+
+
+def test_message_replaced_under_the_same_id_is_counted_again():
+    counter, _ = word_counter()
+    messages = add_messages([HumanMessage(content="hi", id="1")], [AIMessage(content="a long answer with many words", id="2")])
+    assert counter(messages) == 1 + 6 + 2 * 4
+
+    # a summary or update_state replaces the message, keeping its id
+    messages = add_messages(messages, [AIMessage(content="short", id="2")])
+    assert counter(messages) == 1 + 1 + 2 * 4
+    messages = add_messages(messages, [AIMessage(content="short", id="2", tool_calls=[{"name": "search", "args": {}, "id": "t"}])])
+    assert counter(messages) == 1 + 1 + 1 + 2 * 4
+
+
+def test_window_starts_on_a_human_turn_when_nothing_fits():
+    counter, _ = word_counter()
+    messages = [
+        HumanMessage(content="old question", id="1"),
+        AIMessage(content="old answer", id="2"),
+        HumanMessage(content="search something", id="3"),
+        AIMessage(content="", id="4", tool_calls=[{"name": "search", "args": {"query": "something"}, "id": "t"}]),
+        ToolMessage(content="many words of search results " * 20, tool_call_id="t", id="5"),
+    ]
+    assert [m.id for m in window_messages(messages, 10, counter)] == ["3", "4", "5"]
@@ -0,0 +1,59 @@
+import asyncio
+import contextvars
+import time
+
+import pytest
+
+from fan_out import HedgePolicy, as_completed_until, hedged
+
+
+def after(seconds, result):
+    async def call():
+        await asyncio.sleep(seconds)
+        if isinstance(result, Exception):
+            raise result
+        return result
+    return call
+
+
+def collect(calls, **kwargs):
+    async def run():
+        return [item async for item in as_completed_until(calls, **kwargs)]
+    return asyncio.run(run())
+
+
+def test_failed_call_is_left_out_and_the_others_are_kept():
+    calls = [after(0.01, ValueError("search failed")), after(0.02, "web"), after(0.03, "wikipedia")]
+    assert collect(calls, quorum=2) == [(1, "web"), (2, "wikipedia")]
+
+
+def test_results_are_kept_when_a_failure_makes_the_quorum_unreachable():
+    calls = [after(0.01, "web"), after(0.02, ValueError("search failed"))]
+    assert collect(calls, quorum=2) == [(0, "web")]
+
+
+def test_stops_at_quorum_or_deadline():
+    calls = [after(0.01, "fast"), after(0.02, "second"), after(5, "straggler")]
+    assert collect(calls, quorum=2) == [(0, "fast"), (1, "second")]
+    assert collect(calls, deadline=0.1) == [(0, "fast"), (1, "second")]
+
+
+def test_raises_when_every_call_fails():
+    with pytest.raises(ValueError):
+        collect([after(0.01, ValueError("first")), after(0.02, ValueError("second"))])
+
+
+def test_hedged_attempts_see_the_callers_context():
+    request = contextvars.ContextVar("request")
+    seen = []
+
+    def search(state):
+        time.sleep(0.05)
+        seen.append(request.get(None))
+        return {"context": [state["question"]]}
+
+    node = hedged(search, HedgePolicy(hedge_after=0.01, max_hedges=1))
+    request.set("request-1")
+    assert node({"question": "who is super junior"}) == {"context": ["who is super junior"]}
+    time.sleep(0.1)
+    assert seen == ["request-1", "request-1"]
@@ -0,0 +1,57 @@
+from datetime import datetime, timezone
+
+from langgraph.store.memory import InMemoryStore
+
+from indexed_store import IndexedInMemoryStore
+from memory import TODO_PAGE_SIZE, WriteStats, _read_pages, memory_namespaces, todos_due, write_documents
+
+
+def test_read_pages_starts_over_when_a_write_shifts_the_pages():
+    store = InMemoryStore()
+    namespace = memory_namespaces("general", "user")["todo"]
+    for i in range(2 * TODO_PAGE_SIZE + 10):
+        store.put(namespace, f"{i:04d}", {"task": f"task {i}"})
+    calls = []
+
+    def search(offset):
+        calls.append(offset)
+        if len(calls) == 2:
+            # a write between the first and second page, moving an item of the first page to the end
+            # like a store ordered by updated_at would
+            item = store.get(namespace, "0000")
+            store.delete(namespace, "0000")
+            store.put(namespace, "0000", item.value)
+        return store.search(namespace, limit=TODO_PAGE_SIZE, offset=offset)
+
+    todos = _read_pages(search)
+    keys = [item.key for item in todos]
+    assert sorted(keys) == sorted(f"{i:04d}" for i in range(2 * TODO_PAGE_SIZE + 10))
+    assert len(calls) > 3
+
+
+def test_todos_due_on_stores_with_and_without_a_deadline_index():
+    week_start = datetime(2025, 3, 3, tzinfo=timezone.utc)
+    week_end = datetime(2025, 3, 10, tzinfo=timezone.utc)
+    todos = {
+        "a": {"task": "a", "status": "not started", "deadline": "2025-03-05T00:00:00Z"},
+        "b": {"task": "b", "status": "archived", "deadline": "2025-03-04T00:00:00Z"},
+        "c": {"task": "c", "status": "in progress", "deadline": "2025-03-12T00:00:00Z"},
+        "d": {"task": "d", "status": "not started", "deadline": None},
+        "e": {"task": "e", "status": "done", "deadline": "2025-03-03T09:00:00"},
+    }
+    for store in (InMemoryStore(), IndexedInMemoryStore()):
+        for key, value in todos.items():
+            store.put(memory_namespaces("general", "user")["todo"], key, value)
+        assert [item.key for item in todos_due(store, "general", "user", week_start, week_end)] == ["e", "a"]
+
+
+def test_updates_that_write_nothing_are_not_counted_as_turns():
+    store = InMemoryStore()
+    namespace = memory_namespaces("general", "user")["todo"]
+    stats = WriteStats()
+    write_documents(store, namespace, [("a", {"task": "call mom"}), ("b", {"task": "book flights"})], stats)
+    write_documents(store, namespace, [], stats)
+    write_documents(store, namespace, [], stats)
+
+    assert (stats.turns, stats.skipped, stats.ops) == (1, 2, 2)
+    assert stats.ops_per_turn == 2.0
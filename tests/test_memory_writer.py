@@ -0,0 +1,25 @@
+import threading
+
+from memory_writer import MemoryWriter
+
+
+def test_jobs_of_other_threads_are_kept_and_same_thread_jobs_merge():
+    writer = MemoryWriter(max_workers=1)
+    started, release = threading.Event(), threading.Event()
+    ran = []
+
+    def blocking():
+        started.set()
+        release.wait()
+
+    writer.submit("user", "thread-0", "todo", blocking)
+    started.wait()
+    # queued while the user's first job runs
+    writer.submit("user", "thread-1", "todo", lambda: ran.append("thread-1 old"))
+    writer.submit("user", "thread-2", "todo", lambda: ran.append("thread-2"))
+    writer.submit("user", "thread-1", "todo", lambda: ran.append("thread-1 new"))
+    release.set()
+    assert writer.wait("user", timeout=5)
+    assert sorted(ran) == ["thread-1 new", "thread-2"]
+    assert writer.merged == 1
+    writer.shutdown()
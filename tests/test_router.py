@@ -0,0 +1,42 @@
+import pytest
+
+from router import NO_UPDATE, FastPathClassifier
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Remind me to call the plumber on Friday", "todo"),
+    ("Please add oat milk to my todo list.", "todo"),
+    ("Mark the dentist appointment as done", "todo"),
+    ("My name is Lance and I live in San Francisco", "user"),
+    ("I work as a nurse", "user"),
+    ("From now on, when you add a task include a deadline", "instructions"),
+    ("Thanks!", NO_UPDATE),
+    ("ok", NO_UPDATE),
+])
+def test_confident_messages_skip_the_model(text, expected):
+    assert FastPathClassifier().classify(text) == expected
+
+
+@pytest.mark.parametrize("text", [
+    # questions
+    "What do I need to do today?",
+    "Do I have to pay the bill?",
+    "Can you remind me to call mom?",
+    "my name is what?",
+    # statements that only look like updates
+    "I'm a bit lost",
+    "Call me when you are done",
+    "My friend said hi",
+    "I need to think about it",
+    "Don't remind me to call the plumber",
+    # mixed intents
+    "My name is Lance, remind me to book a flight",
+    "Remind me to call my boss",
+    # nothing to go on
+    "",
+    "Hmm",
+])
+def test_other_messages_fall_back_to_the_model(text):
+    classifier = FastPathClassifier()
+    assert classifier.classify(text) is None
+    assert classifier.fallbacks == 1
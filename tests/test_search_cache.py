@@ -0,0 +1,25 @@
+from search_cache import MemoryCache, cached, normalize_query
+
+
+def test_same_question_written_differently_gets_one_key():
+    assert normalize_query("Who is Super Junior?") == normalize_query("  who is  super junior ") == "who is super junior"
+    assert normalize_query("Ｗho is super junior!!") == "who is super junior"
+
+
+def test_punctuation_inside_the_query_is_kept():
+    keys = {normalize_query(q) for q in ["what is C++", "what is C#", "what is C"]}
+    assert len(keys) == 3
+    assert normalize_query("what is C++?") == "what is c++"
+
+
+def test_cached_node_searches_once_per_question():
+    calls = []
+
+    def search_web(state):
+        calls.append(state["question"])
+        return {"context": [f"results for {state['question']}"]}
+
+    node = cached(search_web, MemoryCache())
+    assert node({"question": "What is C++?"}) == node({"question": "what is c++"}) == {"context": ["results for What is C++?"]}
+    assert node({"question": "what is C#"}) == {"context": ["results for what is C#"]}
+    assert calls == ["What is C++?", "what is C#"]
@@ -0,0 +1,106 @@
+import sys
+
+from typing import Optional
+
+from langchain_core.messages import AIMessage, HumanMessage
+from pydantic import BaseModel
+
+import serializer
+from serializer import CompactSerializer
+
+
+class ToDo(BaseModel):
+    task: str
+    status: str = "not started"
+    time_to_complete: Optional[int] = None
+
+
+def replace_model(cls):
+    """Swap the module's ToDo for another version, as if the code changed between two runs.
+    """
+    setattr(sys.modules[__name__], "ToDo", cls)
+    serializer._load.cache_clear()
+
+
+def test_messages_and_models_round_trip():
+    serde = CompactSerializer()
+    value = {
+        "messages": [HumanMessage(content="hi", id="1"), AIMessage(content="hello", id="2", name="bot", response_metadata={"model": "m"})],
+        "todo": ToDo(task="call mom", time_to_complete=10),
+    }
+    assert serde.loads_typed(serde.dumps_typed(value)) == value
+
+
+def test_message_metadata_and_extra_fields_round_trip():
+    serde = CompactSerializer()
+    message = AIMessage(
+        content="",
+        id="3",
+        additional_kwargs={"refusal": None, "function_call": {"name": "search", "arguments": "{}"}},
+        response_metadata={"model_name": "gpt-4o", "finish_reason": "tool_calls", "logprobs": None},
+        tool_calls=[{"name": "search", "args": {"query": "todo"}, "id": "call-1"}],
+        usage_metadata={"input_tokens": 10, "output_tokens": 2, "total_tokens": 12},
+        custom="kept",
+    )
+    loaded = serde.loads_typed(serde.dumps_typed(message))
+    assert loaded.model_dump() == message.model_dump()
+    assert loaded.custom == "kept"
+
+
+class Note(BaseModel):
+    """Never encoded by this process, like a model stored by an earlier run.
+    """
+    text: str
+
+
+def stored(module, name, fields):
+    payload = serializer.ormsgpack.Ext(serializer.EXT_MODEL, serializer._pack([module, name, 0, fields]))
+    return "compact", serializer.ormsgpack.packb(payload)
+
+
+def test_only_allowed_or_encoded_models_are_loaded():
+    assert "this" not in sys.modules
+    # a tampered row naming any module imports nothing and loads as its fields
+    assert CompactSerializer().loads_typed(stored("this", "s", {"text": "hi"})) == {"text": "hi"}
+    assert "this" not in sys.modules
+    assert CompactSerializer().loads_typed(stored(__name__, "Note", {"text": "hi"})) == {"text": "hi"}
+    assert CompactSerializer(allowed_modules=[__name__]).loads_typed(stored(__name__, "Note", {"text": "hi"})) == Note(text="hi")
+    # allowed modules still only load pydantic models
+    assert CompactSerializer(allowed_modules=["os"]).loads_typed(stored("os", "system", {"command": "true"})) == {"command": "true"}
+
+
+def test_models_changed_since_they_were_stored_load_by_field_name():
+    serde = CompactSerializer()
+    original = ToDo
+    stored = serde.dumps_typed(ToDo(task="call mom", status="done", time_to_complete=10))
+    try:
+        class Reordered(BaseModel):
+            priority: int = 0
+            time_to_complete: Optional[float] = None
+            status: str = "not started"
+            task: str
+
+        Reordered.__qualname__ = Reordered.__name__ = "ToDo"
+        replace_model(Reordered)
+        loaded = serde.loads_typed(stored)
+        assert type(loaded) is Reordered
+        assert (loaded.task, loaded.status, loaded.priority, loaded.time_to_complete) == ("call mom", "done", 0, 10.0)
+
+        class Renamed(BaseModel):
+            title: str = ""
+            status: str = "not started"
+
+        Renamed.__qualname__ = Renamed.__name__ = "ToDo"
+        replace_model(Renamed)
+        loaded = serde.loads_typed(stored)
+        # a field the model no longer has is dropped instead of landing in another one
+        assert (loaded.title, loaded.status) == ("", "done")
+    finally:
+        replace_model(original)
+
+
+def test_first_positional_format_is_still_read():
+    payload = serializer.ormsgpack.Ext(serializer.EXT_MESSAGE_POSITIONAL, serializer._pack([0, {0: "hi", 5: "1"}]))
+    message = serializer._unpack(serializer.ormsgpack.packb(payload))
+    names = serializer._schema(HumanMessage)[0]
+    assert message.content == "hi" and getattr(message, names[5]) == "1"
@@ -0,0 +1,30 @@
+import sqlite3
+import time
+
+from langgraph.checkpoint.base import empty_checkpoint
+
+from sqlite_persistence import SqliteSaver
+
+
+def committed_writes(path):
+    # a second connection only sees what was committed
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT channel FROM writes ORDER BY channel").fetchall()
+
+
+def test_errors_commit_right_away_and_other_writes_within_the_delay(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite")
+    saver = SqliteSaver(path, max_commit_delay=0.2)
+    config = saver.put({"configurable": {"thread_id": "1", "checkpoint_ns": ""}}, empty_checkpoint(), {}, {})
+
+    saver.put_writes(config, [("answer", 42)], "task-1")
+    assert committed_writes(path) == []
+    time.sleep(0.5)
+    assert committed_writes(path) == [("answer",)]
+
+    saver.put_writes(config, [("__error__", ValueError("boom"))], "task-2")
+    assert committed_writes(path) == [("__error__",), ("answer",)]
+
+    saver.put_writes(config, [("question", "why")], "task-3")
+    saver.close()
+    assert committed_writes(path) == [("__error__",), ("answer",), ("question",)]
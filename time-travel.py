@@ -6,10 +6,11 @@ from dotenv import find_dotenv, load_dotenv
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_openai import ChatOpenAI
 
-from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import MessagesState, StateGraph, START
 from langgraph.prebuilt import ToolNode, tools_condition
 
+from checkpointer import BoundedMemorySaver, state_history
+
 
 _ = load_dotenv(find_dotenv())
 openai.api_key = os.environ['OPENAI_API_KEY']
@@ -53,7 +54,9 @@ graph.add_conditional_edges(
 )
 graph.add_edge("tools", "assistant")
 
-memory = MemorySaver()
+# replaying needs the whole history, so only the least recently used threads are evicted (to disk) past 64 MB,
+# and the messages of each checkpoint are stored as a delta of the previous one, with a full copy every 50
+memory = BoundedMemorySaver(max_bytes=64 * 1024 * 1024, spill_dir="checkpoints", keyframe_interval=50)
 graph = graph.compile(checkpointer=memory)
 
 thread = {"configurable": {"thread_id": "3"}}
@@ -68,13 +71,17 @@ for event in graph.stream(initial_input, thread, stream_mode="values"):
 # print(graph.get_state({'configurable': {'thread_id': '1'}}))
 
 ## we can also browse the state history of our agent:
-all_states = [s for s in graph.get_state_history(thread)]
+# all_states = [s for s in graph.get_state_history(thread)]
 # print(all_states)
+## but that decodes the full state of every checkpoint. state_history lists only checkpoint headers
+## (config, step, writes, next), newest first, and can filter them by step range and by the node that wrote them:
+# print(list(state_history(graph, thread)))
+# print(list(state_history(graph, thread, node="tools")))
 
 ## replaying
 
-# to_replay = all_states[-2] # fo example, we want to re-play from the second message
-# print(to_replay.values)
+# to_replay = next(state_history(graph, thread, steps=range(0, 1))) # fo example, we want to re-play from the second message (step 0)
+# print(graph.get_state(to_replay.config).values) # only the selected checkpoint is decoded
 ## the result: 
 ## {'messages': [HumanMessage(content='Adding 2 and 3', additional_kwargs={}, response_metadata={}, id='b138e68e-2657-4a3d-8d47-fe38697cd046')]} and
 
@@ -88,14 +95,15 @@ all_states = [s for s in graph.get_state_history(thread)]
 
 ## if we wantg to run from the same step, but with different input
 
-to_fork = all_states[-2]
-# print(to_fork.values)
+to_fork = next(state_history(graph, thread, steps=range(0, 1)))
+to_fork_values = graph.get_state(to_fork.config).values
+# print(to_fork_values)
 ## the result:
 ## {'messages': [HumanMessage(content='Adding 2 and 3', additional_kwargs={}, response_metadata={}, id='acec92fb-0702-437c-8c8c-cfc1e6131125')]} 
 
 fork_config = graph.update_state(
     to_fork.config,
-    {"messages": [HumanMessage(content='Add 5 and 3', id=to_fork.values["messages"][0].id)]},
+    {"messages": [HumanMessage(content='Add 5 and 3', id=to_fork_values["messages"][0].id)]},
 )
 for event in graph.stream(None, fork_config, stream_mode="values"):
     event['messages'][-1].pretty_print()
\ No newline at end of file